@@ -0,0 +1,126 @@
+#!/usr/bin/python
+
+# BSD LICENSE
+#
+# Copyright(c) 2010-2017 Intel Corporation. All rights reserved.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of Intel Corporation nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Relay of QEMU monitor (QMP) and guest agent (QGA) sockets of one VM, runs on
+host and talks with DTS by standard input and output.
+
+Usage: qmp_relay.py name=path [name=path ...]
+
+Each line "name message" read from input is sent to socket of name, socket is
+connected when the first line is sent to it, message can be empty for only
+connecting. Each line received from socket is written as "name message".
+When socket closed or can't be connected, "name {"relay-closed": reason}" is
+written. "relay {"ready": true}" is written after relay started.
+"""
+
+import os
+import sys
+import json
+import select
+import socket
+
+
+def write_line(name, message):
+    line = name.encode() + b' ' + message + b'\n'
+    while line:
+        line = line[os.write(1, line):]
+
+
+def main():
+    paths = dict(arg.split('=', 1) for arg in sys.argv[1:])
+    socks = {}
+    buffers = {}
+    pending = b''
+
+    def close(name, reason):
+        if name in socks:
+            socks.pop(name).close()
+        buffers.pop(name, None)
+        write_line(name, json.dumps({'relay-closed': reason}).encode())
+
+    write_line('relay', json.dumps({'ready': True}).encode())
+    while True:
+        readers = [0] + list(socks.values())
+        ready = select.select(readers, [], [])[0]
+
+        if 0 in ready:
+            data = os.read(0, 65536)
+            if not data:
+                break
+            pending += data
+            while b'\n' in pending:
+                line, pending = pending.split(b'\n', 1)
+                name, _, message = line.strip().partition(b' ')
+                name = name.decode()
+                if name not in paths:
+                    continue
+                if name not in socks:
+                    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    try:
+                        sock.connect(paths[name])
+                    except socket.error as e:
+                        sock.close()
+                        close(name, str(e))
+                        continue
+                    socks[name] = sock
+                    buffers[name] = b''
+                if not message:
+                    continue
+                try:
+                    socks[name].sendall(message + b'\n')
+                except socket.error as e:
+                    close(name, str(e))
+
+        for name, sock in list(socks.items()):
+            if sock not in ready:
+                continue
+            try:
+                data = sock.recv(65536)
+            except socket.error as e:
+                close(name, str(e))
+                continue
+            if not data:
+                close(name, 'closed by peer')
+                continue
+            buffers[name] += data
+            while b'\n' in buffers[name]:
+                line, buffers[name] = buffers[name].split(b'\n', 1)
+                # guest agent may send delimiter byte 0xff
+                line = line.strip().lstrip(b'\xff')
+                if line:
+                    write_line(name, line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,480 @@
+# BSD LICENSE
+#
+# Copyright(c) 2010-2017 Intel Corporation. All rights reserved.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of Intel Corporation nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Software packet generator based on AF_PACKET sockets, running on tester.
+
+Frames of pcap files are sent in batches by sendmmsg at configured rate of
+line speed. Port statistics are taken from kernel counters of interfaces,
+latency is measured by timestamp stamped at the tail of sampled frames.
+
+Usage: python afpacket_gen.py config.json
+    {"duration": 10, "latency": false,
+     "streams": [{"tx": "eth1", "rx": "eth2", "pcap": "a.pcap", "rate": 100}]}
+Result is printed in one line started with AFPKTGEN_RESULT.
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import fcntl
+import ctypes
+import ctypes.util
+import socket
+import struct
+import threading
+
+RESULT = "AFPKTGEN_RESULT: "
+
+ETH_P_ALL = 0x0003
+SOL_PACKET = 263
+PACKET_ADD_MEMBERSHIP = 1
+PACKET_MR_PROMISC = 1
+PACKET_OUTGOING = 4
+SIOCGSTAMP = 0x8906
+
+BATCH = 64
+# preamble, inter frame gap and fcs are not part of captured frame
+FRAME_OVERHEAD = 24
+# unknown link speed (like veth) is treated as 10G
+DEFAULT_SPEED = 10000
+# seconds allowed beyond rate limited time for sending counted frames
+COUNT_TIMEOUT_MARGIN = 5
+# seconds allowed for sending counted frames at unlimited rate
+COUNT_TIMEOUT = 30
+# give up after so many batches failed in a row with errors
+MAX_FAILED_BATCHES = 1000
+
+LATENCY_MAGIC = 0x44545354
+STAMP = struct.Struct('!IQ')
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+
+class msghdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(iovec)),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', msghdr),
+                ('msg_len', ctypes.c_uint)]
+
+
+def load_sendmmsg():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint,
+                         ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+SENDMMSG = load_sendmmsg()
+
+
+def read_pcap(filename):
+    """
+    Return all frames in pcap file.
+    """
+    frames = []
+    with open(filename, 'rb') as f:
+        header = f.read(24)
+        if len(header) < 24:
+            return frames
+        magic = struct.unpack('<I', header[:4])[0]
+        endian = '<' if magic in (0xa1b2c3d4, 0xa1b23c4d) else '>'
+        record = struct.Struct(endian + 'IIII')
+        while True:
+            rec_hdr = f.read(16)
+            if len(rec_hdr) < 16:
+                break
+            caplen = record.unpack(rec_hdr)[2]
+            frame = f.read(caplen)
+            if len(frame) < caplen:
+                break
+            frames.append(frame)
+    return frames
+
+
+def read_sysfs(intf, name):
+    with open('/sys/class/net/%s/%s' % (intf, name)) as f:
+        return f.read().strip()
+
+
+def read_counters(intf):
+    counters = {}
+    for name in ('tx_packets', 'tx_bytes', 'rx_packets', 'rx_bytes'):
+        counters[name] = int(read_sysfs(intf, 'statistics/' + name))
+    return counters
+
+
+def link_speed(intf):
+    """
+    Return link speed in Mbps.
+    """
+    try:
+        speed = int(read_sysfs(intf, 'speed'))
+    except (IOError, OSError, ValueError):
+        return DEFAULT_SPEED
+    return speed if speed > 0 else DEFAULT_SPEED
+
+
+def open_socket(intf, promisc=False):
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW,
+                         socket.htons(ETH_P_ALL))
+    sock.bind((intf, ETH_P_ALL))
+    if promisc:
+        # promiscuous mode is reverted when socket closed
+        ifindex = int(read_sysfs(intf, 'ifindex'))
+        mreq = struct.pack('iHH8s', ifindex, PACKET_MR_PROMISC, 0, b'')
+        sock.setsockopt(SOL_PACKET, PACKET_ADD_MEMBERSHIP, mreq)
+    return sock
+
+
+class BulkSender(object):
+
+    """
+    Send frames cyclically on one interface, each batch is sent by one
+    sendmmsg call.
+    """
+
+    def __init__(self, intf, frames, batch=BATCH, stamp=False):
+        self.intf = intf
+        self.frames = frames
+        self.batch = batch
+        self.stamp = stamp
+        self.sock = open_socket(intf)
+        self.fd = self.sock.fileno()
+        self.index = 0
+        self.sent = 0
+        self.sent_bytes = 0
+        self.errors = 0
+        self.last_error = None
+        self.elapsed = 0
+
+        # enough messages to send one batch from any frame, each message
+        # has its own buffer so that only one frame is stamped
+        count = len(frames) + batch
+        self.buffers = [ctypes.create_string_buffer(frames[i % len(frames)],
+                                                    len(frames[i % len(frames)]))
+                        for i in range(count)]
+        # bytes of frames before each message
+        self.offsets = [0]
+        for i in range(count):
+            self.offsets.append(self.offsets[-1] + len(frames[i % len(frames)]))
+        self.iovecs = (iovec * count)()
+        self.msgs = (mmsghdr * count)()
+        for i in range(count):
+            self.iovecs[i].iov_base = ctypes.addressof(self.buffers[i])
+            self.iovecs[i].iov_len = len(self.buffers[i])
+            self.msgs[i].msg_hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+            self.msgs[i].msg_hdr.msg_iovlen = 1
+
+    def stamp_frame(self, index):
+        """
+        Write tx timestamp at the tail of frame, return original tail.
+        """
+        frame = self.frames[index % len(self.frames)]
+        if len(frame) < 14 + STAMP.size:
+            return None
+        offset = len(frame) - STAMP.size
+        stamp = STAMP.pack(LATENCY_MAGIC, int(time.time() * 1e9))
+        ctypes.memmove(ctypes.addressof(self.buffers[index]) + offset,
+                       stamp, STAMP.size)
+        return frame[offset:]
+
+    def restore_frame(self, index, tail):
+        offset = len(self.buffers[index]) - STAMP.size
+        ctypes.memmove(ctypes.addressof(self.buffers[index]) + offset,
+                       tail, STAMP.size)
+
+    def send_batch(self, count):
+        """
+        Send count frames from current index, return number of sent frames.
+        """
+        tail = self.stamp_frame(self.index) if self.stamp else None
+
+        if SENDMMSG is not None:
+            address = ctypes.addressof(self.msgs) + \
+                self.index * ctypes.sizeof(mmsghdr)
+            sent = SENDMMSG(self.fd, address, count, 0)
+            if sent < 0:
+                err = ctypes.get_errno()
+                sent = 0
+                # tx queue full, try again later
+                if err not in (errno.ENOBUFS, errno.EAGAIN):
+                    self.errors += 1
+                    self.last_error = os.strerror(err)
+        else:
+            sent = 0
+            for i in range(count):
+                frame = self.frames[(self.index + i) % len(self.frames)]
+                try:
+                    self.sock.send(frame if i or tail is None else
+                                   self.buffers[self.index].raw)
+                except socket.error as e:
+                    if e.errno not in (errno.ENOBUFS, errno.EAGAIN):
+                        self.errors += 1
+                        self.last_error = str(e)
+                    break
+                sent += 1
+
+        if tail is not None:
+            self.restore_frame(self.index, tail)
+
+        self.sent_bytes += self.offsets[self.index + sent] - \
+            self.offsets[self.index]
+        self.sent += sent
+        self.index = (self.index + sent) % len(self.frames)
+        return sent
+
+    def run(self, pps=None, duration=None, count=None, stop=None):
+        """
+        Send frames at pps rate until duration passed, count frames sent or
+        stop event set. Unlimited rate when pps is None. Sending count frames
+        is given up when timed out or interface keeps failing, reported by
+        errors and last_error of stats.
+        """
+        start = time.time()
+        deadline = None
+        if count is not None and duration is None:
+            if pps:
+                deadline = float(count) / pps + COUNT_TIMEOUT_MARGIN
+            else:
+                deadline = COUNT_TIMEOUT
+        failed = 0
+        while stop is None or not stop.is_set():
+            now = time.time()
+            if duration is not None and now - start >= duration:
+                break
+            if count is not None and self.sent >= count:
+                break
+            if deadline is not None and now - start >= deadline:
+                timeout = "Timeout after %d of %d frames sent" % \
+                    (self.sent, count)
+                if self.last_error:
+                    timeout += ", %s" % self.last_error
+                self.errors += 1
+                self.last_error = timeout
+                break
+
+            burst = self.batch
+            if count is not None:
+                burst = min(burst, count - self.sent)
+            if pps:
+                allowed = int((now - start) * pps) - self.sent
+                if allowed <= 0:
+                    time.sleep(min(float(self.batch) / pps, 0.001))
+                    continue
+                burst = min(burst, allowed)
+
+            errors = self.errors
+            if self.send_batch(burst):
+                failed = 0
+                continue
+
+            # tx queue full is not an error
+            if self.errors > errors:
+                failed += 1
+                if failed >= MAX_FAILED_BATCHES:
+                    break
+            time.sleep(0.0001)
+        self.elapsed = time.time() - start
+
+    def stats(self):
+        elapsed = self.elapsed or 1e-9
+        return {'sent': self.sent,
+                'sent_bytes': self.sent_bytes,
+                'errors': self.errors,
+                'last_error': self.last_error,
+                'elapsed': self.elapsed,
+                'pps': self.sent / elapsed,
+                'bps': self.sent_bytes * 8 / elapsed}
+
+    def close(self):
+        self.sock.close()
+
+
+class LatencyReceiver(threading.Thread):
+
+    """
+    Receive frames on interface in promiscuous mode, latency is calculated
+    from stamped frames by kernel receive timestamp.
+    """
+
+    def __init__(self, intf, latency=False):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.intf = intf
+        self.latency = latency
+        self.sock = open_socket(intf, promisc=True)
+        self.sock.settimeout(0.1)
+        self.stop = threading.Event()
+        self.samples = []
+
+    def run(self):
+        if not self.latency:
+            self.stop.wait()
+            return
+
+        while not self.stop.is_set():
+            try:
+                frame, address = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            if address[2] == PACKET_OUTGOING or len(frame) < STAMP.size:
+                continue
+            magic, tx_time = STAMP.unpack(frame[-STAMP.size:])
+            if magic != LATENCY_MAGIC:
+                continue
+            stamp = fcntl.ioctl(self.sock.fileno(), SIOCGSTAMP, b'\0' * 16)
+            sec, usec = struct.unpack('@ll', stamp)
+            self.samples.append(sec * 1000000000 + usec * 1000 - tx_time)
+
+    def summary(self):
+        """
+        Return latency statistics in nanoseconds with log2 histogram.
+        """
+        if not self.samples:
+            return None
+
+        samples = sorted(self.samples)
+        count = len(samples)
+        histogram = {}
+        for sample in samples:
+            bound = 1000
+            while sample > bound:
+                bound *= 2
+            histogram[bound] = histogram.get(bound, 0) + 1
+        return {'count': count,
+                'min': samples[0],
+                'max': samples[-1],
+                'average': sum(samples) / count,
+                'p50': samples[(count - 1) // 2],
+                'p99': samples[min(count - 1, int(count * 0.99))],
+                'histogram': sorted(histogram.items())}
+
+    def close(self):
+        self.stop.set()
+        self.join()
+        self.sock.close()
+
+
+def main():
+    with open(sys.argv[1]) as f:
+        config = json.load(f)
+    duration = config.get('duration', 10)
+    latency = config.get('latency', False)
+
+    tx_frames = {}
+    tx_rates = {}
+    rx_intfs = []
+    for stream in config['streams']:
+        frames = read_pcap(stream['pcap'])
+        if not frames:
+            raise SystemExit("No frame in %s" % stream['pcap'])
+        tx_frames.setdefault(stream['tx'], []).extend(frames)
+        tx_rates[stream['tx']] = stream.get('rate', 100)
+        if stream['rx'] not in rx_intfs:
+            rx_intfs.append(stream['rx'])
+
+    receivers = [LatencyReceiver(intf, latency) for intf in rx_intfs]
+    senders = []
+    for intf, frames in tx_frames.items():
+        senders.append(BulkSender(intf, frames, stamp=latency))
+
+    intfs = set(tx_frames.keys()) | set(rx_intfs)
+    before = dict((intf, read_counters(intf)) for intf in intfs)
+
+    for receiver in receivers:
+        receiver.start()
+
+    threads = []
+    for sender in senders:
+        rate = tx_rates[sender.intf]
+        pps = None
+        if rate < 100:
+            frame_len = float(sum(len(f) for f in sender.frames)) / \
+                len(sender.frames)
+            pps = link_speed(sender.intf) * 1e6 * rate / 100 / \
+                ((frame_len + FRAME_OVERHEAD) * 8)
+        thread = threading.Thread(target=sender.run,
+                                  kwargs={'pps': pps, 'duration': duration})
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    start = time.time()
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(1)
+    elapsed = time.time() - start
+    # wait for frames in flight
+    time.sleep(0.5)
+
+    after = dict((intf, read_counters(intf)) for intf in intfs)
+    for receiver in receivers:
+        receiver.close()
+    for sender in senders:
+        sender.close()
+
+    ports = {}
+    for intf in intfs:
+        port = dict((name, after[intf][name] - before[intf][name])
+                    for name in after[intf])
+        port['tx_pps'] = port['tx_packets'] / elapsed
+        port['tx_bps'] = port['tx_bytes'] * 8 / elapsed
+        port['rx_pps'] = port['rx_packets'] / elapsed
+        port['rx_bps'] = port['rx_bytes'] * 8 / elapsed
+        ports[intf] = port
+
+    result = {'duration': elapsed,
+              'ports': ports,
+              'senders': dict((s.intf, s.stats()) for s in senders),
+              'latency': dict((r.intf, r.summary()) for r in receivers)}
+    sys.stdout.write(RESULT + json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# BSD LICENSE
+#
+# Copyright(c) 2010-2017 Intel Corporation. All rights reserved.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of Intel Corporation nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Long-lived scapy interpreter on tester. Batches of scapy commands are read
+from stdin as one json line and the output of each command is written back
+as one json line, so that scapy is only loaded once.
+
+Request:  {"cmds": ["sendp(...)", ...]}
+          {"exit": true}
+Response: SCAPY_RESULT: [{"command": .., "output": .., "error": ..}, ...]
+"""
+
+import os
+import sys
+import json
+import code
+import termios
+import traceback
+from StringIO import StringIO
+
+PROMPT = "SCAPY_WORKER> "
+RESULT = "SCAPY_RESULT: "
+
+
+class WorkerConsole(code.InteractiveConsole):
+
+    """
+    Interactive console which keeps error messages apart from output.
+    """
+
+    def __init__(self, namespace):
+        code.InteractiveConsole.__init__(self, namespace)
+        self.error = ""
+
+    def write(self, data):
+        self.error += data
+
+
+def run_command(console, cmd):
+    """
+    Run one command in console, return (more, output, error).
+    """
+    output = StringIO()
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = output
+    console.error = ""
+    more = False
+    try:
+        more = console.push(cmd)
+    except SystemExit:
+        # exit() only finishes the batch, interpreter keeps running
+        console.resetbuffer()
+    except Exception:
+        console.error += traceback.format_exc()
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+    return more, output.getvalue(), console.error
+
+
+def run_batch(console, cmds):
+    results = []
+    for cmd in cmds:
+        more, output, error = run_command(console, cmd)
+        results.append({"command": cmd, "output": output, "error": error})
+
+    # close unfinished block like original interactive session
+    if more:
+        more, output, error = run_command(console, "")
+        results[-1]["output"] += output
+        results[-1]["error"] += error
+
+    return results
+
+
+def set_raw_input(fd):
+    """
+    Disable echo and line buffering of tty, long command batch will not be
+    truncated by line size limitation of tty.
+    """
+    try:
+        saved = termios.tcgetattr(fd)
+    except termios.error:
+        return None
+
+    attrs = termios.tcgetattr(fd)
+    attrs[3] &= ~(termios.ECHO | termios.ICANON)
+    attrs[6][termios.VMIN] = 1
+    attrs[6][termios.VTIME] = 0
+    termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    return saved
+
+
+def main():
+    sys.path.insert(0, os.getcwd())
+    namespace = {"__name__": "__console__"}
+    exec "import os, sys, time, subprocess" in namespace
+    exec "from scapy.all import *" in namespace
+    exec "conf.color_theme = NoTheme()" in namespace
+    console = WorkerConsole(namespace)
+
+    fd = sys.stdin.fileno()
+    saved = set_raw_input(fd)
+    try:
+        while True:
+            sys.stdout.write(PROMPT)
+            sys.stdout.flush()
+            line = sys.stdin.readline()
+            if not line:
+                break
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                request = json.loads(line)
+            except ValueError:
+                results = [{"command": line, "output": "",
+                            "error": "Invalid request"}]
+            else:
+                if request.get("exit"):
+                    break
+                results = run_batch(console, request.get("cmds", []))
+
+            sys.stdout.write(RESULT + json.dumps(results) + "\n")
+            sys.stdout.flush()
+    finally:
+        if saved is not None:
+            termios.tcsetattr(fd, termios.TCSANOW, saved)
+
+
+if __name__ == "__main__":
+    main()
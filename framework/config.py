@@ -36,7 +36,7 @@ Generic port and crbs configuration file load function
 import re
 import ConfigParser  # config parse module
 import argparse      # prase arguments module
-from settings import IXIA
+from settings import IXIA, SOFT_PKTGEN
 from exception import ConfigParseException, VirtConfigParseException
 
 PORTCONF = "conf/ports.cfg"
@@ -189,7 +189,7 @@ class PortConf(UserConf):
 class CrbsConf(UserConf):
     DEF_CRB = {'IP': '', 'board': 'default', 'user': '',
                'pass': '', 'tester IP': '', 'tester pass': '',
-               IXIA: None, 'memory channels': 4,
+               IXIA: None, SOFT_PKTGEN: 'pktgen', 'memory channels': 4,
                'bypass core0': True}
 
     def __init__(self, crbs_conf=CRBCONF):
@@ -230,6 +230,8 @@ class CrbsConf(UserConf):
                     crb['tester pass'] = value
                 elif key == 'ixia_group':
                     crb[IXIA] = value
+                elif key == 'soft_pktgen':
+                    crb[SOFT_PKTGEN] = value
                 elif key == 'channels':
                     crb['memory channels'] = int(value)
                 elif key == 'bypass_core0':
@@ -32,14 +32,24 @@
 import time
 import re
 import os
+import json
+import threading
 from settings import TIMEOUT, IXIA
 from ssh_connection import SSHConnection
+from session_pool import SessionPool
 from logger import getLogger
+from utils import wait_until
 
 """
 CRB (customer reference board) basic functions and handlers
 """
 
+"""
+Script collect all ethernet pci devices' information on Linux, each device
+will be output as one line of json object.
+"""
+PCI_SCAN_SCRIPT = r'''for d in /sys/bus/pci/devices/*; do case $(cat $d/class) in 0x0200*) ;; *) continue ;; esac; drv=; [ -e $d/driver ] && drv=$(basename $(readlink $d/driver)); intfs=; macs=; for n in $d/net/* $d/virtio*/net/*; do [ -e $n/address ] || continue; intfs="$intfs\"${n##*/}\","; macs="$macs\"${n##*/}\": \"$(cat $n/address)\","; done; vfs=; for v in $d/virtfn*; do [ -e $v ] && vfs="$vfs\"$(basename $(readlink $v))\","; done; speed=$(cat $d/net/*/speed 2>/dev/null | head -1); echo "{\"pci\": \"${d##*/}\", \"vendor\": \"$(cat $d/vendor)\", \"device\": \"$(cat $d/device)\", \"driver\": \"$drv\", \"numa\": \"$(cat $d/numa_node 2>/dev/null)\", \"speed\": \"$speed\", \"intfs\": [${intfs%,}], \"macs\": {${macs%,}}, \"vfs\": [${vfs%,}]}"; done'''
+
 
 class Crb(object):
 
@@ -56,6 +66,8 @@ class Crb(object):
         self.serializer = serializer
         self.ports_info = None
         self.sessions = []
+        # bulk scanned pci devices information, only valid in discovery
+        self.pci_devices_detail = {}
         self.stage = 'pre-init'
         self.name = name
 
@@ -68,6 +80,10 @@ class Crb(object):
             name + '_alt',
             self.get_password())
         self.alt_session.init_log(self.logger)
+        # sessions for running commands concurrently, login when required
+        self.session_pool = SessionPool(self)
+        # (description, waited seconds, satisfied) of each wait_until
+        self.wait_records = []
 
     def send_expect(self, cmds, expected, timeout=TIMEOUT,
                     alt_session=False, verify=False):
@@ -83,6 +99,53 @@ class Crb(object):
 
         return self.session.send_expect(cmds, expected, timeout, verify)
 
+    def run_parallel(self, cmds, expected="# ", timeout=TIMEOUT, verify=False):
+        """
+        Run independent commands concurrently by sessions in pool. Return
+        output list in the same order as commands. If any command raised
+        exception, the first one will be raised after all commands finished.
+        """
+        outputs = [None] * len(cmds)
+        errors = []
+        lock = threading.Lock()
+        todo = list(enumerate(cmds))
+
+        def worker():
+            while True:
+                with lock:
+                    if not todo:
+                        return
+                    index, cmd = todo.pop(0)
+                try:
+                    session = self.session_pool.acquire()
+                except Exception as e:
+                    with lock:
+                        errors.append((index, e))
+                    continue
+                try:
+                    outputs[index] = session.send_expect(cmd, expected,
+                                                         timeout, verify)
+                except Exception as e:
+                    with lock:
+                        errors.append((index, e))
+                finally:
+                    self.session_pool.release(session)
+
+        workers = []
+        for _ in range(min(len(cmds), self.session_pool.size)):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+            workers.append(thread)
+        for thread in workers:
+            thread.join()
+
+        if errors:
+            errors.sort(key=lambda e: e[0])
+            raise errors[0][1]
+
+        return outputs
+
     def create_session(self, name=""):
         """
         Create new session for addtional useage. This session will not enable log.
@@ -98,12 +161,12 @@ class Crb(object):
         """
         Destroy addtional session.
         """
-        for save_session in self.sessions:
+        for save_session in self.sessions[:]:
             if save_session == session:
                 save_session.close()
                 logger = getLogger(save_session.name)
                 logger.logger_exit()
-            self.sessions.remove(save_session)
+                self.sessions.remove(save_session)
 
     def reconnect_session(self, alt_session=False):
         """
@@ -146,6 +209,76 @@ class Crb(object):
         """
         return self.session.get_session_before(timeout)
 
+    def wait_until(self, predicate, timeout=TIMEOUT, desc="condition",
+                   interval=0.1):
+        """
+        Poll predicate with exponential backoff until it returns true value,
+        return the last value. Seconds actually waited will be logged and
+        recorded, timeout is not an error here.
+        """
+        value, waited = wait_until(predicate, timeout, interval)
+        self.wait_records.append((desc, waited, bool(value)))
+        if value:
+            self.logger.debug("Waited %.2fs for %s" % (waited, desc))
+        else:
+            self.logger.warning("Timeout %.2fs waiting for %s" %
+                                (waited, desc))
+        return value
+
+    def wait_for_output(self, pattern, timeout=TIMEOUT):
+        """
+        Read session output until it matches pattern. Return the output or
+        None when timeout.
+        """
+        output = []
+
+        def matched():
+            output.append(self.get_session_output(timeout=0.1))
+            return re.search(pattern, ''.join(output))
+
+        if self.wait_until(matched, timeout, "output %s" % pattern):
+            return ''.join(output)
+        return None
+
+    def get_links_status(self, intfs):
+        """
+        Get kernel link status of interfaces, each status is up or down.
+        """
+        get_links_status = getattr(
+            self, 'get_links_status_%s' % self.get_os_type())
+        return get_links_status(intfs)
+
+    def get_links_status_linux(self, intfs):
+        out = self.send_expect("cat %s" % ' '.join(
+            "/sys/class/net/%s/operstate" % intf for intf in intfs),
+            "# ", alt_session=True)
+        states = out.split()
+        if len(states) != len(intfs):
+            return ['down'] * len(intfs)
+        # virtual interfaces may report unknown state when running
+        return ['up' if state in ('up', 'unknown') else 'down'
+                for state in states]
+
+    def get_links_status_freebsd(self, intfs):
+        status = []
+        for intf in intfs:
+            out = self.send_expect("ifconfig %s | grep status" % intf, "# ",
+                                   alt_session=True)
+            status.append('up' if 'active' in out else 'down')
+        return status
+
+    def wait_link_status(self, intfs, status='up', timeout=10):
+        """
+        Wait until kernel link status of all interfaces changed to status.
+        """
+        if not isinstance(intfs, list):
+            intfs = [intfs]
+        if not intfs:
+            return True
+        return self.wait_until(
+            lambda: all(s == status for s in self.get_links_status(intfs)),
+            timeout, "link %s of %s" % (status, ','.join(intfs)))
+
     def set_test_types(self, func_tests, perf_tests):
         """
         Enable or disable function/performance test.
@@ -261,21 +394,17 @@ class Crb(object):
         """
         Look for the NIC's information (PCI Id and card type).
         """
-        out = self.send_expect(
-            "lspci -Dnn | grep -i eth", "# ", alt_session=True)
-        rexp = r"([\da-f]{4}:[\da-f]{2}:[\da-f]{2}.\d{1}) .*Eth.*?ernet .*?([\da-f]{4}:[\da-f]{4})"
-        pattern = re.compile(rexp)
-        match = pattern.findall(out)
+        details = self.scan_pci_devices_detail_linux()
         self.pci_devices_info = []
-        for i in range(len(match)):
+        for pci in sorted(details.keys()):
+            card_type = details[pci]['type']
             #check if device is cavium and check its linkspeed, append only if it is 10G
-            if "177d:" in match[i][1]:
+            if "177d:" in card_type:
                 linkspeed = "10000"
-                nic_linkspeed = self.send_command("cat /sys/bus/pci/devices/%s/net/*/speed" % match[i][0])
-                if nic_linkspeed == linkspeed:
-                    self.pci_devices_info.append((match[i][0], match[i][1]))
+                if details[pci]['speed'] == linkspeed:
+                    self.pci_devices_info.append((pci, card_type))
             else:
-                self.pci_devices_info.append((match[i][0], match[i][1]))
+                self.pci_devices_info.append((pci, card_type))
 
     def pci_devices_information_uncached_freebsd(self):
         """
@@ -291,6 +420,72 @@ class Crb(object):
             card_type = "8086:%s" % match[i][1]
             self.pci_devices_info.append((match[i][0], card_type))
 
+    def scan_pci_devices_detail(self):
+        """
+        Collect information of all ethernet pci devices in one round trip.
+        Until cleared, the result will be used for device driver, pci id,
+        numa and NetDevice initialization instead of reading sysfs one by one.
+        """
+        scan_pci_devices_detail = getattr(
+            self, 'scan_pci_devices_detail_%s' % self.get_os_type())
+        self.pci_devices_detail = scan_pci_devices_detail()
+        return self.pci_devices_detail
+
+    def scan_pci_devices_detail_linux(self):
+        """
+        Run pci scan script on Linux and return devices information keyed by
+        pci address.
+        """
+        out = self.send_expect(PCI_SCAN_SCRIPT, "# ", 30, alt_session=True)
+        details = {}
+        for line in out.splitlines():
+            line = line.strip()
+            if not line.startswith('{'):
+                continue
+            try:
+                detail = json.loads(line)
+            except ValueError:
+                self.logger.warning("Unexpected pci scan output: %s" % line)
+                continue
+
+            try:
+                numa = int(detail['numa'])
+            except ValueError:
+                numa = -1
+
+            pci = str(detail['pci'])
+            details[pci] = {
+                'pci': pci,
+                'type': str("%s:%s" % (detail['vendor'][2:], detail['device'][2:])),
+                'driver': str(detail['driver']),
+                'numa': numa,
+                'speed': str(detail['speed']),
+                'intfs': [str(intf) for intf in detail['intfs']],
+                'macs': dict((str(intf), str(mac))
+                             for intf, mac in detail['macs'].items()),
+                'vfs': [str(vf) for vf in detail['vfs']]}
+
+        return details
+
+    def scan_pci_devices_detail_freebsd(self):
+        """
+        Bulk scan not supported on Freebsd, devices will be scanned one by one.
+        """
+        return {}
+
+    def clear_pci_devices_detail(self):
+        """
+        Drop bulk scanned information when devices status may be changed.
+        """
+        self.pci_devices_detail = {}
+
+    def get_pci_dev_detail(self, pci):
+        """
+        Return bulk scanned information of specified pci device, None if not
+        available.
+        """
+        return self.pci_devices_detail.get(pci)
+
     def get_pci_dev_driver(self, domain_id, bus_id, devfun_id):
         """
         Get the driver of specified pci device.
@@ -303,6 +498,10 @@ class Crb(object):
         """
         Get the driver of specified pci device on linux.
         """
+        detail = self.get_pci_dev_detail('%s:%s:%s' % (domain_id, bus_id, devfun_id))
+        if detail is not None:
+            return detail['driver'] or None
+
         out = self.send_expect("cat /sys/bus/pci/devices/%s\:%s\:%s/uevent" %
                                (domain_id, bus_id, devfun_id), "# ", alt_session=True)
         rexp = r"DRIVER=(.+?)\r"
@@ -330,6 +529,10 @@ class Crb(object):
         """
         Get the pci id of specified pci device on linux.
         """
+        detail = self.get_pci_dev_detail('%s:%s:%s' % (domain_id, bus_id, devfun_id))
+        if detail is not None:
+            return detail['type']
+
         out = self.send_expect("cat /sys/bus/pci/devices/%s\:%s\:%s/uevent" %
                                (domain_id, bus_id, devfun_id), "# ", alt_session=True)
         rexp = r"PCI_ID=(.+)"
@@ -351,6 +554,10 @@ class Crb(object):
         """
         Get numa number of specified pci device on Linux.
         """
+        detail = self.get_pci_dev_detail('%s:%s:%s' % (domain_id, bus_id, devfun_id))
+        if detail is not None:
+            return detail['numa']
+
         numa = self.send_expect(
             "cat /sys/bus/pci/devices/%s\:%s\:%s/numa_node" %
             (domain_id, bus_id, devfun_id), "# ", alt_session=True)
@@ -446,6 +653,7 @@ class Crb(object):
         """
         self.session.close()
         self.alt_session.close()
+        self.session_pool.close()
 
     def get_os_type(self):
         """
@@ -28,6 +28,7 @@ import signal
 import code
 import time
 import imp
+import threading
 from settings import load_global_setting, DEBUG_SETTING
 from utils import get_subclasses, copy_instance_attr
 
@@ -159,6 +160,13 @@ def keyboard_handle(signum, frame):
     debug_cmd = ''
 
 
+def in_main_thread():
+    """
+    Check whether current thread is the main thread.
+    """
+    return isinstance(threading.current_thread(), threading._MainThread)
+
+
 def ignore_keyintr():
     """
     Temporary disable interrupt handler.
@@ -166,6 +174,10 @@ def ignore_keyintr():
     if load_global_setting(DEBUG_SETTING) != 'yes':
         return
 
+    # signal handler can only be changed in main thread
+    if not in_main_thread():
+        return
+
     global debug_cmd
     signal.siginterrupt(signal.SIGINT, True)
     # if there's waiting request, first handler it
@@ -182,4 +194,7 @@ def aware_keyintr():
     if load_global_setting(DEBUG_SETTING) != 'yes':
         return
 
+    if not in_main_thread():
+        return
+
     return signal.signal(signal.SIGINT, keyboard_handle)
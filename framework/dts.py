@@ -40,6 +40,7 @@ import json         # json format
 import signal       # signal module for debug mode
 import time         # time module for unique output folder
 import copy         # copy module for duplicate variable
+import threading    # concurrent crbs initialization
 
 import rst          # rst file support
 import sys          # system module
@@ -50,14 +51,18 @@ from serializer import Serializer
 from test_case import TestCase
 from test_result import Result
 from stats_reporter import StatsReporter
+from profiler import TimingReporter
+from scheduler import SuiteScheduler
+from journal import RunJournal
 from excel_reporter import ExcelReporter
 from exception import TimeoutException, ConfigParseException, VerifyFailure
+from exception import CrbInitAbortException
 from logger import getLogger
 import logger
 import debugger
 from config import CrbsConf
 from checkCase import parse_file, check_case_skip, check_case_support
-from utils import get_subclasses, copy_instance_attr
+from utils import get_subclasses, copy_instance_attr, run_concurrently
 import sys
 reload(sys)
 sys.setdefaultencoding('UTF8')
@@ -68,6 +73,20 @@ result = None
 excel_report = None
 stats_report = None
 log_handler = None
+journal = None
+# results of DUT/tester pairs running concurrently
+pair_results = []
+results_lock = threading.Lock()
+# dts logger of DUT/tester pair running in current thread
+pair_log = threading.local()
+
+
+def dts_logger():
+    """
+    Return dts logger of DUT/tester pair running in current thread, global
+    dts logger when not running pairs concurrently.
+    """
+    return getattr(pair_log, 'handler', None) or log_handler
 
 
 def dts_parse_param(config, section):
@@ -190,6 +209,7 @@ def dts_run_commands(crb, dts_commands):
     """
     Run dts input commands
     """
+    log_handler = dts_logger()
     for dts_command in dts_commands:
         command = dts_command['command']
         if crb.NAME == dts_command['host']:
@@ -205,6 +225,7 @@ def get_project_obj(project_name, super_class, crbInst, serializer):
     """
     Load project module and return crb instance.
     """
+    log_handler = dts_logger()
     project_obj = None
     PROJECT_MODULE_PREFIX = 'project_'
     try:
@@ -258,25 +279,65 @@ def dts_log_execution(duts, tester, log_handler):
         pass
 
 
+class CrbsBarrier(object):
+
+    """
+    Barrier for crbs initialized concurrently. All crbs will wait until the
+    others arrived, failed crb should abort the barrier for waking up others.
+    """
+
+    def __init__(self, parties):
+        self.parties = parties
+        self.arrived = 0
+        self.aborted = False
+        self.cond = threading.Condition()
+        # serialize the steps after barrier which touch shared tester
+        self.lock = threading.RLock()
+
+    def wait(self):
+        with self.cond:
+            self.arrived += 1
+            self.cond.notify_all()
+            while self.arrived < self.parties and not self.aborted:
+                self.cond.wait(1)
+            if self.aborted:
+                raise CrbInitAbortException()
+
+    def abort(self):
+        with self.cond:
+            self.aborted = True
+            self.cond.notify_all()
+
+
 def dts_crbs_init(crbInsts, skip_setup, read_cache, project, base_dir, serializer, virttype):
     """
     Create dts dut/tester instance and initialize them.
     """
-    duts = []
-
+    log_handler = dts_logger()
     serializer.set_serialized_filename(settings.FOLDERS['Output'] +
                                        '/.%s.cache' % crbInsts[0]['IP'])
     serializer.load_from_file()
 
+    crbs = []
     testInst = copy.copy(crbInsts[0])
     testInst['My IP'] = crbInsts[0]['tester IP']
-    tester = get_project_obj(project, Tester, testInst, serializer)
+    crbs.append((Tester, testInst))
 
     for crbInst in crbInsts:
         dutInst = copy.copy(crbInst)
         dutInst['My IP'] = crbInst['IP']
-        dutobj = get_project_obj(project, Dut, dutInst, serializer)
-        duts.append(dutobj)
+        crbs.append((Dut, dutInst))
+
+    # login all crbs concurrently
+    results = run_concurrently(
+        [lambda crb=crb: get_project_obj(project, crb[0], crb[1], serializer)
+         for crb in crbs])
+    for obj, exc_info in results:
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    tester = results[0][0]
+    duts = [obj for obj, _ in results[1:]]
 
     dts_log_execution(duts, tester, log_handler)
 
@@ -307,10 +368,28 @@ def dts_crbs_exit(duts, tester):
     tester.crb_exit()
 
 
-def dts_run_prerequisties(duts, tester, pkgName, patch, dts_commands, serializer):
+def dts_prerequisties_concurrent(duts, tester):
+    """
+    Check whether tester and duts can be initialized concurrently.
+    """
+    # dut and tester on the same machine share the same ports
+    for dutobj in duts:
+        if dutobj.crb['IP'] == dutobj.crb['tester IP']:
+            return False
+
+    return True
+
+
+def dts_run_prerequisties(duts, tester, pkgName, patch, dts_commands, serializer, result):
     """
     Run dts prerequisties function.
     """
+    log_handler = dts_logger()
+    if dts_prerequisties_concurrent(duts, tester):
+        return dts_run_prerequisties_concurrent(duts, tester, pkgName, patch,
+                                                dts_commands, serializer,
+                                                result)
+
     try:
         dts_run_commands(tester, dts_commands)
         tester.prerequisites()
@@ -338,10 +417,77 @@ def dts_run_prerequisties(duts, tester, pkgName, patch, dts_commands, serializer
         return False
 
 
-def dts_run_target(duts, tester, targets, test_suites):
+def dts_run_prerequisties_concurrent(duts, tester, pkgName, patch, dts_commands, serializer, result):
+    """
+    Run tester and duts prerequisties functions concurrently. Package
+    preparation and ports scan are executed in parallel, network topology
+    detection will wait for all crbs then run one dut by one.
+    """
+    log_handler = dts_logger()
+    barrier = CrbsBarrier(len(duts) + 1)
+
+    def tester_prerequisites():
+        try:
+            dts_run_commands(tester, dts_commands)
+            tester.prerequisites()
+            dts_run_commands(tester, dts_commands)
+            # enable tester ports ipv6 once for all duts
+            duts[0].enable_tester_ipv6()
+        except Exception:
+            barrier.abort()
+            raise
+        barrier.wait()
+
+    def dut_prerequisites(dutobj):
+        dutobj.prerequisites_barrier = barrier
+        try:
+            dutobj.set_package(pkgName, patch)
+            dutobj.prerequisites()
+            dts_run_commands(dutobj, dts_commands)
+        except Exception:
+            barrier.abort()
+            raise
+        finally:
+            dutobj.prerequisites_barrier = None
+
+    funcs = [tester_prerequisites]
+    funcs += [lambda dutobj=dutobj: dut_prerequisites(dutobj)
+              for dutobj in duts]
+    results = run_concurrently(funcs)
+
+    failed = False
+    for crb, (_, exc_info) in zip([tester] + duts, results):
+        if exc_info is None or exc_info[0] is CrbInitAbortException:
+            continue
+        failed = True
+        crb.logger.error(" PREREQ EXCEPTION " +
+                         ''.join(traceback.format_exception(*exc_info)))
+        if crb is tester:
+            settings.report_error("TESTER_SETUP_ERR")
+        else:
+            result.add_failed_dut(crb, str(exc_info[1]))
+            settings.report_error("DUT_SETUP_ERR")
+
+    if failed:
+        log_handler.info('CACHE: Discarding cache.')
+        serializer.discard_cache()
+        return False
+
+    serializer.save_to_file()
+
+
+def dts_run_target(duts, tester, targets, test_suites, result):
     """
     Run each target in execution targets.
     """
+    log_handler = dts_logger()
+    if len(targets) > 1:
+        for dutobj in duts:
+            try:
+                dutobj.prebuild_targets(targets)
+            except Exception as ex:
+                log_handler.warning(" PREBUILD ERROR: " + str(ex))
+
     for target in targets:
         log_handler.info("\nTARGET " + target)
         result.target = target
@@ -354,6 +500,11 @@ def dts_run_target(duts, tester, targets, test_suites):
             else:
                 for dutobj in duts:
                     dutobj.set_target(target)
+
+            for dutobj in duts:
+                if target in dutobj.build_time:
+                    result.add_build_time(dutobj.crb['IP'], target,
+                                          dutobj.build_time[target])
         except AssertionError as ex:
             log_handler.error(" TARGET ERROR: " + str(ex))
             settings.report_error("DPDK_BUILD_ERR")
@@ -365,7 +516,7 @@ def dts_run_target(duts, tester, targets, test_suites):
             result.add_failed_target(result.dut, target, str(ex))
             continue
 
-        dts_run_suite(duts, tester, test_suites, target)
+        dts_run_suite(duts, tester, test_suites, target, result)
 
     tester.restore_interfaces()
 
@@ -374,10 +525,11 @@ def dts_run_target(duts, tester, targets, test_suites):
         dutobj.restore_interfaces()
 
 
-def dts_run_suite(duts, tester, test_suites, target):
+def dts_run_suite(duts, tester, test_suites, target, result):
     """
     Run each suite in test suite list.
     """
+    log_handler = dts_logger()
     for suite_name in test_suites:
         try:
             result.test_suite = suite_name
@@ -386,7 +538,9 @@ def dts_run_suite(duts, tester, test_suites, target):
 
                 suite_obj = test_class(duts, tester, target, suite_name)
                 suite_obj.set_requested_cases(requested_tests)
-                suite_obj.set_check_inst(check=check_case_inst, support=support_case_inst)
+                suite_obj.set_check_inst(check=check_case_skip(duts[0]),
+                                         support=check_case_support(duts[0]))
+                suite_obj.set_journal(journal, result.dut)
                 result.nic = suite_obj.nic
 
                 dts_log_testsuite(duts, tester, suite_obj, log_handler, test_classname)
@@ -394,12 +548,21 @@ def dts_run_suite(duts, tester, test_suites, target):
                 log_handler.info("\nTEST SUITE : " + test_classname)
                 log_handler.info("NIC :        " + result.nic)
 
-                if suite_obj.execute_setup_all():
+                if not suite_obj.has_pending_cases():
+                    # only restore results of completed cases
+                    log_handler.info("All cases completed in journal")
+                    suite_obj.skip_suite()
+                    suite_obj.execute_test_cases()
+                elif suite_obj.execute_setup_all():
                     suite_obj.execute_test_cases()
                     suite_obj.execute_tear_downall()
 
                 # save suite cases result
                 result.copy_suite(suite_obj.get_result())
+                result.add_case_timings(result.dut, target,
+                                        suite_obj.get_timings())
+                journal.record_timings(result.dut, target,
+                                       suite_obj.get_timings())
                 save_all_results()
 
                 log_handler.info("\nTEST SUITE ENDED: " + test_classname)
@@ -421,10 +584,97 @@ def dts_run_suite(duts, tester, test_suites, target):
             save_all_results()
 
 
+def dts_suite_scheduler():
+    return SuiteScheduler(settings.FOLDERS['Output'] + '/.suite_durations',
+                          log_handler)
+
+
+def dts_run_parallel(crbInsts, skip_setup, read_cache, project, base_dir,
+                     virttype, pkgName, patch, dts_commands, targets,
+                     test_suites):
+    """
+    Run suites on CRBs concurrently, each CRB is an independent DUT/tester
+    pair with its own result. Suites are sharded by their requirements and
+    durations in previous executions.
+    """
+    pairs = [None] * len(crbInsts)
+
+    # suite logs of pairs are switched independently
+    pair_logs = {}
+    for crbInst in crbInsts:
+        pair_logger = getLogger('dts' + settings.LOG_NAME_SEP +
+                                crbInst['section'])
+        # not propagated into global dts logger
+        pair_logger.logger.propagate = False
+        pair_logger.config_execution('dts')
+        pair_logs[crbInst['section']] = pair_logger
+
+    def init_pair(index, crbInst):
+        pair_log.handler = pair_logs[crbInst['section']]
+        crbInst = copy.copy(crbInst)
+        crbInst['parallel'] = True
+        pair_result = Result()
+        pair_result.dut = crbInst['section']
+        with results_lock:
+            pair_results.append(pair_result)
+
+        serializer = Serializer(crbInst['IP'])
+        try:
+            duts, tester = dts_crbs_init([crbInst], skip_setup, read_cache,
+                                         project, base_dir, serializer,
+                                         virttype)
+        except Exception as ex:
+            pair_result.add_failed_dut(crbInst['section'], str(ex))
+            raise
+        atexit.register(quit_execution, duts, tester)
+
+        if dts_run_prerequisties(duts, tester, pkgName, patch, dts_commands,
+                                 serializer, pair_result) is False:
+            dts_crbs_exit(duts, tester)
+            return
+        pairs[index] = (duts, tester, pair_result)
+
+    def run_pair(duts, tester, pair_result, suites):
+        pair_log.handler = pair_logs[duts[0].crb['section']]
+        try:
+            if suites:
+                dts_run_target(duts, tester, targets, suites, pair_result)
+        finally:
+            dts_crbs_exit(duts, tester)
+
+    results = run_concurrently(
+        [lambda index=index, crbInst=crbInst: init_pair(index, crbInst)
+         for index, crbInst in enumerate(crbInsts)])
+    for crbInst, (_, exc_info) in zip(crbInsts, results):
+        if exc_info is not None:
+            log_handler.error(" CRB %s INIT EXCEPTION " % crbInst['section'] +
+                              ''.join(traceback.format_exception(*exc_info)))
+
+    pairs = [pair for pair in pairs if pair is not None]
+    if not pairs:
+        return
+
+    scheduler = dts_suite_scheduler()
+    shards = scheduler.shard(test_suites, [scheduler.crb_ports(duts[0])
+                                           for duts, _, _ in pairs])
+    for (duts, _, _), suites in zip(pairs, shards):
+        log_handler.info("CRB %s SUITES: %s" % (duts[0].crb['section'],
+                                                ', '.join(suites)))
+
+    results = run_concurrently(
+        [lambda pair=pair, suites=suites: run_pair(*(pair + (suites,)))
+         for pair, suites in zip(pairs, shards)])
+    for (duts, _, _), (_, exc_info) in zip(pairs, results):
+        if exc_info is not None:
+            log_handler.error(" CRB %s EXCEPTION " % duts[0].crb['section'] +
+                              ''.join(traceback.format_exception(*exc_info)))
+
+
 def run_all(config_file, pkgName, git, patch, skip_setup,
             read_cache, project, suite_dir, test_cases,
             base_dir, output_dir, verbose, virttype, debug,
-            debugcase, commands):
+            debugcase, commands, transport='pexpect', sync_package=False,
+            parallel=False, resume=None, vm_image_cache=False):
     """
     Main process of DTS, it will run all test suites in the config file.
     """
@@ -433,9 +683,9 @@ def run_all(config_file, pkgName, git, patch, skip_setup,
     global result
     global excel_report
     global stats_report
+    global timing_report
     global log_handler
-    global check_case_inst
-    global support_case_inst
+    global journal
 
     # save global variable
     serializer = Serializer()
@@ -461,6 +711,22 @@ def run_all(config_file, pkgName, git, patch, skip_setup,
     if debugcase is True:
         settings.save_global_setting(settings.DEBUG_CASE_SETTING, 'yes')
 
+    # select ssh session backend
+    settings.save_global_setting(settings.SSH_TRANSPORT_SETTING, transport)
+
+    # reuse package, build and port scan of interrupted execution
+    if resume is not None:
+        sync_package = True
+        read_cache = True
+
+    # incremental package transfer
+    if sync_package is True:
+        settings.save_global_setting(settings.PKG_SYNC_SETTING, 'yes')
+
+    # start vms from golden guest images
+    if vm_image_cache is True:
+        settings.save_global_setting(settings.VM_IMAGE_CACHE_SETTING, 'yes')
+
     # init log_handler handler
     if verbose is True:
         logger.set_verbose()
@@ -489,8 +755,16 @@ def run_all(config_file, pkgName, git, patch, skip_setup,
     # report objects
     excel_report = ExcelReporter(output_dir + '/test_results.xls')
     stats_report = StatsReporter(output_dir + '/statistics.txt')
+    timing_report = TimingReporter(output_dir + '/timing.json')
     result = Result()
 
+    # results of interrupted execution are reported again
+    if resume is not None:
+        journal = RunJournal(resume, resume=True)
+        journal.replay(result)
+    else:
+        journal = RunJournal(output_dir + '/journal.log')
+
     crbInsts = []
     crbs_conf = CrbsConf()
     crbs = crbs_conf.load_crbs_config()
@@ -516,6 +790,13 @@ def run_all(config_file, pkgName, git, patch, skip_setup,
             log_handler.error(" SKIP UNKNOWN CRB")
             continue
 
+        if parallel is True:
+            dts_run_parallel([crb for crb in crbInsts if crb['section'] in duts],
+                             skip_setup, read_cache, project, base_dir,
+                             virttype, pkgName, patch, dts_commands, targets,
+                             test_suites)
+            continue
+
         result.dut = duts[0]
 
         # init dut, tester crb
@@ -524,20 +805,22 @@ def run_all(config_file, pkgName, git, patch, skip_setup,
         # register exit action
         atexit.register(quit_execution, duts, tester)
 
-        check_case_inst = check_case_skip(duts[0])
-        support_case_inst = check_case_support(duts[0])
-
         # Run DUT prerequisites
-        if dts_run_prerequisties(duts, tester, pkgName, patch, dts_commands, serializer) is False:
+        if dts_run_prerequisties(duts, tester, pkgName, patch, dts_commands, serializer, result) is False:
             dts_crbs_exit(duts, tester)
             continue
 
-        dts_run_target(duts, tester, targets, test_suites)
+        dts_run_target(duts, tester, targets, test_suites, result)
 
         dts_crbs_exit(duts, tester)
 
     save_all_results()
 
+    # durations of suites for balancing following executions
+    scheduler = dts_suite_scheduler()
+    scheduler.update_durations(all_results().all_case_timings())
+    scheduler.save_durations()
+
 
 def show_speedup_options_messages(read_cache, skip_setup):
     if read_cache:
@@ -551,12 +834,30 @@ def show_speedup_options_messages(read_cache, skip_setup):
         log_handler.info('SKIP: The DPDK setup steps will be executed.')
 
 
+def all_results():
+    """
+    Return result of all executions, results of concurrent DUT/tester pairs
+    are merged into one.
+    """
+    if not pair_results:
+        return result
+
+    merged = Result()
+    merged.merge(result)
+    for pair_result in pair_results:
+        merged.merge(pair_result)
+    return merged
+
+
 def save_all_results():
     """
     Save all result to files.
     """
-    excel_report.save(result)
-    stats_report.save(result)
+    with results_lock:
+        report = all_results()
+        excel_report.save(report)
+        stats_report.save(report)
+        timing_report.save(report)
 
 
 def quit_execution(duts, tester):
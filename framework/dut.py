@@ -32,6 +32,7 @@
 import os
 import re
 import time
+import threading
 import settings
 from config import PortConf
 from settings import NICS, LOG_NAME_SEP
@@ -75,6 +76,10 @@ class Dut(Crb):
         self.virt_pool = None
         # hypervisor pid list, used for cleanup
         self.virt_pids = []
+        # tester ports are shared when mapping ports of concurrent VMs
+        self.portmap_lock = threading.Lock()
+        # barrier shared with other crbs when initialized concurrently
+        self.prerequisites_barrier = None
 
     def init_host_session(self):
         if self.host_init_flag:
@@ -131,6 +136,19 @@ class Dut(Crb):
         self.target = target
         [arch, _, _, toolchain] = target.split('-')
 
+        toolchain_env = self.get_toolchain_env(target)
+        if toolchain_env:
+            self.send_expect(toolchain_env, "# ")
+
+        self.architecture = arch
+
+    def get_toolchain_env(self, target):
+        """
+        Return command which setup toolchain environment for target, empty
+        string when no setup required.
+        """
+        [arch, _, _, toolchain] = target.split('-')
+
         if toolchain == "icc":
             icc_vars = os.getenv('ICC_VARS', "/opt/intel/composer_xe_2013/bin/")
             icc_vars += "compilervars.sh"
@@ -139,9 +157,9 @@ class Dut(Crb):
                 icc_arch = "intel64"
             elif arch == "i686":
                 icc_arch = "ia32"
-            self.send_expect("source " + icc_vars + " " + icc_arch, "# ")
+            return "source " + icc_vars + " " + icc_arch
 
-        self.architecture = arch
+        return ""
 
     def mount_procfs(self):
         """
@@ -187,8 +205,10 @@ class Dut(Crb):
 
         self.init_core_list()
         self.pci_devices_information()
-        # make sure ipv6 enable before scan
-        self.enable_tester_ipv6()
+        # make sure ipv6 enable before scan, tester will enable it by itself
+        # when crbs are initialized concurrently
+        if self.prerequisites_barrier is None:
+            self.enable_tester_ipv6()
         # scan ports before restore interface
         self.scan_ports()
         # restore dut ports to kernel
@@ -198,10 +218,13 @@ class Dut(Crb):
         # load port infor from config file
         self.load_portconf()
         self.mount_procfs()
-        # auto detect network topology
-        self.map_available_ports()
-        # disable tester port ipv6
-        self.disable_tester_ipv6()
+        if self.prerequisites_barrier is None:
+            self.detect_topology()
+        else:
+            # tester and other duts should be ready before detection
+            self.prerequisites_barrier.wait()
+            with self.prerequisites_barrier.lock:
+                self.detect_topology()
         # print latest ports_info
         for port_info in self.ports_info:
             self.logger.info(port_info)
@@ -211,6 +234,15 @@ class Dut(Crb):
         # initialize virtualization resource pool
         self.virt_pool = VirtResource(self)
 
+    def detect_topology(self):
+        """
+        Auto detect network topology between DUT and tester, tester ports
+        should have been enabled ipv6.
+        """
+        self.map_available_ports()
+        # disable tester port ipv6
+        self.disable_tester_ipv6()
+
     def restore_interfaces(self):
         """
         Restore all ports's interfaces.
@@ -249,6 +281,8 @@ class Dut(Crb):
         """
         Restore Linux interfaces.
         """
+        bind_cmds = []
+        ports = []
         for port in self.ports_info:
             pci_bus = port['pci']
             pci_id = port['type']
@@ -262,18 +296,27 @@ class Dut(Crb):
                 devfun_id = addr_array[2]
 
                 port = GetNicObj(self, domain_id, bus_id, devfun_id)
-
-                self.send_expect('echo %s > /sys/bus/pci/devices/%s\:%s\:%s/driver/unbind'
-                                 % (pci_bus, domain_id, bus_id, devfun_id), '# ')
-                # bind to linux kernel driver
-                self.send_expect('modprobe %s' % driver, '# ')
-                self.send_expect('echo %s > /sys/bus/pci/drivers/%s/bind'
-                                 % (pci_bus, driver), '# ')
-                itf = port.get_interface_name()
-                self.send_expect("ifconfig %s up" % itf, "# ")
+                if port not in ports:
+                    ports.append(port)
+
+                # unbind and bind to linux kernel driver
+                bind_cmds.append(
+                    'echo %s > /sys/bus/pci/devices/%s\:%s\:%s/driver/unbind; '
+                    % (pci_bus, domain_id, bus_id, devfun_id) +
+                    'modprobe %s; ' % driver +
+                    'echo %s > /sys/bus/pci/drivers/%s/bind' % (pci_bus, driver))
             else:
                 self.logger.info("NOT FOUND DRIVER FOR PORT (%s|%s)!!!" % (pci_bus, pci_id))
 
+        # each port is independent, restore them concurrently
+        self.run_parallel(bind_cmds)
+        self.scan_pci_devices_detail()
+        try:
+            itfs = [port.get_interface_name() for port in ports]
+        finally:
+            self.clear_pci_devices_detail()
+        self.run_parallel(["ifconfig %s up" % itf for itf in itfs])
+
     def setup_memory(self, hugepages=-1):
         """
         Setup hugepage on DUT.
@@ -579,30 +622,44 @@ class Dut(Crb):
         rescan ports and update port's mac adress, intf, ipv6 address.
         """
         rescan_ports_uncached = getattr(self, 'rescan_ports_uncached_%s' % self.get_os_type())
-        return rescan_ports_uncached()
+        # ports' information will be taken from one bulk scan
+        self.scan_pci_devices_detail()
+        try:
+            return rescan_ports_uncached()
+        finally:
+            self.clear_pci_devices_detail()
 
     def rescan_ports_uncached_linux(self):
         unknow_interface = RED('Skipped: unknow_interface')
 
         for port_info in self.ports_info:
             port = port_info['port']
-            intf = port.get_interface_name()
-            port_info['intf'] = intf
-            out = self.send_expect("ip link show %s" % intf, "# ")
-            if "DOWN" in out:
-                self.send_expect("ip link set %s up" % intf, "# ")
-                time.sleep(5)
-            port_info['mac'] = port.get_mac_addr()
-            out = self.send_expect("ip -family inet6 address show dev %s | awk '/inet6/ { print $2 }'"
-                                   % intf, "# ")
-            ipv6 = out.split('/')[0]
+            port_info['intf'] = port.get_interface_name()
+
+        intfs = [port_info['intf'] for port_info in self.ports_info]
+        outs = self.run_parallel(["ip link show %s" % intf for intf in intfs])
+        down_intfs = [intf for intf, out in zip(intfs, outs) if "DOWN" in out]
+        if down_intfs:
+            self.run_parallel(["ip link set %s up" % intf for intf in down_intfs])
+            # wait once for all interfaces link up
+            self.wait_link_status(down_intfs, 'up', 5)
+
+        ipv6_outs = self.run_parallel(
+            ["ip -family inet6 address show dev %s | awk '/inet6/ { print $2 }'"
+             % intf for intf in intfs])
+        ipv4_outs = self.run_parallel(
+            ["ip -family inet address show dev %s | awk '/inet/ { print $2 }'"
+             % intf for intf in intfs])
+
+        for port_info, ipv6_out, ipv4_out in zip(self.ports_info, ipv6_outs,
+                                                 ipv4_outs):
+            port_info['mac'] = port_info['port'].get_mac_addr()
+            ipv6 = ipv6_out.split('/')[0]
             # Unconnected ports don't have IPv6
             if ":" not in ipv6:
                 ipv6 = "Not connected"
 
-            out = self.send_expect("ip -family inet address show dev %s | awk '/inet/ { print $2 }'"
-                    % intf, "# ")
-            ipv4 = out.split('/')[0]
+            ipv4 = ipv4_out.split('/')[0]
 
             port_info['ipv6'] = ipv6
             port_info['ipv4'] = ipv4
@@ -617,7 +674,7 @@ class Dut(Crb):
                 self.logger.info("DUT: [%s] %s" % (pci_bus, unknow_interface))
                 continue
             self.send_expect("ifconfig %s up" % intf, "# ")
-            time.sleep(5)
+            self.wait_link_status(intf, 'up', 5)
             macaddr = port.get_mac_addr()
             ipv6 = port.get_ipv6_addr()
             # Unconnected ports don't have IPv6
@@ -687,7 +744,12 @@ class Dut(Crb):
         Scan ports and collect port's pci id, mac adress, ipv6 address.
         """
         scan_ports_uncached = getattr(self, 'scan_ports_uncached_%s' % self.get_os_type())
-        return scan_ports_uncached()
+        # ports' information will be taken from one bulk scan
+        self.scan_pci_devices_detail()
+        try:
+            return scan_ports_uncached()
+        finally:
+            self.clear_pci_devices_detail()
 
     def scan_ports_uncached_linux(self):
         """
@@ -998,6 +1060,7 @@ class Dut(Crb):
         if self.alt_session:
             self.alt_session.close()
             self.alt_session = None
+        self.session_pool.close()
         if self.host_init_flag:
             self.host_session.close()
 
@@ -1008,9 +1071,18 @@ class Dut(Crb):
         # try to kill all hypervisor process
         for pid in self.virt_pids:
             self.send_expect("kill -s SIGTERM %d" % pid, "# ", alt_session=True)
-            time.sleep(3)
+            self.wait_until(lambda: not self.process_alive(pid), 3,
+                            "process %d exit" % pid)
         self.virt_pids = []
 
+    def process_alive(self, pid):
+        """
+        Check whether process still exists.
+        """
+        out = self.send_expect("kill -0 %d && echo alive" % pid, "# ",
+                               alt_session=True)
+        return "alive" in out
+
     def crb_exit(self):
         """
         Recover all resource before crb exit
@@ -29,15 +29,137 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import os
 import re
+import json
+import socket
 import string
+import struct
+import tempfile
 import time
 from config import IxiaConf
 from ssh_connection import SSHConnection
-from settings import SCAPY2IXIA
+from settings import SCAPY2IXIA, IXIA_SAMPLE_INTERVAL
+from settings import IXIA_SAMPLE_MAX_CV, IXIA_SAMPLE_RETRIES
 from logger import getLogger
 from exception import VerifyFailure
-from utils import create_mask
+from utils import create_mask, summarize_series
+from profiler import profiler
+
+
+VXLAN_PORT = 4789
+
+# rate statistics of all sampled ports in one tcl call
+IXIA_SAMPLE_PROC = (
+    "proc dtsSampleStats {chasId ports} {"
+    " set result {};"
+    " foreach p $ports {"
+    " stat getRate statAllStats $chasId [lindex $p 0] [lindex $p 1];"
+    " set s [list [stat cget -framesSent] [stat cget -framesReceived]"
+    " [stat cget -bitsSent] [stat cget -bitsReceived] [stat cget -oversize]];"
+    " if {[lindex $p 2]} {"
+    " packetGroupStats get $chasId [lindex $p 0] [lindex $p 1] 0 16384;"
+    " packetGroupStats getGroup 0;"
+    " lappend s [packetGroupStats cget -minLatency]"
+    " [packetGroupStats cget -maxLatency]"
+    " [packetGroupStats cget -averageLatency]};"
+    " lappend result $s};"
+    " return $result}")
+
+
+def decode_frame(frame):
+    """
+    Decode headers of ethernet frame which can be configured on IXIA.
+    Return list of (header name, parameters) in the same format as the
+    scapy command of the packet.
+    """
+    headers = []
+    if len(frame) < 14:
+        return headers
+
+    dst, src = frame[0:6], frame[6:12]
+    ether_type = struct.unpack('!H', frame[12:14])[0]
+    headers.append(('Ether', {'dst': ':'.join('%02x' % ord(c) for c in dst),
+                              'src': ':'.join('%02x' % ord(c) for c in src),
+                              'type': ether_type}))
+    offset = 14
+    while ether_type in (0x8100, 0x88a8) and len(frame) >= offset + 4:
+        tci, ether_type = struct.unpack('!HH', frame[offset:offset + 4])
+        headers.append(('Dot1Q', {'prio': tci >> 13, 'id': (tci >> 12) & 1,
+                                  'vlan': tci & 0xfff, 'type': ether_type}))
+        offset += 4
+
+    l3 = {0x0800: 4, 0x86dd: 41}.get(ether_type)
+    while l3 is not None:
+        if l3 == 4:
+            if len(frame) < offset + 20:
+                break
+            (ver_ihl, tos, length, ident, flags_frag, ttl, proto, chksum) = \
+                struct.unpack('!BBHHHBBH', frame[offset:offset + 12])
+            ihl = ver_ihl & 0xf
+            headers.append(('IP', {'version': ver_ihl >> 4, 'ihl': ihl,
+                                   'tos': tos, 'len': length, 'id': ident,
+                                   'flags': flags_frag >> 13,
+                                   'frag': flags_frag & 0x1fff,
+                                   'ttl': ttl, 'proto': proto,
+                                   'chksum': chksum,
+                                   'src': socket.inet_ntoa(
+                                       frame[offset + 12:offset + 16]),
+                                   'dst': socket.inet_ntoa(
+                                       frame[offset + 16:offset + 20]),
+                                   'options': []}))
+            offset += ihl * 4
+            # only first fragment has upper layer header
+            if flags_frag & 0x1fff:
+                return headers
+        else:
+            if len(frame) < offset + 40:
+                break
+            vtf, plen, proto, hlim = struct.unpack('!IHBB',
+                                                   frame[offset:offset + 8])
+            headers.append(('IPv6', {'version': vtf >> 28,
+                                     'tc': (vtf >> 20) & 0xff,
+                                     'fl': vtf & 0xfffff,
+                                     'plen': plen, 'nh': proto,
+                                     'hlim': hlim,
+                                     'src': socket.inet_ntop(
+                                         socket.AF_INET6,
+                                         frame[offset + 8:offset + 24]),
+                                     'dst': socket.inet_ntop(
+                                         socket.AF_INET6,
+                                         frame[offset + 24:offset + 40])}))
+            offset += 40
+        # ip in ip tunnel
+        l3 = proto if proto in (4, 41) else None
+
+    if not headers[-1][0].startswith('IP'):
+        return headers
+
+    if proto == 6 and len(frame) >= offset + 20:
+        (sport, dport, seq, ack, off, flags, window, chksum, urgptr) = \
+            struct.unpack('!HHIIBBHHH', frame[offset:offset + 20])
+        headers.append(('TCP', {'sport': sport, 'dport': dport, 'seq': seq,
+                                'ack': ack, 'dataofs': off >> 4,
+                                'reserved': (off >> 1) & 0x7,
+                                'flags': flags, 'window': window,
+                                'chksum': chksum, 'urgptr': urgptr,
+                                'options': []}))
+    elif proto == 17 and len(frame) >= offset + 8:
+        sport, dport, length, chksum = struct.unpack('!HHHH',
+                                                     frame[offset:offset + 8])
+        headers.append(('UDP', {'sport': sport, 'dport': dport,
+                                'len': length, 'chksum': chksum}))
+        payload = frame[offset + 8:]
+        if dport == VXLAN_PORT and payload:
+            headers.append(('Vxlan', {'hexval': ' '.join(
+                '%02X' % ord(c) for c in payload)}))
+    elif proto == 132 and len(frame) >= offset + 12:
+        sport, dport, tag, chksum = struct.unpack('!HHII',
+                                                  frame[offset:offset + 12])
+        headers.append(('SCTP', {'sport': sport, 'dport': dport,
+                                 'tag': tag, 'chksum': chksum}))
+
+    return headers
 
 
 class SoftwarePacketGenerator():
@@ -49,7 +171,7 @@ class SoftwarePacketGenerator():
     def __init__(self, tester):
         self.tester = tester
 
-    def packet_generator(self, portList, rate_percent):
+    def packet_generator(self, portList, rate_percent, delay=10):
         # bind ports
         self.tester.send_expect("insmod igb_uio.ko", "#")
 
@@ -99,7 +221,7 @@ class SoftwarePacketGenerator():
             self.tester.send_expect("set all rate 100", "Pktgen>")
 
         self.tester.send_expect("start all", "Pktgen>")
-        time.sleep(10)
+        profiler.sleep(delay)
         out = self.tester.send_expect("clr", "Pktgen>")
 
         match = r"Bits per second: (\d+)+/(\d+)"
@@ -119,14 +241,122 @@ class SoftwarePacketGenerator():
 
         return rx_bps, tx_bps, rx_pps
 
-    def throughput(self, portList, rate_percent=100):
-        (bps_rx, _, pps_rx) = self.packet_generator(portList, rate_percent)
+    def throughput(self, portList, rate_percent=100, delay=10):
+        (bps_rx, _, pps_rx) = self.packet_generator(portList, rate_percent,
+                                                    delay)
         return bps_rx, pps_rx
 
-    def loss(self, portList, ratePercent):
-        (bps_rx, bps_tx, _) = self.packet_generator(portList, ratePercent)
+    def loss(self, portList, ratePercent, delay=10):
+        """
+        Return loss rate and tx/rx bits per second, same as IXIA loss.
+        """
+        (bps_rx, bps_tx, _) = self.packet_generator(portList, ratePercent,
+                                                    delay)
         assert bps_tx != 0
-        return (float(bps_tx) - float(bps_rx)) / float(bps_tx)
+        return (float(bps_tx) - float(bps_rx)) / float(bps_tx), bps_tx, bps_rx
+
+
+class AfPacketGenerator(object):
+
+    """
+    Software packet generator based on AF_PACKET sockets on tester, it can
+    work on any kernel interface like veth pairs. Port statistics come from
+    interface counters and latency from timestamp stamped frames.
+    """
+    SCRIPT = 'dep/afpacket_gen.py'
+    CONFIG = 'afpacket_gen.json'
+
+    def __init__(self, tester):
+        self.tester = tester
+        self.script_ready = False
+        self.last_result = None
+
+    def run_generator(self, portList, rate_percent, delay, latency=False):
+        """
+        Transmit pcap files on tester ports for delay seconds, return result
+        of generator script.
+        """
+        if not self.script_ready:
+            self.tester.session.copy_file_to(self.SCRIPT,
+                                             password=self.tester.get_password())
+            self.script_ready = True
+
+        streams = []
+        for (tx_port, rx_port, pcap_file) in portList:
+            streams.append({'tx': self.tester.get_interface(tx_port),
+                            'rx': self.tester.get_interface(rx_port),
+                            'pcap': pcap_file,
+                            'rate': rate_percent})
+        config = {'duration': delay, 'latency': latency, 'streams': streams}
+        self.tester.create_file(json.dumps(config), self.CONFIG)
+
+        out = self.tester.send_expect("python %s %s" %
+                                      (self.SCRIPT.split('/')[-1],
+                                       self.CONFIG), "# ", delay + 60)
+        m = re.search(r"AFPKTGEN_RESULT: (.*)", out)
+        if m is None:
+            raise VerifyFailure("Software generator failed:\n" + out)
+
+        result = json.loads(m.group(1))
+        for intf, stats in result['senders'].items():
+            if stats['errors']:
+                self.tester.logger.warning("Send on %s failed %d times: %s" %
+                                           (intf, stats['errors'],
+                                            stats['last_error']))
+        self.last_result = result
+        return result
+
+    def port_stats(self, result, ports, direction):
+        """
+        Sum packets, bps and pps of ports in one direction.
+        """
+        intfs = set(self.tester.get_interface(port) for port in ports)
+        stats = [result['ports'][intf] for intf in intfs]
+        return (sum(s['%s_packets' % direction] for s in stats),
+                sum(s['%s_bps' % direction] for s in stats),
+                sum(s['%s_pps' % direction] for s in stats))
+
+    def throughput(self, portList, rate_percent=100, delay=5):
+        """
+        Return rx bps and pps of all rx ports.
+        """
+        result = self.run_generator(portList, rate_percent, delay)
+        _, bps, pps = self.port_stats(result, [p[1] for p in portList], 'rx')
+        self.tester.logger.info("Rate: %f Mpps" % (pps / 1000000))
+        return bps, pps
+
+    def loss(self, portList, ratePercent, delay=5):
+        """
+        Return loss rate and tx/rx packets, same as IXIA loss.
+        """
+        result = self.run_generator(portList, ratePercent, delay)
+        tx_num, _, _ = self.port_stats(result, [p[0] for p in portList], 'tx')
+        rx_num, _, _ = self.port_stats(result, [p[1] for p in portList], 'rx')
+        assert tx_num != 0
+        return float(tx_num - rx_num) / tx_num, tx_num, rx_num
+
+    def latency(self, portList, ratePercent, delay=5):
+        """
+        Return latency statistics in nanoseconds of each rx port, with
+        percentiles and log2 histogram.
+        """
+        result = self.run_generator(portList, ratePercent, delay, True)
+        latencyList = []
+        for rx_port in set(p[1] for p in portList):
+            stats = result['latency'].get(self.tester.get_interface(rx_port))
+            if not stats:
+                self.tester.logger.warning("No latency sample on port %d" %
+                                           rx_port)
+                continue
+            latency = {"port": rx_port}
+            latency.update(stats)
+            latencyList.append(latency)
+        return latencyList
+
+
+# software packet generators selectable by tester configuration
+SOFT_PACKET_GENERATORS = {'pktgen': SoftwarePacketGenerator,
+                          'afpacket': AfPacketGenerator}
 
 
 class IxiaPacketGenerator(SSHConnection):
@@ -147,6 +377,15 @@ class IxiaPacketGenerator(SSHConnection):
         self.tcl_cmds = []
         self.chasId = None
         self.conRelation = {}
+        # flows and tcl stream programs cached by pcap content hash
+        self.pcap_flows = {}
+        self.stream_programs = {}
+        # statistics sampling mode, disabled by default
+        self.sample_interval = None
+        self.sample_max_cv = IXIA_SAMPLE_MAX_CV
+        self.sample_retries = IXIA_SAMPLE_RETRIES
+        self.sample_proc_loaded = False
+        self.last_samples = None
 
         ixiaRef = self.tester.get_external_traffic_generator()
 
@@ -203,39 +442,53 @@ class IxiaPacketGenerator(SSHConnection):
         self.close()
         self.send_expect("clearOwnershipAndLogout", "% ")
 
-    def parse_pcap(self, fpcap):
-        dump_str1 = "cmds = []\n"
-        dump_str2 = "for i in rdpcap('%s', -1):\n" % fpcap
-        dump_str3 = "    if 'Vxlan' in i.command():\n" + \
-                    "        vxlan_str = ''\n" + \
-                    "        l = len(i[Vxlan])\n" + \
-                    "        vxlan = str(i[Vxlan])\n" + \
-                    "        first = True\n" + \
-                    "        for j in range(l):\n" + \
-                    "            if first:\n" + \
-                    "                vxlan_str += \"Vxlan(hexval='%02X\" %ord(vxlan[j])\n" + \
-                    "                first = False\n" + \
-                    "            else:\n" + \
-                    "                vxlan_str += \" %02X\" %ord(vxlan[j])\n" + \
-                    "        vxlan_str += \"\')\"\n" + \
-                    "        command = re.sub(r\"Vxlan(.*)\", vxlan_str, i.command())\n" + \
-                    "    else:\n" + \
-                    "        command = i.command()\n" + \
-                    "    cmds.append(command)\n" + \
-                    "print cmds\n" + \
-                    "exit()"
-
-        f = open("dumppcap.py", "w")
-        f.write(dump_str1)
-        f.write(dump_str2)
-        f.write(dump_str3)
-        f.close()
-
-        self.session.copy_file_to("dumppcap.py")
-        out = self.send_expect("scapy -c dumppcap.py 2>/dev/null", "% ", 120)
-        flows = eval(out)
+    def pcap_hash(self, fpcap):
+        """
+        Return md5 of pcap file on tester.
+        """
+        out = self.tester.send_expect("md5sum %s" % fpcap, "# ")
+        m = re.search(r"^([0-9a-f]{32})\s", out, re.M)
+        if m is None:
+            raise VerifyFailure("Can't access pcap file %s" % fpcap)
+        return m.group(1)
+
+    def parse_pcap(self, fpcap, pcap_hash=None):
+        """
+        Return headers of each frame in pcap file on tester. The file is
+        decoded locally and result is cached by its content hash.
+        """
+        if pcap_hash is None:
+            pcap_hash = self.pcap_hash(fpcap)
+        if pcap_hash in self.pcap_flows:
+            return self.pcap_flows[pcap_hash]
+
+        from packet import iter_pcap_frames
+        tmp_dir = tempfile.mkdtemp(prefix='dts_ixia_')
+        local_pcap = os.path.join(tmp_dir, os.path.basename(fpcap))
+        try:
+            self.tester.session.copy_file_from(fpcap, local_pcap)
+            flows = [decode_frame(frame)
+                     for frame in iter_pcap_frames(local_pcap)]
+        finally:
+            if os.path.exists(local_pcap):
+                os.remove(local_pcap)
+            os.rmdir(tmp_dir)
+
+        self.pcap_flows[pcap_hash] = flows
         return flows
 
+    def config_flow(self, port, flow):
+        """
+        Configure stream headers of one flow.
+        """
+        for method_name, params in flow:
+            if method_name == 'Vxlan':
+                self.vxlan(port, **params)
+                break
+            if method_name in SCAPY2IXIA:
+                method = getattr(self, method_name.lower())
+                method(port, **params)
+
     def ether(self, port, src, dst, type):
         """
         Configure Ether protocol.
@@ -332,24 +585,21 @@ class IxiaPacketGenerator(SSHConnection):
         """
         Configure IXIA stream and enable mutliple flows.
         """
-        flows = self.parse_pcap(fpcap)
+        pcap_hash = self.pcap_hash(fpcap)
+        key = (pcap_hash, rate_percent, latency, self.chasId,
+               txport['card'], txport['port'], stream_id)
+        if key in self.stream_programs and self.stream_program_cacheable():
+            self.tcl_cmds.extend(self.stream_programs[key])
+            return
+
+        flows = self.parse_pcap(fpcap, pcap_hash)
+        start = len(self.tcl_cmds)
 
         self.add_tcl_cmd("ixGlobalSetDefault")
         self.config_ixia_stream(rate_percent, flows, latency)
 
-        pat = re.compile(r"(\w+)\((.*)\)")
         for flow in flows:
-            for header in flow.split('/'):
-                match = pat.match(header)
-                params = eval('dict(%s)' % match.group(2))
-                method_name = match.group(1)
-                if method_name == 'Vxlan':
-                    method = getattr(self, method_name.lower())
-                    method(txport, **params)
-                    break
-                if method_name in SCAPY2IXIA:
-                    method = getattr(self, method_name.lower())
-                    method(txport, **params)
+            self.config_flow(txport, flow)
 
             self.add_tcl_cmd("stream set %d %d %d %d" % (self.chasId, txport[
                                                          'card'], txport['port'], stream_id))
@@ -361,6 +611,22 @@ class IxiaPacketGenerator(SSHConnection):
             self.add_tcl_cmd("stream set %d %d %d %d" %
                              (self.chasId, txport['card'], txport['port'], stream_id))
 
+        if self.stream_program_cacheable():
+            self.stream_programs[key] = self.tcl_cmds[start:]
+
+    def stream_program_cacheable(self):
+        """
+        Stream program only depends on pcap, rate and latency when
+        translation functions are not overridden by suite.
+        """
+        for name in [header.lower() for header in SCAPY2IXIA] + \
+                ['vxlan', 'config_flow', 'config_ixia_stream',
+                 'macToTclFormat', 'ipv6_to_tcl_format']:
+            if getattr(self.__class__, name) != \
+                    getattr(IxiaPacketGenerator, name):
+                return False
+        return True
+
     def config_ixia_stream(self, rate_percent, flows, latency):
         """
         Configure IXIA stream with rate and latency.
@@ -506,15 +772,15 @@ class IxiaPacketGenerator(SSHConnection):
         """
         Get RX/TX packet statistics and calculate loss rate.
         """
-        time.sleep(delay)
+        self.wait_transmission(rxPortlist, txPortlist, delay)
 
         self.send_expect("ixStopTransmit portList", "%", 10)
-        time.sleep(2)
+        profiler.sleep(2)
         sendNumber = 0
         for port in txPortlist:
             self.stat_get_stat_all_stats(port)
             sendNumber += self.get_frames_sent()
-            time.sleep(0.5)
+            profiler.sleep(0.5)
 
         self.logger.info("send :%f" % sendNumber)
 
@@ -540,7 +806,7 @@ class IxiaPacketGenerator(SSHConnection):
         Stop IXIA transmit and return latency statistics.
         """
         latencyList = []
-        time.sleep(10)
+        self.wait_transmission(rxPortlist, [], 10, latency=True)
         self.send_expect("ixStopTransmit portList", "%", 10)
         for rx_port in rxPortlist:
             self.pktGroup_get_stat_all_stats(rx_port)
@@ -611,7 +877,6 @@ class IxiaPacketGenerator(SSHConnection):
         # config stream before packetGroup
         if latency is not False:
             for (txPort, rxPort, pcapFile) in portList:
-                flow_num = len(self.parse_pcap(pcapFile))
                 self.config_pktGroup_rx(self.pci_to_port(self.tester.get_pci(rxPort)))
                 self.config_pktGroup_tx(self.pci_to_port(self.tester.get_pci(txPort)))
         return rxPortlist, txPortlist
@@ -636,7 +901,10 @@ class IxiaPacketGenerator(SSHConnection):
         Override this method if you want to change the way of getting results
         back from IXIA.
         """
-        time.sleep(delay)
+        if self.sample_interval:
+            return self.get_sampled_results(rx_port_list, tx_port_list, delay)
+
+        profiler.sleep(delay)
         bpsRate = 0
         rate = 0
         oversize = 0
@@ -662,6 +930,134 @@ class IxiaPacketGenerator(SSHConnection):
         else:
             return (bpsRate, rate)
 
+    def get_sampled_results(self, rx_port_list, tx_port_list, delay=5):
+        """
+        Return mean rx bps and pps of steady traffic. Sample again while
+        traffic is still running if rx rate is not stable.
+        """
+        retries = self.sample_retries
+        while True:
+            samples = self.sample_statistics(rx_port_list, tx_port_list,
+                                             delay)
+            pps = samples['summary']['rx_pps']
+            if pps is None or pps['cv'] <= self.sample_max_cv or \
+                    retries <= 0:
+                break
+            self.logger.warning("Unstable rx rate (cv %f), sample again" %
+                                pps['cv'])
+            retries -= 1
+
+        if pps is not None and pps['cv'] > self.sample_max_cv:
+            self.logger.warning("Rx rate not stable after retries")
+
+        summary = samples['summary']
+        bpsRate = summary['rx_bps']['mean'] if summary['rx_bps'] else 0
+        rate = pps['mean'] if pps else 0
+        self.logger.info("Rate: %f Mpps" % (rate / 1000000))
+        self.logger.info("Mbps rate: %f Mbps" % (bpsRate / 1000000))
+
+        self.hook_transmissoin_func()
+
+        self.send_expect("ixStopTransmit portList", "%", 30)
+
+        return (bpsRate, rate)
+
+    def set_sampling(self, interval=IXIA_SAMPLE_INTERVAL,
+                     max_cv=IXIA_SAMPLE_MAX_CV, retries=IXIA_SAMPLE_RETRIES):
+        """
+        Enable sampling mode, results will be calculated from rate
+        statistics polled every interval seconds instead of one snapshot.
+        Set interval to None to disable it.
+        """
+        self.sample_interval = interval
+        self.sample_max_cv = max_cv
+        self.sample_retries = retries
+
+    def wait_transmission(self, rx_port_list, tx_port_list, delay,
+                          latency=False):
+        """
+        Wait for transmission running delay seconds, statistics will be
+        sampled in the meantime when sampling mode enabled.
+        """
+        if self.sample_interval:
+            self.sample_statistics(rx_port_list, tx_port_list, delay,
+                                   latency=latency)
+        else:
+            profiler.sleep(delay)
+
+    def sample_statistics(self, rx_port_list, tx_port_list, duration,
+                          interval=None, latency=False):
+        """
+        Poll rate statistics of all ports every interval seconds during
+        duration. Return dictionary with time series in 'samples' and
+        aggregates of each series in 'summary'. Latency is in nanoseconds.
+        """
+        if interval is None:
+            interval = self.sample_interval or IXIA_SAMPLE_INTERVAL
+
+        if not self.sample_proc_loaded:
+            self.send_expect(IXIA_SAMPLE_PROC, "% ", 10)
+            self.sample_proc_loaded = True
+
+        ports = []
+        for port in list(tx_port_list) + list(rx_port_list):
+            ixia_port = self.pci_to_port(self.tester.get_pci(port))
+            ports.append("{%d %d %d}" % (ixia_port['card'], ixia_port['port'],
+                                         latency and port in rx_port_list))
+        command = "dtsSampleStats %d {%s}" % (self.chasId, ' '.join(ports))
+        tx_num = len(tx_port_list)
+
+        samples = []
+        start = time.time()
+        end = start + duration
+        next_time = start + interval
+        while next_time <= end + 0.001:
+            profiler.sleep(max(next_time - time.time(), 0))
+            out = self.send_expect(command, "% ", 30)
+            stats = [[int(value) for value in port_stats.split()]
+                     for port_stats in re.findall(r"\{([\d\s]+)\}", out)]
+            if len(stats) != len(ports):
+                self.logger.warning("Unexpected statistics: " + out)
+                next_time += interval
+                continue
+
+            tx_stats, rx_stats = stats[:tx_num], stats[tx_num:]
+            sample = {'time': time.time() - start,
+                      'tx_pps': sum(s[0] for s in tx_stats),
+                      'tx_bps': sum(s[2] for s in tx_stats),
+                      # large frames are only counted as oversize
+                      'rx_pps': sum(s[1] or s[4] for s in rx_stats),
+                      'rx_bps': sum(s[3] for s in rx_stats)}
+            if sample['tx_pps']:
+                sample['loss'] = float(sample['tx_pps'] - sample['rx_pps']) / \
+                    sample['tx_pps']
+            if latency:
+                latencies = [s[5:8] for s in rx_stats if len(s) == 8]
+                if latencies:
+                    sample['min_latency'] = min(l[0] for l in latencies)
+                    sample['max_latency'] = max(l[1] for l in latencies)
+                    sample['average_latency'] = \
+                        float(sum(l[2] for l in latencies)) / len(latencies)
+            samples.append(sample)
+            next_time += interval
+
+        summary = {}
+        for key in ['tx_pps', 'tx_bps', 'rx_pps', 'rx_bps', 'loss',
+                    'min_latency', 'max_latency', 'average_latency']:
+            summary[key] = summarize_series([sample[key] for sample in samples
+                                             if key in sample])
+        self.last_samples = {'samples': samples, 'summary': summary}
+        if summary['rx_pps']:
+            self.logger.info("Sampled rx rate: mean %f Mpps p50 %f p99 %f "
+                             "min %f max %f cv %f" %
+                             (summary['rx_pps']['mean'] / 1000000,
+                              summary['rx_pps']['p50'] / 1000000.0,
+                              summary['rx_pps']['p99'] / 1000000.0,
+                              summary['rx_pps']['min'] / 1000000.0,
+                              summary['rx_pps']['max'] / 1000000.0,
+                              summary['rx_pps']['cv']))
+        return self.last_samples
+
     def config_ixia_dcb_init(self, rxPort, txPort):
         """
         Configure Ixia for DCB.
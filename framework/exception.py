@@ -143,3 +143,25 @@ class VirtVmOperationException(Exception):
 
 class VirtHostPrepareException(Exception):
     pass
+
+
+class QMPException(Exception):
+
+    """
+    QEMU monitor or guest agent command failed.
+    """
+
+    def __init__(self, command, error):
+        self.command = command
+        self.error = error
+
+    def __str__(self):
+        return 'QMP command %s failed: %s' % (self.command, self.error)
+
+
+class CrbInitAbortException(Exception):
+
+    """
+    Concurrent CRBs initialization aborted by failure of other CRB.
+    """
+    pass
@@ -0,0 +1,174 @@
+# BSD LICENSE
+#
+# Copyright(c) 2010-2017 Intel Corporation. All rights reserved.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of Intel Corporation nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Append-only journal of execution, results of cases are recorded as they
+happen so that an interrupted execution can be resumed.
+"""
+
+import os
+import json
+import threading
+
+# results which will not be executed again when resume
+COMPLETED_RESULTS = ('PASSED', 'FAILED', 'N/A')
+
+
+def restore_case_result(result, status, message):
+    """
+    Set result of current case in Result object by status string.
+    """
+    if status == 'PASSED':
+        result.test_case_passed()
+    elif status == 'FAILED':
+        result.test_case_failed(message)
+    elif status == 'N/A':
+        result.test_case_skip(message)
+    else:
+        result.test_case_blocked(message)
+
+
+class RunJournal(object):
+
+    """
+    Every record is one json line, file is synced when record written.
+    Truncated record left by killed process is ignored when loading.
+    """
+
+    def __init__(self, filename, resume=False):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.records = []
+        if resume:
+            self.records = self.load()
+        elif os.path.exists(filename):
+            os.remove(filename)
+
+        # latest result of each case
+        self.cases = {}
+        for record in self.records:
+            if record['type'] == 'case':
+                key = (record['dut'], record['target'], record['suite'])
+                self.cases.setdefault(key, {})[record['case']] = record
+
+        # terminate truncated record before appending
+        truncated = False
+        if os.path.exists(filename) and os.path.getsize(filename):
+            with open(filename) as journal_file:
+                journal_file.seek(-1, os.SEEK_END)
+                truncated = journal_file.read(1) != '\n'
+        self.journal_file = open(filename, 'a')
+        if truncated:
+            self.journal_file.write('\n')
+
+    def load(self):
+        records = []
+        if not os.path.exists(self.filename):
+            return records
+        with open(self.filename) as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and 'type' in record:
+                    records.append(record)
+        return records
+
+    def __append(self, record):
+        with self.lock:
+            self.records.append(record)
+            self.journal_file.write(json.dumps(record) + '\n')
+            self.journal_file.flush()
+            os.fsync(self.journal_file.fileno())
+
+    def record_case(self, dut, target, nic, suite, case, status, message):
+        """
+        Record result of one case.
+        """
+        # message may contain undecodable bytes of session output
+        if isinstance(message, str):
+            message = message.decode('utf-8', 'replace')
+        record = {'type': 'case', 'dut': dut, 'target': target, 'nic': nic,
+                  'suite': suite, 'case': case, 'result': status,
+                  'message': message}
+        self.__append(record)
+        with self.lock:
+            self.cases.setdefault((dut, target, suite), {})[case] = record
+
+    def record_timings(self, dut, target, timings):
+        """
+        Record timing of suite phases and cases.
+        """
+        for timing in timings:
+            self.__append({'type': 'timing', 'dut': dut, 'target': target,
+                           'timing': timing})
+
+    def completed_cases(self, dut, target, suite):
+        """
+        Return result and message of cases completed in the suite.
+        """
+        with self.lock:
+            cases = self.cases.get((dut, target, suite), {})
+            return dict((case, (record['result'], record['message']))
+                        for case, record in cases.items()
+                        if record['result'] in COMPLETED_RESULTS)
+
+    def replay(self, result):
+        """
+        Fill Result object with all records, the latest result of each case
+        is used.
+        """
+        replayed = set()
+        for record in self.records:
+            if record['type'] == 'timing':
+                result.add_case_timings(record['dut'], record['target'],
+                                        [record['timing']])
+                continue
+            if record['type'] != 'case':
+                continue
+
+            key = (record['dut'], record['target'], record['suite'])
+            latest = self.cases[key][record['case']]
+            if id(latest) in replayed:
+                continue
+            replayed.add(id(latest))
+
+            result.dut = latest['dut']
+            result.target = latest['target']
+            result.nic = latest['nic']
+            result.test_suite = latest['suite']
+            result.test_case = latest['case']
+            restore_case_result(result, latest['result'], latest['message'])
+
+    def close(self):
+        with self.lock:
+            self.journal_file.close()
@@ -140,6 +140,32 @@ parser.add_argument('--commands',
                     help='run command on tester or dut. The command format is ' +
                     '[commands]:dut|tester:pre-init|post-init:check|ignore')
 
+parser.add_argument('--ssh-transport',
+                    default='pexpect',
+                    choices=['pexpect', 'mux'],
+                    help='ssh session backend, mux will run commands over ' +
+                    'one persistent multiplexed ssh connection')
+
+parser.add_argument('--sync-package',
+                    action='store_true',
+                    help='only transfer changed files of dpdk package into ' +
+                    'persistent source tree on DUT')
+
+parser.add_argument('--parallel',
+                    action='store_true',
+                    help='treat each crb of execution as an independent ' +
+                    'dut/tester pair and run suites on them concurrently')
+
+parser.add_argument('--resume',
+                    default=None,
+                    help='resume interrupted execution by its journal, ' +
+                    'completed cases will not be executed again')
+
+parser.add_argument('--vm-image-cache',
+                    action='store_true',
+                    help='build dpdk once in golden guest image and start ' +
+                    'vms from qcow2 overlays of it')
+
 args = parser.parse_args()
 
 
@@ -156,4 +182,6 @@ dts.run_all(args.config_file, args.snapshot, args.git,
             args.patch, args.skip_setup, args.read_cache,
             args.project, args.suite_dir, args.test_cases,
             args.dir, args.output, args.verbose,args.virttype,
-            args.debug, args.debugcase, args.commands)
+            args.debug, args.debugcase, args.commands,
+            args.ssh_transport, args.sync_package, args.parallel,
+            args.resume, args.vm_image_cache)
@@ -0,0 +1,321 @@
+# BSD LICENSE
+#
+# Copyright(c) 2010-2017 Intel Corporation. All rights reserved.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of Intel Corporation nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import time
+import json
+
+from exception import QMPException, TimeoutException
+from qmp_client import QMP
+from virt_base import ST_PAUSE
+
+"""
+Live migration of QEMU VM driven through QMP, progress is tracked by events
+and query-migrate samples, metrics of migration are returned as dictionary.
+"""
+
+# final status of migration
+MIGRATION_DONE_STATUS = ['completed', 'failed', 'cancelled']
+
+
+class MigrationController(object):
+
+    """
+    Migrate source VM into target VM waiting for incoming migration. Target
+    VM is optional, it is only used for measuring when VM resumed.
+    """
+
+    def __init__(self, source_vm, target_vm=None, interval=0.5):
+        self.source = source_vm
+        self.target = target_vm
+        self.logger = source_vm.host_logger
+        self.interval = interval
+        self.parameters = {}
+        self.samples = []
+        self.events = []
+        self.start_time = None
+        self.mark = 0
+        self.result = {}
+
+    def __client(self, vm):
+        if vm.qmp_client is None:
+            raise QMPException('migrate',
+                               'QMP of %s not connected' % vm.vm_name)
+        return vm.qmp_client
+
+    def __execute(self, command, arguments=None, vm=None):
+        return self.__client(vm or self.source).execute(QMP, command,
+                                                         arguments)
+
+    def __on_event(self, event):
+        self.events.append({'time': time.time(), 'event': event['event'],
+                            'data': event.get('data', {})})
+
+    def set_parameters(self, bandwidth=None, downtime=None, xbzrle=None,
+                       auto_converge=None, xbzrle_cache=None):
+        """
+        Set migration parameters of source VM, options not specified keep
+        qemu default.
+        bandwidth: maximal bandwidth in MB/s
+        downtime: maximal downtime in milliseconds
+        xbzrle: enable xbzrle compression or not
+        auto_converge: enable throttling of vcpus or not
+        xbzrle_cache: xbzrle cache size in MB
+        """
+        capabilities = [{'capability': 'events', 'state': True}]
+        if xbzrle is not None:
+            capabilities.append({'capability': 'xbzrle', 'state': xbzrle})
+        if auto_converge is not None:
+            capabilities.append({'capability': 'auto-converge',
+                                 'state': auto_converge})
+        self.__execute('migrate-set-capabilities',
+                       {'capabilities': capabilities})
+
+        params = {}
+        if bandwidth is not None:
+            params['max-bandwidth'] = int(bandwidth * 1024 * 1024)
+        if downtime is not None:
+            params['downtime-limit'] = int(downtime)
+        if params:
+            try:
+                self.__execute('migrate-set-parameters', params)
+            except QMPException:
+                # qemu older than 2.8 has dedicated commands
+                if bandwidth is not None:
+                    self.__execute('migrate_set_speed',
+                                   {'value': params['max-bandwidth']})
+                if downtime is not None:
+                    self.__execute('migrate_set_downtime',
+                                   {'value': downtime / 1000.0})
+
+        if xbzrle_cache is not None:
+            self.__execute('migrate-set-cache-size',
+                           {'value': int(xbzrle_cache * 1024 * 1024)})
+
+    def query_parameters(self):
+        """
+        Return capabilities and parameters which migration will run with.
+        """
+        parameters = {}
+        try:
+            for cap in self.__execute('query-migrate-capabilities'):
+                parameters[cap['capability']] = cap['state']
+            parameters.update(self.__execute('query-migrate-parameters'))
+        except QMPException as e:
+            self.logger.warning(str(e))
+        return parameters
+
+    def start(self, remote_ip, remote_port):
+        """
+        Start migration to remote qemu waiting for incoming migration.
+        """
+        client = self.__client(self.source)
+        self.parameters = self.query_parameters()
+        self.samples = []
+        self.events = []
+        self.result = {}
+
+        self.mark = client.event_mark()
+        client.subscribe('MIGRATION', self.__on_event)
+        client.subscribe('MIGRATION_PASS', self.__on_event)
+        if self.target is not None and self.target.qmp_client is not None:
+            self.target.qmp_client.subscribe('RESUME', self.__on_event)
+        # keep waiting by QEMUKvm working
+        self.source.migration_mark = self.mark
+
+        uri = 'tcp:%s:%s' % (remote_ip, remote_port)
+        self.logger.info("Migrate %s to %s" % (self.source.vm_name, uri))
+        self.start_time = time.time()
+        try:
+            self.__execute('migrate', {'uri': uri})
+        except QMPException:
+            self.__unsubscribe()
+            raise
+
+    def __unsubscribe(self):
+        client = self.source.qmp_client
+        if client is not None:
+            client.unsubscribe('MIGRATION', self.__on_event)
+            client.unsubscribe('MIGRATION_PASS', self.__on_event)
+        if self.target is not None and self.target.qmp_client is not None:
+            self.target.qmp_client.unsubscribe('RESUME', self.__on_event)
+
+    def __sample(self):
+        """
+        Query migration progress and save it as sample.
+        """
+        try:
+            info = self.__execute('query-migrate')
+        except (QMPException, TimeoutException) as e:
+            self.logger.warning(str(e))
+            return {}
+
+        ram = info.get('ram', {})
+        self.samples.append({'time': time.time() - self.start_time,
+                             'status': info.get('status', ''),
+                             'transferred': ram.get('transferred', 0),
+                             'remaining': ram.get('remaining', 0),
+                             'dirty_pages_rate':
+                             ram.get('dirty-pages-rate', 0),
+                             'mbps': ram.get('mbps', 0)})
+        return info
+
+    def wait(self, timeout=180):
+        """
+        Wait for migration finished and return metrics of it. Progress is
+        sampled every interval, status is updated by MIGRATION events.
+        Migration not finished in timeout seconds will be cancelled and its
+        status is 'timeout'.
+        """
+        client = self.__client(self.source)
+        deadline = self.start_time + timeout
+        try:
+            while True:
+                event = client.wait_event(
+                    'MIGRATION', self.interval, since=self.mark,
+                    match=lambda data:
+                    data.get('status') in MIGRATION_DONE_STATUS)
+                info = self.__sample()
+                if event is not None:
+                    status = event['data']['status']
+                else:
+                    status = info.get('status', '')
+                if status in MIGRATION_DONE_STATUS:
+                    break
+                if time.time() >= deadline:
+                    self.__cancel()
+                    status = 'timeout'
+                    break
+            end_time = time.time()
+
+            resumed = None
+            if status == 'completed':
+                # after migration done, status is pause
+                self.source.vm_status = ST_PAUSE
+                if self.target is not None and \
+                        self.target.qmp_client is not None:
+                    resumed = self.target.qmp_client.wait_event(
+                        'RESUME', 10, since=0)
+        finally:
+            self.__unsubscribe()
+
+        self.result = self.__metrics(status, info, end_time,
+                                     resumed is not None)
+        self.logger.info("Migration of %s %s: %s" %
+                         (self.source.vm_name, status,
+                          self.summary(self.result)))
+        return self.result
+
+    def __cancel(self):
+        """
+        Cancel migration, source VM keeps running.
+        """
+        self.logger.warning("Migration of %s timeout, cancel it" %
+                            self.source.vm_name)
+        try:
+            self.__execute('migrate_cancel')
+        except (QMPException, TimeoutException) as e:
+            self.logger.warning(str(e))
+
+    def __event_time(self, name, status=None):
+        for event in self.events:
+            if event['event'] != name:
+                continue
+            if status is None or event['data'].get('status') == status:
+                return event['time']
+        return None
+
+    def __metrics(self, status, info, end_time, resumed):
+        ram = info.get('ram', {})
+        rates = [sample['dirty_pages_rate'] for sample in self.samples]
+        result = {'vm': self.source.vm_name,
+                  'status': status,
+                  'parameters': self.parameters,
+                  # measured by DTS in case qemu not report it
+                  'total_time': info.get('total-time',
+                                         int((end_time - self.start_time) *
+                                             1000)),
+                  'downtime': info.get('downtime'),
+                  'setup_time': info.get('setup-time'),
+                  'transferred': ram.get('transferred', 0),
+                  'total_ram': ram.get('total', 0),
+                  'duplicate_pages': ram.get('duplicate', 0),
+                  'normal_pages': ram.get('normal', 0),
+                  'dirty_sync_count': ram.get('dirty-sync-count', 0),
+                  'dirty_pages_rate': max(rates) if rates else 0,
+                  'mbps': ram.get('mbps', 0),
+                  'passes': len([event for event in self.events
+                                 if event['event'] == 'MIGRATION_PASS']),
+                  'resume_delay': None,
+                  'packets_sent': None,
+                  'packets_received': None,
+                  'packets_lost': None,
+                  'samples': self.samples}
+
+        if 'xbzrle-cache' in info:
+            result['xbzrle'] = info['xbzrle-cache']
+
+        # delay between source completed and target resumed
+        completed = self.__event_time('MIGRATION', 'completed')
+        resume = self.__event_time('RESUME')
+        if resumed and completed is not None and resume is not None:
+            result['resume_delay'] = int((resume - completed) * 1000)
+
+        return result
+
+    def record_traffic(self, sent, received):
+        """
+        Record packets sent to VM during migration and received by VM, the
+        difference is packets lost during switchover.
+        """
+        self.result['packets_sent'] = sent
+        self.result['packets_received'] = received
+        self.result['packets_lost'] = max(sent - received, 0)
+
+    def summary(self, result):
+        """
+        One line summary of metrics.
+        """
+        items = ['total %sms' % result['total_time'],
+                 'downtime %sms' % result['downtime'],
+                 'transferred %d bytes' % result['transferred'],
+                 'dirty pages rate %d' % result['dirty_pages_rate']]
+        if result['packets_lost'] is not None:
+            items.append('lost %d packets' % result['packets_lost'])
+        return ', '.join(items)
+
+    def save(self, filename):
+        """
+        Append result as one json line into file for trending.
+        """
+        record = dict(self.result)
+        record['timestamp'] = self.start_time
+        with open(filename, 'a') as f:
+            f.write(json.dumps(record) + '\n')
@@ -0,0 +1,236 @@
+# BSD LICENSE
+#
+# Copyright(c) 2010-2017 Intel Corporation. All rights reserved.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of Intel Corporation nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import tarfile
+import hashlib
+import tempfile
+from StringIO import StringIO
+
+"""
+Content addressed synchronization of DPDK package into persistent source
+tree on DUT.
+"""
+
+STAMP_FILE = '.dts_stamp'
+LISTING_FILE = '.dts_md5sum'
+REMOVED_FILE = '.dts_removed'
+
+
+class PackageSync(object):
+
+    """
+    Synchronize package and patches into source tree on DUT. Only files
+    changed since last synchronization will be transferred, patches are
+    always applied on pristine files. Build folders of targets are kept.
+    """
+
+    def __init__(self, crb, package, patches, base_dir, dst_dir):
+        self.crb = crb
+        self.logger = crb.logger
+        self.package = package
+        self.patches = patches or []
+        self.base_dir = base_dir
+        self.dst_dir = dst_dir
+        self.p_dir, self.name = os.path.split(base_dir)
+        # find files in tree except target build folders and dts files
+        self.find_files = "find %s -regex '%s/[^/]+-[^/]+-[^/]+-[^/]+' " \
+            "-prune -o -type f ! -name '.dts_*' -print0" % (self.name,
+                                                           self.name)
+
+    def package_hash(self):
+        """
+        Hash of package and patches content.
+        """
+        md5 = hashlib.md5()
+        for name in [self.package] + ['dep/' + p for p in self.patches]:
+            with open(name, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), ''):
+                    md5.update(chunk)
+        return md5.hexdigest()
+
+    def sync(self):
+        """
+        Synchronize source tree, return False when tree was already the
+        same as package and patches.
+        """
+        stamp = self.package_hash()
+        if self.__tree_unchanged(stamp):
+            self.logger.info("Source tree %s is up to date" % self.base_dir)
+            return False
+
+        out = self.crb.send_expect("ls -d %s" % self.base_dir, "# ",
+                                   verify=True)
+        if type(out) is int and out != 0:
+            self.__unpack()
+        else:
+            self.__update()
+
+        for p in self.patches:
+            out = self.crb.send_expect("patch -d %s -p1 < %s" %
+                                       (self.base_dir, self.dst_dir + p), "# ")
+            assert "****" not in out
+
+        # record tree content after patched
+        self.crb.send_expect("cd %s && %s | xargs -0 md5sum > %s/%s && "
+                             "echo %s > %s/%s" %
+                             (self.p_dir, self.find_files, self.name,
+                              LISTING_FILE, stamp, self.name, STAMP_FILE),
+                             "# ", 120)
+        return True
+
+    def __tree_unchanged(self, stamp):
+        out = self.crb.send_expect("cat %s/%s" % (self.base_dir, STAMP_FILE),
+                                   "# ", verify=True)
+        if type(out) is int and out != 0:
+            return False
+
+        if out.strip() != stamp:
+            return False
+
+        # files may be modified after last synchronization
+        out = self.crb.send_expect("cd %s && md5sum -c --quiet %s/%s" %
+                                   (self.p_dir, self.name, LISTING_FILE),
+                                   "# ", 120, verify=True)
+        return type(out) is not int or out == 0
+
+    def __copy_to(self, src):
+        self.crb.session.copy_file_to(src, self.dst_dir)
+        return self.dst_dir + os.path.basename(src)
+
+    def __unpack(self):
+        """
+        No source tree on DUT, transfer and extract the whole package.
+        """
+        pkg = self.__copy_to(self.package)
+        out = self.crb.send_expect("tar zxf %s -C %s" % (pkg, self.p_dir),
+                                   "# ", 20, verify=True)
+        if type(out) is int and out != 0:
+            raise ValueError("Extract dpdk package to %s failure,"
+                             "please check params -d" % self.p_dir)
+
+        out = self.crb.send_expect("ls %s" % self.base_dir, "# ", 20,
+                                   verify=True)
+        if type(out) is int and out != 0:
+            raise ValueError("dpdk dir %s mismatch, please check params -d"
+                             % self.base_dir)
+
+    def __package_manifest(self, tar):
+        """
+        Return md5 of regular files and list of other members in package.
+        """
+        manifest = {}
+        others = []
+        for member in tar.getmembers():
+            path = os.path.normpath(member.name)
+            if path != self.name and not path.startswith(self.name + '/'):
+                raise ValueError("dpdk dir %s mismatch, please check "
+                                 "params -d" % self.base_dir)
+            if member.isfile():
+                md5 = hashlib.md5()
+                f = tar.extractfile(member)
+                for chunk in iter(lambda: f.read(1 << 20), ''):
+                    md5.update(chunk)
+                manifest[path] = (md5.hexdigest(), member)
+            elif not member.isdir():
+                others.append(member)
+        return manifest, others
+
+    def __remote_manifest(self):
+        """
+        Return md5 of files in source tree on DUT.
+        """
+        listing = "%sdts_%s.md5" % (self.dst_dir, self.name)
+        self.crb.send_expect("cd %s && %s | xargs -0 md5sum > %s" %
+                             (self.p_dir, self.find_files, listing), "# ", 120)
+
+        local = tempfile.mkdtemp()
+        try:
+            self.crb.session.copy_file_from(listing, local)
+            manifest = {}
+            with open(os.path.join(local, os.path.basename(listing))) as f:
+                for line in f:
+                    md5, path = line.rstrip('\n').split('  ', 1)
+                    manifest[os.path.normpath(path)] = md5
+        finally:
+            for name in os.listdir(local):
+                os.remove(os.path.join(local, name))
+            os.rmdir(local)
+
+        return manifest
+
+    def __update(self):
+        """
+        Transfer changed files and remove stale files in source tree.
+        """
+        tar = tarfile.open(self.package, 'r:gz')
+        try:
+            manifest, others = self.__package_manifest(tar)
+            remote = self.__remote_manifest()
+
+            changed = [member for path, (md5, member) in manifest.items()
+                       if remote.get(path) != md5]
+            removed = [path for path in remote if path not in manifest]
+            self.logger.info("Source tree %s: %d files changed, %d removed"
+                             % (self.base_dir, len(changed), len(removed)))
+
+            fd, delta = tempfile.mkstemp(prefix='dts_delta_',
+                                         suffix='.tar.gz')
+            os.close(fd)
+            try:
+                out_tar = tarfile.open(delta, 'w:gz')
+                for member in changed:
+                    out_tar.addfile(member, tar.extractfile(member))
+                for member in others:
+                    out_tar.addfile(member)
+                # list of files to be removed on DUT
+                data = ''.join([path + '\n' for path in removed])
+                info = tarfile.TarInfo('%s/%s' % (self.name, REMOVED_FILE))
+                info.size = len(data)
+                out_tar.addfile(info, StringIO(data))
+                out_tar.close()
+
+                pkg = self.__copy_to(delta)
+            finally:
+                os.remove(delta)
+        finally:
+            tar.close()
+
+        # changed files get current time so that make will rebuild them
+        out = self.crb.send_expect("cd %s && tar zxmf %s && "
+                                   "xargs -a %s/%s -d '\\n' rm -f && "
+                                   "rm -f %s/%s" %
+                                   (self.p_dir, pkg, self.name, REMOVED_FILE,
+                                    self.name, REMOVED_FILE),
+                                   "# ", 60, verify=True)
+        if type(out) is int and out != 0:
+            raise ValueError("Update dpdk source tree %s failure"
+                             % self.base_dir)
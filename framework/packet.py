@@ -42,13 +42,17 @@ import signal
 import random
 import subprocess
 import shlex        # separate command line for pipe
+import threading
 from uuid import uuid4
 from settings import FOLDERS
+from utils import run_concurrently
 
 from scapy.config import conf
 conf.use_pcap = True
 
 import struct
+import array
+import hashlib
 from socket import AF_INET6
 from scapy.all import conf
 from scapy.utils import wrpcap, rdpcap, hexstr
@@ -72,6 +76,7 @@ from vxlan import Vxlan
 from nvgre import NVGRE, IPPROTO_NVGRE
 from lldp import LLDP, LLDPManagementAddress
 from Dot1BR import Dot1BR
+from afpacket_gen import BulkSender
 
 # packet generator type should be configured later
 PACKETGEN = "scapy"
@@ -89,8 +94,13 @@ LayersTypes = {
     "PAYLOAD": ['raw']
 }
 
-# Saved back groud sniff process id
+# Saved back groud sniff captures
 SNIFF_PIDS = {}
+# captures may be started by cases of DUT/tester pairs running concurrently
+SNIFF_LOCK = threading.Lock()
+
+# tcpdump direction parameter, probed once
+TCPDUMP_DIRECTION = None
 
 # Saved packet generator process id
 # used in pktgen or tgen
@@ -151,6 +161,9 @@ class scapy(object):
     def assign_pkt(self, pkt):
         self.pkt = pkt
 
+    def get_frame(self):
+        return str(self.pkt)
+
     def add_layers(self, layers):
         self.pkt = None
         for layer in layers:
@@ -358,6 +371,34 @@ class scapy(object):
             sendp(self.pkt, iface=intf, count=count)
 
 
+class raw_scapy(scapy):
+
+    """
+    Scapy packet generator created from raw frame, the frame will only be
+    decoded into scapy packet when accessed.
+    """
+
+    def __init__(self, frame, decoder=Ether):
+        self.__frame = frame
+        self.__decoder = decoder
+        self.__pkt = None
+
+    def get_frame(self):
+        if self.__pkt is not None:
+            return str(self.__pkt)
+        return self.__frame
+
+    def __get_pkt(self):
+        if self.__pkt is None:
+            self.__pkt = self.__decoder(self.__frame)
+        return self.__pkt
+
+    def __set_pkt(self, pkt):
+        self.__pkt = pkt
+
+    pkt = property(__get_pkt, __set_pkt)
+
+
 class Packet(object):
 
     """
@@ -668,6 +709,252 @@ class Packet(object):
         return self.pktgen.strip_layer4(element)
 
 
+class PacketTemplate(object):
+
+    """
+    Build packet header once by Packet module, then generate packets by
+    stamping sequence, length and payload into copy of header bytes.
+    Only support ether/ipv4|ipv6/tcp|udp/raw packet types like TCP, UDP,
+    IPv6_TCP and IPv6_UDP. Sequence number is saved in layer3 source ip.
+    """
+
+    def __init__(self, pkt_type, layers_config=[]):
+        pkt = Packet(pkt_type=pkt_type, pkt_len=0)
+        for layer, config in layers_config:
+            pkt.config_layer(layer, config)
+
+        self.pkt_type = pkt_type
+        self.pkt_layers = pkt.pkt_layers
+        self.header = str(pkt.pktgen.pkt)
+        self.l3_off = len(self.header) - len(str(pkt.pktgen.pkt.getlayer(1)))
+        self.l4_off = len(self.header) - len(str(pkt.pktgen.pkt.getlayer(2)))
+        self.ipv6 = 'ipv6' in self.pkt_layers
+        if self.ipv6:
+            self.proto = ord(self.header[self.l3_off + 6])
+        else:
+            self.proto = ord(self.header[self.l3_off + 9])
+        # offset of checksum in tcp or udp header
+        if 'tcp' in self.pkt_layers:
+            self.chksum_off = self.l4_off + 16
+        else:
+            self.chksum_off = self.l4_off + 6
+
+    def generate(self, seq, pkt_len):
+        """
+        Return Packet object of given length, length includes crc.
+        """
+        payload_len = max(pkt_len - len(self.header) - 4, 0)
+        buf = bytearray(self.header)
+        buf.extend(os.urandom(payload_len))
+        l3_off = self.l3_off
+        l4_off = self.l4_off
+        l4_len = len(buf) - l4_off
+
+        if self.ipv6:
+            struct.pack_into('!H', buf, l3_off + 4, l4_len)
+            struct.pack_into('!QQ', buf, l3_off + 8, seq >> 64,
+                             seq & ((1 << 64) - 1))
+            pseudo = str(buf[l3_off + 8:l3_off + 40]) + \
+                struct.pack('!IxxxB', l4_len, self.proto)
+        else:
+            ihl = (buf[l3_off] & 0xf) * 4
+            struct.pack_into('!H', buf, l3_off + 2, len(buf) - l3_off)
+            struct.pack_into('!I', buf, l3_off + 12, seq)
+            struct.pack_into('!H', buf, l3_off + 10, 0)
+            struct.pack_into('=H', buf, l3_off + 10,
+                             checksum(buf[l3_off:l3_off + ihl]))
+            pseudo = str(buf[l3_off + 12:l3_off + 20]) + \
+                struct.pack('!xBH', self.proto, l4_len)
+
+        if 'udp' in self.pkt_layers:
+            struct.pack_into('!H', buf, l4_off + 4, l4_len)
+        struct.pack_into('!H', buf, self.chksum_off, 0)
+        chksum = checksum(pseudo + str(buf[l4_off:]))
+        if chksum == 0 and 'udp' in self.pkt_layers:
+            chksum = 0xffff
+        struct.pack_into('=H', buf, self.chksum_off, chksum)
+
+        pkt = raw_packet(str(buf), pkt_type=self.pkt_type)
+        pkt.pkt_len = pkt_len
+        return pkt
+
+
+def raw_packet(frame, **options):
+    """
+    Return Packet object of raw frame, scapy template creation of Packet
+    constructor is bypassed and frame will be decoded when accessed.
+    """
+    pkt = Packet.__new__(Packet)
+    pkt.pkt_opts = options
+    pkt.pkt_type = options.get('pkt_type', 'UDP')
+    pkt.pkt_layers = Packet.def_packet.get(pkt.pkt_type,
+                                           {'layers': []})['layers']
+    pkt.pkt_cfgload = True
+    pkt.pkt_len = len(frame) + 4
+    pkt.uni_name = '/tmp/' + str(uuid4()) + '.pcap'
+    pkt.configured_layer_raw = True
+    pkt.pktgen = raw_scapy(frame, options.get('decoder', Ether))
+    return pkt
+
+
+def checksum(data):
+    """
+    Internet checksum of data, result is in host byte order of data words.
+    """
+    data = str(data)
+    if len(data) % 2:
+        data += '\0'
+    total = sum(array.array('H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def write_pcap(filename, frames, linktype=1):
+    """
+    Write raw frames into pcap file without scapy decoding.
+    """
+    now = time.time()
+    sec = int(now)
+    usec = int((now - sec) * 1000000)
+    with open(filename, 'wb') as f:
+        f.write(struct.pack('=IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535,
+                            linktype))
+        for frame in frames:
+            f.write(struct.pack('=IIII', sec, usec, len(frame), len(frame)))
+            f.write(frame)
+
+
+def iter_pcap_frames(filename):
+    """
+    Generator of raw frames in pcap file, truncated record will be ignored.
+    """
+    for _, frame in iter_pcap_records(filename):
+        yield frame
+
+
+def iter_pcap_records(filename):
+    """
+    Generator of (link type, raw frame) in pcap file.
+    """
+    try:
+        f = open(filename, 'rb')
+    except IOError:
+        return
+
+    with f:
+        header = f.read(24)
+        if len(header) < 24:
+            return
+        magic = struct.unpack('<I', header[:4])[0]
+        if magic in (0xa1b2c3d4, 0xa1b23c4d):
+            endian = '<'
+        elif magic in (0xd4c3b2a1, 0x4d3cb2a1):
+            endian = '>'
+        else:
+            return
+
+        linktype = struct.unpack(endian + 'I', header[20:24])[0]
+        record = endian + 'IIII'
+        while True:
+            rec_hdr = f.read(16)
+            if len(rec_hdr) < 16:
+                return
+            _, _, caplen, _ = struct.unpack(record, rec_hdr)
+            frame = f.read(caplen)
+            if len(frame) < caplen:
+                return
+            yield linktype, frame
+
+
+def frame_offsets(frame):
+    """
+    Return (l3 type, l3 offset, l4 offset) of ethernet frame, vlan tags are
+    skipped. Offset will be None when the layer can't be located.
+    """
+    l3_off = 14
+    if len(frame) < l3_off:
+        return None, None, None
+    l3_type = struct.unpack('!H', frame[12:14])[0]
+    # 802.1Q, 802.1ad and QinQ tags
+    while l3_type in (0x8100, 0x88a8, 0x9100) and len(frame) >= l3_off + 4:
+        l3_type = struct.unpack('!H', frame[l3_off + 2:l3_off + 4])[0]
+        l3_off += 4
+
+    l4_off = None
+    if l3_type == 0x0800 and len(frame) >= l3_off + 20:
+        l4_off = l3_off + (ord(frame[l3_off]) & 0xf) * 4
+    elif l3_type == 0x86dd and len(frame) >= l3_off + 40:
+        l4_off = l3_off + 40
+
+    return l3_type, l3_off, l4_off
+
+
+def frame_sequence(frame):
+    """
+    Return sequence number saved in layer3 source ip by PacketTemplate.
+    """
+    l3_type, l3_off, l4_off = frame_offsets(frame)
+    if l4_off is None:
+        return None
+    if l3_type == 0x0800:
+        return struct.unpack('!I', frame[l3_off + 12:l3_off + 16])[0]
+    high, low = struct.unpack('!QQ', frame[l3_off + 8:l3_off + 24])
+    return (high << 64) | low
+
+
+def frame_layer(frame, layer="L2"):
+    """
+    Return bytes of frame from the start of layer.
+    """
+    if layer == "L2":
+        return frame
+    _, l3_off, l4_off = frame_offsets(frame)
+    if layer == "L3":
+        return frame[l3_off:] if l3_off is not None else None
+    return frame[l4_off:] if l4_off is not None else None
+
+
+class PacketComparator(object):
+
+    """
+    Index digests of sent packets and match received frames to them, no
+    scapy decoding is required.
+    """
+
+    def __init__(self, pkts, layer="L2"):
+        self.layer = layer
+        self.digests = []
+        self.index = {}
+        for idx, pkt in enumerate(pkts):
+            digest = self.digest(pkt.pktgen.get_frame())
+            self.digests.append(digest)
+            self.index.setdefault(digest, idx)
+
+    def digest(self, frame):
+        load = frame_layer(frame, self.layer)
+        if load is None:
+            return None
+        return hashlib.md5(load).digest()
+
+    def lookup(self, frame):
+        """
+        Return index of sent packet which matched frame, None if not found.
+        """
+        digest = self.digest(frame)
+        if digest is None:
+            return None
+        return self.index.get(digest)
+
+    def match(self, frame, idx):
+        """
+        Check frame matched the sent packet of index.
+        """
+        if idx < 0 or idx >= len(self.digests):
+            return False
+        return self.digest(frame) == self.digests[idx]
+
+
 def IncreaseIP(addr):
     """
     Returns the IP address from a given one, like
@@ -698,15 +985,60 @@ def send_packets(intf, pkts=None, interval=0.01):
     send_pkts = []
     try:
         for pkt in pkts:
-            send_pkts.append(pkt.pktgen.pkt)
+            # no need to decode packet generated from template
+            if isinstance(pkt.pktgen, raw_scapy):
+                send_pkts.append(Raw(load=pkt.pktgen.get_frame()))
+            else:
+                send_pkts.append(pkt.pktgen.pkt)
         sendp(send_pkts, iface=intf, inter=interval, verbose=False)
     except:
         pass
 
 
+def transmit_packets(intf_pkts, rate=None):
+    """
+    Send packets of several interfaces concurrently from this process. Each
+    interface has one raw socket and serialized frames are sent in batches.
+    rate is packets per second of each interface, unlimited when None.
+    Return send statistics (sent, errors, achieved pps) by interface.
+    """
+    senders = {}
+    results = {}
+    for intf, pkts in intf_pkts.items():
+        frames = [pkt.pktgen.get_frame() for pkt in pkts]
+        if not frames:
+            continue
+        try:
+            senders[intf] = BulkSender(intf, frames)
+        except Exception as e:
+            results[intf] = {'sent': 0, 'errors': 1, 'last_error': str(e),
+                             'pps': 0}
+
+    def transmit(sender):
+        sender.run(pps=rate, count=len(sender.frames))
+        return sender.stats()
+
+    intfs = senders.keys()
+    outputs = run_concurrently([lambda s=senders[intf]: transmit(s)
+                                for intf in intfs])
+    for intf, (stats, exc_info) in zip(intfs, outputs):
+        senders[intf].close()
+        if exc_info is not None:
+            stats = senders[intf].stats()
+            stats['errors'] += 1
+            stats['last_error'] = str(exc_info[1])
+        results[intf] = stats
+
+    return results
+
+
 def save_packets(pkts=None, filename=None):
     save_pkts = []
     try:
+        if filename and all([isinstance(pkt.pktgen, raw_scapy)
+                             for pkt in pkts]):
+            write_pcap(filename, [pkt.pktgen.get_frame() for pkt in pkts])
+            return
         for pkt in pkts:
             save_pkts.append(pkt.pktgen.pkt)
         if filename:
@@ -768,10 +1100,14 @@ def get_filter_cmd(filters=[]):
         return ""
 
 
-def sniff_packets(intf, count=0, timeout=5, filters=[]):
+def get_tcpdump_direction():
     """
-    sniff all packets for certain port in certain seconds
+    Return tcpdump parameter for capturing incoming packets only.
     """
+    global TCPDUMP_DIRECTION
+    if TCPDUMP_DIRECTION is not None:
+        return TCPDUMP_DIRECTION
+
     param = ""
     direct_param = r"(\s+)\[ -(\w) in\|out\|inout \]"
     tcpdump_help = subprocess.check_output("tcpdump -h; echo 0",
@@ -785,6 +1121,75 @@ def sniff_packets(intf, count=0, timeout=5, filters=[]):
     if len(param) == 0:
         print "tcpdump not support direction chioce!!!"
 
+    TCPDUMP_DIRECTION = param
+    return param
+
+
+class SniffCapture(object):
+
+    """
+    Background tcpdump capture on one interface. Readiness and exit of
+    tcpdump are detected by monitoring its stderr.
+    """
+
+    def __init__(self, intf, cmd, filename, timeout):
+        self.intf = intf
+        self.filename = filename
+        self.timeout = timeout
+        # thread of test case which started the capture
+        self.owner = threading.current_thread().ident
+        self.messages = []
+        self.ready = threading.Event()
+        self.exited = threading.Event()
+        self.start = time.time()
+        self.pipe = subprocess.Popen(shlex.split(cmd), stderr=subprocess.PIPE)
+        self.monitor = threading.Thread(target=self.__monitor)
+        self.monitor.daemon = True
+        self.monitor.start()
+
+    def __monitor(self):
+        for line in iter(self.pipe.stderr.readline, ''):
+            self.messages.append(line)
+            if 'listening on' in line:
+                self.ready.set()
+        self.pipe.wait()
+        # wake up waiter when tcpdump failed to start
+        self.ready.set()
+        self.exited.set()
+
+    def wait_ready(self, timeout=5):
+        """
+        Wait until tcpdump is listening on interface.
+        """
+        self.ready.wait(timeout)
+        return self.ready.is_set() and not self.exited.is_set()
+
+    def stop(self, wait=True):
+        """
+        Wait capture finished until timeout then interrupt tcpdump, return
+        captured pcap file.
+        """
+        if wait:
+            remaining = self.timeout - (time.time() - self.start)
+            if remaining > 0:
+                self.exited.wait(remaining)
+
+        if not self.exited.is_set():
+            self.pipe.send_signal(signal.SIGINT)
+            self.exited.wait(5)
+        if not self.exited.is_set():
+            self.pipe.kill()
+            self.exited.wait()
+
+        return self.filename
+
+
+def sniff_packets(intf, count=0, timeout=5, filters=[]):
+    """
+    sniff all packets for certain port in certain seconds
+    """
+    param = get_tcpdump_direction()
+
     if LLDP_FILTER not in filters:
         filters.append(LLDP_FILTER)
 
@@ -800,56 +1205,88 @@ def sniff_packets(intf, count=0, timeout=5, filters=[]):
     else:
         cmd = sniff_cmd % options
 
-    args = shlex.split(cmd)
-
-    pipe = subprocess.Popen(args)
-    index = str(time.time())
-    SNIFF_PIDS[index] = (pipe, intf, timeout)
-    time.sleep(0.5)
+    # only one capture on each interface as they share the same file
+    with SNIFF_LOCK:
+        for index, capture in SNIFF_PIDS.items():
+            if capture.intf == intf:
+                capture.stop(wait=False)
+                SNIFF_PIDS.pop(index)
+
+    capture = SniffCapture(intf, cmd, options['FILE'], timeout)
+    if not capture.wait_ready():
+        print "tcpdump failed to listen on %s: %s" % \
+            (intf, ''.join(capture.messages).strip())
+    index = "%s_%s" % (time.time(), intf)
+    with SNIFF_LOCK:
+        SNIFF_PIDS[index] = capture
     return index
 
 
+def stop_sniff_packets(index=''):
+    """
+    Wait sniff process finished or timeout, return captured pcap file.
+    """
+    if index not in SNIFF_PIDS.keys():
+        return None
+
+    return SNIFF_PIDS[index].stop()
+
+
+def stop_all_sniff(all_threads=False):
+    """
+    Stop background captures started by current thread, called when test
+    case finished. Captures of cases running in other threads are kept
+    unless all_threads is True.
+    """
+    owner = threading.current_thread().ident
+    with SNIFF_LOCK:
+        captures = [SNIFF_PIDS.pop(index) for index, capture in
+                    SNIFF_PIDS.items()
+                    if all_threads or capture.owner == owner]
+    for capture in captures:
+        capture.stop(wait=False)
+
+
+def iter_sniff_packets(index=''):
+    """
+    Generator of sniffed packets, frames are decoded only when accessed.
+    """
+    filename = stop_sniff_packets(index)
+    if filename is None:
+        return
+
+    intf = SNIFF_PIDS[index].intf
+    for packet in iter_pcapfile(filename, tx_port=intf):
+        yield packet
+
+
 def load_sniff_packets(index=''):
     pkts = []
-    child_exit = False
-    if index in SNIFF_PIDS.keys():
-        pipe, intf, timeout = SNIFF_PIDS[index]
-        time_elapse = int(time.time() - float(index))
-        while time_elapse < timeout:
-            if pipe.poll() is not None:
-                child_exit = True
-                break
-
-            time.sleep(1)
-            time_elapse += 1
-
-        if not child_exit:
-            pipe.send_signal(signal.SIGINT)
-            pipe.wait()
-
-        # wait pcap file ready
-        time.sleep(1)
-        try:
-            cap_pkts = rdpcap("/tmp/sniff_%s.pcap" % intf)
-            for pkt in cap_pkts:
-                # packet gen should be scapy
-                packet = Packet(tx_port=intf)
-                packet.pktgen.assign_pkt(pkt)
-                pkts.append(packet)
-        except:
-            pass
+    try:
+        for packet in iter_sniff_packets(index):
+            pkts.append(packet)
+    except:
+        pass
 
     return pkts
 
 
+def iter_pcapfile(filename="", **options):
+    """
+    Generator of packets in pcap file, frames are decoded only when accessed.
+    """
+    for linktype, frame in iter_pcap_records(filename):
+        try:
+            decoder = conf.l2types[linktype]
+        except KeyError:
+            decoder = Raw
+        yield raw_packet(frame, decoder=decoder, **options)
+
+
 def load_pcapfile(filename=""):
     pkts = []
     try:
-        cap_pkts = rdpcap(filename)
-        for pkt in cap_pkts:
-            # packet gen should be scapy
-            packet = Packet()
-            packet.pktgen.assign_pkt(pkt)
+        for packet in iter_pcapfile(filename):
             pkts.append(packet)
     except:
         pass
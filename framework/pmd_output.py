@@ -34,6 +34,15 @@ import re
 from settings import TIMEOUT, PROTOCOL_PACKET_SIZE, get_nic_driver
 from utils import create_mask
 
+# testpmd statistics patterns, compiled once
+PMD_STATS_HEADER = re.compile(r"NIC statistics for port (\d+)")
+PMD_XSTATS_HEADER = re.compile(r"NIC extended statistics for port (\d+)")
+PMD_COUNTER = re.compile(r"([A-Za-z][\w-]*):\s+([0-9]+)")
+PMD_XSTAT = re.compile(r"^\s*(\S+):\s+([0-9]+)\s*$", re.M)
+PMD_STATS_KEYS = ["RX-packets", "RX-missed", "RX-bytes", "RX-badcrc",
+                  "RX-badlen", "RX-errors", "RX-nombuf", "TX-packets",
+                  "TX-errors", "TX-bytes", "Bad-ipcsum", "Bad-l4csum"]
+
 
 class PmdOutput():
 
@@ -56,10 +65,14 @@ class PmdOutput():
         self.tx_bytes_prefix = "TX-bytes:"
         self.bad_ipcsum_prefix = "Bad-ipcsum:"
         self.bad_l4csum_prefix = "Bad-l4csum:"
+        self.value_patterns = {}
+        self.last_stats = {}
         self.set_default_corelist()
 
     def get_pmd_value(self, prefix, out):
-        pattern = re.compile(prefix + "(\s+)([0-9]+)")
+        if prefix not in self.value_patterns:
+            self.value_patterns[prefix] = re.compile(prefix + "(\s+)([0-9]+)")
+        pattern = self.value_patterns[prefix]
         m = pattern.search(out)
         if m is None:
             return None
@@ -76,26 +89,80 @@ class PmdOutput():
         else:
             self.default_cores = "1S/2C/1T"
 
-    def get_pmd_stats(self, portid):
+    def parse_pmd_stats(self, out):
+        """
+        Parse counters of one port statistics section.
+        """
+        counters = dict(PMD_COUNTER.findall(out))
         stats = {}
-        out = self.dut.send_expect("show port stats %d" % portid, "testpmd> ")
-        stats["RX-packets"] = self.get_pmd_value(self.rx_pkts_prefix, out)
-        stats["RX-missed"] = self.get_pmd_value(self.rx_missed_prefix, out)
-        stats["RX-bytes"] = self.get_pmd_value(self.rx_bytes_prefix, out)
-
-        stats["RX-badcrc"] = self.get_pmd_value(self.rx_badcrc_prefix, out)
-        stats["RX-badlen"] = self.get_pmd_value(self.rx_badlen_prefix, out)
-        stats["RX-errors"] = self.get_pmd_value(self.rx_error_prefix, out)
-        stats["RX-nombuf"] = self.get_pmd_value(self.rx_nombuf_prefix, out)
-        stats["TX-packets"] = self.get_pmd_value(self.tx_pkts_prefix, out)
-        stats["TX-errors"] = self.get_pmd_value(self.tx_error_prefix, out)
-        stats["TX-bytes"] = self.get_pmd_value(self.tx_bytes_prefix, out)
-
-        # display when testpmd config forward engine to csum
-        stats["Bad-ipcsum"] = self.get_pmd_value(self.bad_ipcsum_prefix, out)
-        stats["Bad-l4csum"] = self.get_pmd_value(self.bad_l4csum_prefix, out)
+        for key in PMD_STATS_KEYS:
+            stats[key] = int(counters[key]) if key in counters else None
         return stats
 
+    def split_port_sections(self, header, out):
+        """
+        Split output of all ports command into sections by port id.
+        """
+        sections = {}
+        matches = list(header.finditer(out))
+        for index, m in enumerate(matches):
+            end = matches[index + 1].start() if index + 1 < len(matches) \
+                else len(out)
+            sections[int(m.group(1))] = out[m.end():end]
+        return sections
+
+    def get_pmd_stats(self, portid):
+        out = self.dut.send_expect("show port stats %d" % portid, "testpmd> ")
+        # display Bad-ipcsum/Bad-l4csum when testpmd config forward engine
+        # to csum
+        return self.parse_pmd_stats(out)
+
+    def get_all_pmd_stats(self, xstats=False):
+        """
+        Return statistics of all ports indexed by port id, fetched by one
+        command. Extended statistics are saved in 'xstats' of each port when
+        required.
+        """
+        out = self.dut.send_expect("show port stats all", "testpmd> ")
+        all_stats = {}
+        for portid, section in self.split_port_sections(PMD_STATS_HEADER,
+                                                         out).items():
+            all_stats[portid] = self.parse_pmd_stats(section)
+
+        if xstats:
+            out = self.dut.send_expect("show port xstats all", "testpmd> ")
+            for portid, section in self.split_port_sections(PMD_XSTATS_HEADER,
+                                                             out).items():
+                if portid in all_stats:
+                    all_stats[portid]['xstats'] = dict(
+                        (name, int(value))
+                        for name, value in PMD_XSTAT.findall(section))
+        return all_stats
+
+    def get_pmd_stats_delta(self, xstats=False):
+        """
+        Return changes of all ports statistics since last snapshot taken by
+        this function, the first call returns changes since zero.
+        """
+        all_stats = self.get_all_pmd_stats(xstats)
+        delta = {}
+        for portid, stats in all_stats.items():
+            last = self.last_stats.get(portid, {})
+            delta[portid] = self.stats_delta(stats, last)
+        self.last_stats = all_stats
+        return delta
+
+    def stats_delta(self, stats, last):
+        delta = {}
+        for key, value in stats.items():
+            if key == 'xstats':
+                delta[key] = self.stats_delta(value, last.get(key, {}))
+            elif value is None:
+                delta[key] = None
+            else:
+                delta[key] = value - (last.get(key) or 0)
+        return delta
+
     def get_pmd_cmd(self):
         return self.command
 
@@ -171,7 +238,32 @@ class PmdOutput():
         """
         Get the specified port link status now.
         """
-        return self.get_detail_from_port_info("Link status: ", "\d+", port_id)
+        return self.get_detail_from_port_info("Link status: ", "\S+", port_id)
+
+    def wait_link_status(self, port_id, status='up', timeout=10):
+        """
+        Wait until the specified port link status changed to status.
+        """
+        return self.dut.wait_until(
+            lambda: self.get_port_link_status(port_id) == status,
+            timeout, "port %d link %s" % (port_id, status))
+
+    def wait_stats_stable(self, timeout=10):
+        """
+        Wait until received packets of all ports stop changing, return the
+        last statistics.
+        """
+        history = [self.get_all_pmd_stats()]
+
+        def stable():
+            history.append(self.get_all_pmd_stats())
+            last, now = history[-2:]
+            return all(now[port]['RX-packets'] ==
+                       last.get(port, {}).get('RX-packets')
+                       for port in now)
+
+        self.dut.wait_until(stable, timeout, "statistics stable")
+        return history[-1]
 
     def get_port_link_speed(self, port_id):
         """
@@ -0,0 +1,185 @@
+# BSD LICENSE
+#
+# Copyright(c) 2010-2017 Intel Corporation. All rights reserved.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of Intel Corporation nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Profiler of test case execution. Wall time of each phase is recorded per
+case, and time blocked in ssh round trips, file copies, builds, VM boots
+and sleeps is attributed to the case running in the same thread.
+"""
+
+import json
+import time
+import threading
+
+OVERHEAD_SSH = 'ssh'
+OVERHEAD_SSH_READ = 'ssh_read'
+OVERHEAD_COPY = 'copy'
+OVERHEAD_BUILD = 'build'
+OVERHEAD_VM_BOOT = 'vm_boot'
+OVERHEAD_SLEEP = 'sleep'
+
+
+class _PhaseSpan(object):
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add_phase(self.name, time.time() - self.start)
+        return False
+
+
+class _OverheadSpan(object):
+
+    def __init__(self, profiler, category):
+        self.profiler = profiler
+        self.category = category
+
+    def __enter__(self):
+        local = self.profiler.local
+        self.outer = getattr(local, 'depth', 0) == 0
+        local.depth = getattr(local, 'depth', 0) + 1
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.local.depth -= 1
+        # build will do ssh round trips, only outermost one is counted
+        if self.outer:
+            self.profiler.add_overhead(self.category,
+                                       time.time() - self.start)
+        return False
+
+
+class Profiler(object):
+
+    """
+    Per thread timing collector. Timing of one case starts by start_case
+    and returned by end_case, phases and overheads are recorded by spans:
+
+        with profiler.phase('set_up'):
+            ...
+        with profiler.overhead(OVERHEAD_SSH):
+            ...
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def start_case(self, suite, case):
+        self.local.case = {'suite': suite,
+                           'case': case,
+                           'start': time.time(),
+                           'phases': {},
+                           'overheads': {}}
+
+    def end_case(self):
+        """
+        Finish timing of current case and return it.
+        """
+        timing = getattr(self.local, 'case', None)
+        if timing is None:
+            return None
+        self.local.case = None
+        timing['total'] = time.time() - timing.pop('start')
+        return timing
+
+    def phase(self, name):
+        return _PhaseSpan(self, name)
+
+    def overhead(self, category):
+        return _OverheadSpan(self, category)
+
+    def sleep(self, seconds):
+        """
+        Sleep and count it as overhead of current case.
+        """
+        with self.overhead(OVERHEAD_SLEEP):
+            time.sleep(seconds)
+
+    def add_phase(self, name, seconds):
+        timing = getattr(self.local, 'case', None)
+        if timing is not None:
+            phases = timing['phases']
+            phases[name] = phases.get(name, 0) + seconds
+
+    def add_overhead(self, category, seconds):
+        timing = getattr(self.local, 'case', None)
+        if timing is None:
+            return
+        stat = timing['overheads'].setdefault(
+            category, {'count': 0, 'time': 0.0, 'max': 0.0})
+        stat['count'] += 1
+        stat['time'] += seconds
+        stat['max'] = max(stat['max'], seconds)
+
+
+profiler = Profiler()
+
+
+def summarize_timings(timings, top=10):
+    """
+    Return the slowest cases and overheads of all cases sorted by time.
+    """
+    slowest = sorted(timings, key=lambda timing: timing['total'],
+                     reverse=True)[:top]
+    overheads = {}
+    for timing in timings:
+        for category, stat in timing['overheads'].items():
+            total = overheads.setdefault(
+                category, {'count': 0, 'time': 0.0, 'max': 0.0})
+            total['count'] += stat['count']
+            total['time'] += stat['time']
+            total['max'] = max(total['max'], stat['max'])
+    overheads = sorted(overheads.items(), key=lambda item: item[1]['time'],
+                       reverse=True)
+    return slowest, overheads
+
+
+class TimingReporter(object):
+
+    """
+    Save timing of all cases in json format. It makes use of a Result
+    instance as input.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def save(self, result):
+        with open(self.filename, "w") as timing_file:
+            json.dump(result.all_case_timings(), timing_file, indent=4,
+                      sort_keys=True)
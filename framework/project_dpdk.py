@@ -31,9 +31,15 @@
 
 import os
 import re
+import time
+import hashlib
 
 from settings import NICS, load_global_setting, accepted_nic
 from settings import DPDK_RXMODE_SETTING, HOST_DRIVER_SETTING
+from settings import DPDK_BUILD_CACHE, DPDK_BUILD_CACHE_SIZE
+from settings import PKG_SYNC_SETTING
+from package_sync import PackageSync
+from profiler import profiler, OVERHEAD_BUILD
 from ssh_connection import SSHConnection
 from crb import Crb
 from dut import Dut
@@ -42,6 +48,9 @@ from logger import getLogger
 from settings import IXIA, DRIVERS
 
 
+BUILD_KEY_FILE = '.dts_build_key'
+
+
 class DPDKdut(Dut):
 
     """
@@ -52,6 +61,11 @@ class DPDKdut(Dut):
     def __init__(self, crb, serializer):
         super(DPDKdut, self).__init__(crb, serializer)
         self.testpmd = None
+        # build time of each target
+        self.build_time = {}
+        # build key of targets in current source tree
+        self.built_targets = {}
+        self.package_hash = None
 
     def set_target(self, target, bind_dev=True):
         """
@@ -69,16 +83,11 @@ class DPDKdut(Dut):
         self.send_expect("export RTE_TARGET=" + target, "#")
         self.send_expect("export RTE_SDK=`pwd`", "#")
 
-        self.set_rxtx_mode()
+        self.set_build_config()
 
-        # Enable MLNX driver before installing dpdk
         drivername = load_global_setting(HOST_DRIVER_SETTING)
-        if drivername == DRIVERS['ConnectX4']:
-            self.send_expect("sed -i -e 's/CONFIG_RTE_LIBRTE_MLX5_PMD=n/"
-                             + "CONFIG_RTE_LIBRTE_MLX5_PMD=y/' config/common_base", "# ", 30)
-
         if not self.skip_setup:
-            self.build_install_dpdk(target)
+            self.build_install_dpdk(target, use_cache=True)
 
         self.setup_memory()
         self.setup_modules(target)
@@ -130,6 +139,18 @@ class DPDKdut(Dut):
         out = self.send_expect("kldstat", "#")
         assert ("nic_uio" in out), "Failed to insmod nic_uio"
 
+    def set_build_config(self):
+        """
+        Modify DPDK build configuration according to global settings.
+        """
+        self.set_rxtx_mode()
+
+        # Enable MLNX driver before installing dpdk
+        drivername = load_global_setting(HOST_DRIVER_SETTING)
+        if drivername == DRIVERS['ConnectX4']:
+            self.send_expect("sed -i -e 's/CONFIG_RTE_LIBRTE_MLX5_PMD=n/"
+                             + "CONFIG_RTE_LIBRTE_MLX5_PMD=y/' config/common_base", "# ", 30)
+
     def set_rxtx_mode(self):
         """
         Set default RX/TX PMD function,
@@ -160,13 +181,172 @@ class DPDKdut(Dut):
     def set_package(self, pkg_name="", patch_list=[]):
         self.package = pkg_name
         self.patches = patch_list
+        self.package_hash = None
+
+    def build_install_dpdk(self, target, extra_options='', use_cache=False):
+        """
+        Build DPDK source code with specified target. When use_cache is set,
+        the build of the same package and options will be reused.
+        """
+        key = None
+        start = time.time()
+        if use_cache and self.get_os_type() == 'linux':
+            key = self.get_build_key(target, extra_options)
+            if self.built_targets.get(target) == key:
+                self.logger.info("Target %s has been built" % target)
+                return
+            if self.restore_build(target, key):
+                self.build_time[target] = time.time() - start
+                return
+
+        # source tree may be modified, target no longer matches any key
+        self.built_targets.pop(target, None)
+        self.send_expect("rm -f %s/%s" % (target, BUILD_KEY_FILE), "# ")
+        build_install_dpdk = getattr(self, 'build_install_dpdk_%s' % self.get_os_type())
+        with profiler.overhead(OVERHEAD_BUILD):
+            build_install_dpdk(target, extra_options)
+        self.build_time[target] = time.time() - start
+
+        if key is not None:
+            self.save_build(target, key)
 
-    def build_install_dpdk(self, target, extra_options=''):
+    def prebuild_targets(self, targets):
         """
-        Build DPDK source code with specified target.
+        Build all targets concurrently, cores of DUT will be shared by all
+        builds. Targets failed in concurrent build will be built again when
+        set_target.
         """
-        build_install_dpdk = getattr(self, 'build_install_dpdk_%s' % self.get_os_type())
-        build_install_dpdk(target, extra_options)
+        if self.skip_setup or self.get_os_type() != 'linux':
+            return
+
+        self.set_build_config()
+
+        builds = []
+        for target in targets:
+            key = self.get_build_key(target, '')
+            if not self.restore_build(target, key):
+                builds.append((target, key))
+
+        if len(builds) < 2:
+            return
+
+        build_time = 300
+        jobs = max(1, self.number_of_cores / len(builds))
+        cmds = []
+        for target, _ in builds:
+            if "icc" in target:
+                build_time = 900
+            self.send_expect("rm -rf " + target, "#")
+            cmd = "SECONDS=0; cd %s && " % self.base_dir
+            toolchain_env = self.get_toolchain_env(target)
+            if toolchain_env:
+                cmd += toolchain_env + " && "
+            cmd += "make -j %d install T=%s 2>&1 | tail -n 30; " % (jobs, target)
+            cmd += "echo BUILD_SECONDS=$SECONDS"
+            cmds.append(cmd)
+
+        self.send_expect("rm -rf %s" % r'./app/test/test_resource_c.res.o' , "#")
+        self.send_expect("rm -rf %s" % r'./app/test/test_resource_tar.res.o' , "#")
+        self.send_expect("rm -rf %s" % r'./app/test/test_pci_sysfs.res.o' , "#")
+
+        self.logger.info("Build targets %s concurrently with %d jobs each"
+                         % (', '.join([t for t, _ in builds]), jobs))
+        outs = self.run_parallel(cmds, "# ", build_time)
+
+        for (target, key), out in zip(builds, outs):
+            if "Error" in out or "No rule to make" in out:
+                self.logger.warning("Concurrent build of %s failed" % target)
+                continue
+
+            start = time.time()
+            self.set_toolchain(target)
+            self.build_install_dpdk_test_app(target, build_time)
+            seconds = re.search(r"BUILD_SECONDS=(\d+)", out)
+            self.build_time[target] = time.time() - start
+            if seconds:
+                self.build_time[target] += int(seconds.group(1))
+            self.save_build(target, key)
+
+    def get_package_hash(self):
+        """
+        Hash of package and patches content.
+        """
+        if self.package_hash is None:
+            md5 = hashlib.md5()
+            files = [self.package]
+            if self.patches is not None:
+                files += ['dep/' + p for p in self.patches]
+            for name in files:
+                with open(name, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 20), ''):
+                        md5.update(chunk)
+            self.package_hash = md5.hexdigest()
+        return self.package_hash
+
+    def get_build_key(self, target, extra_options):
+        """
+        Generate key of DPDK build by package, patches, build configuration,
+        target and extra options.
+        """
+        package_hash = self.get_package_hash()
+
+        out = self.send_expect("find config -type f | sort | xargs cat | md5sum",
+                               "# ", 30)
+        config_hash = out.split()[0]
+
+        key = "%s-%s-%s-%s" % (package_hash, config_hash, target,
+                               extra_options)
+        return hashlib.md5(key).hexdigest()
+
+    def restore_build(self, target, key):
+        """
+        Restore target from build cache, return True when target is ready.
+        """
+        if self.built_targets.get(target) == key:
+            self.logger.info("Target %s has been built" % target)
+            return True
+
+        # target folder kept in persistent source tree
+        out = self.send_expect("cat %s/%s" % (target, BUILD_KEY_FILE), "# ",
+                               verify=True)
+        if type(out) is not int and out.strip() == key:
+            self.logger.info("Target %s has been built" % target)
+            self.built_targets[target] = key
+            return True
+
+        cache = "%s/%s" % (DPDK_BUILD_CACHE, key)
+        out = self.send_expect("ls -d %s" % cache, "# ", verify=True)
+        if type(out) is int and out != 0:
+            return False
+
+        out = self.send_expect("rm -rf %s && cp -a %s %s && touch %s" %
+                               (target, cache, target, cache),
+                               "# ", 120, verify=True)
+        if type(out) is int and out != 0:
+            self.logger.warning("Failed to restore target %s from cache" % target)
+            return False
+
+        self.logger.info("Target %s restored from build cache" % target)
+        self.built_targets[target] = key
+        return True
+
+    def save_build(self, target, key):
+        """
+        Save target into build cache and only keep latest used builds.
+        """
+        cache = "%s/%s" % (DPDK_BUILD_CACHE, key)
+        self.send_expect("echo %s > %s/%s" % (key, target, BUILD_KEY_FILE), "# ")
+        out = self.send_expect("mkdir -p %s && rm -rf %s %s.tmp && "
+                               "cp -a %s %s.tmp && mv %s.tmp %s" %
+                               (DPDK_BUILD_CACHE, cache, cache, target, cache,
+                                cache, cache), "# ", 120, verify=True)
+        if type(out) is int and out != 0:
+            self.logger.warning("Failed to save target %s into cache" % target)
+            return
+
+        self.send_expect("ls -dt %s/* | tail -n +%d | xargs rm -rf" %
+                         (DPDK_BUILD_CACHE, DPDK_BUILD_CACHE_SIZE + 1), "# ", 60)
+        self.built_targets[target] = key
 
     def build_install_dpdk_linux(self, target, extra_options):
         """
@@ -225,9 +405,9 @@ class DPDKdut(Dut):
         assert ("No rule to make" not in out), "No rule to make error..."
 
     def build_install_dpdk_test_app(self, target, build_time, os_type="linux"):
-        cmd_build_test = "make -j -C test/"
+        cmd_build_test = "make -j -C test/ RTE_SDK=`pwd` RTE_TARGET=%s" % target
         if os_type == "freebsd":
-            cmd_build_test = "make -j -C test/ CC=gcc48"
+            cmd_build_test += " CC=gcc48"
 
         self.send_expect(cmd_build_test, "# ", build_time)
         app_list = ['./test/test/test', './test/test-acl/testacl', './test/test-pipeline/testpipeline', './test/cmdline_test/cmdline_test']
@@ -248,7 +428,9 @@ class DPDKdut(Dut):
                 raise ValueError("Directiry %s or %s does not exist,"
                                  "please check params -d"
                                  % (p_dir, dst_dir))
-            self.session.copy_file_to(self.package, dst_dir)
+            sync = load_global_setting(PKG_SYNC_SETTING) == 'yes'
+            if not sync:
+                self.session.copy_file_to(self.package, dst_dir)
 
             # put patches to p_dir/patches/
             if (self.patches is not None):
@@ -260,8 +442,16 @@ class DPDKdut(Dut):
             # enable core dump
             self.send_expect("ulimit -c unlimited", "#")
 
+            if sync:
+                # only transfer changed files into persistent source tree
+                PackageSync(self, self.package, self.patches, self.base_dir,
+                            dst_dir).sync()
+                self.built_targets = {}
+                return
+
             # unpack the code and change to the working folder
             self.send_expect("rm -rf %s" % self.base_dir, "#")
+            self.built_targets = {}
 
             # unpack dpdk
             out = self.send_expect("tar zxf %s%s -C %s" %
@@ -338,7 +528,8 @@ class DPDKdut(Dut):
         Build dpdk sample applications.
         """
         build_dpdk_apps = getattr(self, 'build_dpdk_apps_%s' % self.get_os_type())
-        return build_dpdk_apps(folder, extra_options)
+        with profiler.overhead(OVERHEAD_BUILD):
+            return build_dpdk_apps(folder, extra_options)
 
     def build_dpdk_apps_linux(self, folder, extra_options):
         """
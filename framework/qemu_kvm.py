@@ -36,8 +36,12 @@ import os
 
 from virt_base import VirtBase
 from virt_base import ST_NOTSTART, ST_PAUSE, ST_RUNNING, ST_UNKNOWN
-from exception import StartVMFailedException
-from settings import get_host_ip
+from exception import StartVMFailedException, TimeoutException, QMPException
+from settings import get_host_ip, load_global_setting, USERNAME
+from settings import VM_IMAGE_CACHE, VM_IMAGE_CACHE_SETTING
+from virt_image import GoldenImage
+from qmp_client import QMPClient, ssh_relay_command, QMP, QGA
+from profiler import profiler
 
 # This name is derictly defined in the qemu guest serivce
 # So you can not change it except it is changed by the service
@@ -45,6 +49,13 @@ QGA_DEV_NAME = 'org.qemu.guest_agent.0'
 # This path defines an socket path on the host connected with
 # a specified VM
 QGA_SOCK_PATH_TEMPLATE = '/tmp/%(vm_name)s_qga0.sock'
+# This path defines QMP monitor socket path on the host
+QMP_SOCK_PATH_TEMPLATE = '/tmp/%(vm_name)s_qmp.sock'
+# VM status reported by QMP which stands for VM paused
+QMP_PAUSED_STATUS = ['paused', 'inmigrate', 'postmigrate', 'prelaunch',
+                     'finish-migrate', 'suspended', 'debug']
+# final status of migration
+MIGRATION_DONE_STATUS = ['completed', 'failed', 'cancelled']
 
 
 class QEMUKvm(VirtBase):
@@ -90,6 +101,15 @@ class QEMUKvm(VirtBase):
         # devices pass-through into vm
         self.pt_devices = []
         self.pci_maps = []
+        # disk images replaced by overlays of golden images
+        self.image_overlays = {}
+        # VM building golden image runs on its own overlay
+        self.golden_builder = False
+        # persistent client of QMP monitor and guest agent
+        self.qmp_sock_path = None
+        self.qmp_client = None
+        self.qmp_events = []
+        self.migration_mark = 0
 
         # default login user,password
         self.username = dut.crb['user']
@@ -109,6 +129,7 @@ class QEMUKvm(VirtBase):
         self.set_vm_qga()
         self.set_vm_daemon()
         self.set_vm_monitor()
+        self.set_vm_qmp()
 
         if not self.__default_nic:
             # add default control interface
@@ -130,8 +151,14 @@ class QEMUKvm(VirtBase):
         example:
             vcpus_pinned_to_vm = '1 2 3 4'
             taskset -c 1,2,3,4 qemu-boot-command-line
+        NUMA:
+        vcpus, emulator threads and hugepage memory will be allocated on
+        numa node of assigned devices when numa specified in cpu parameter.
         """
         self.vcpus_pinned_to_vm = ''
+        self.numa_request = {}
+        self.placement = {}
+        self.hugepage_mem = ''
 
         # initialize assigned PCI
         self.assigned_pcis = []
@@ -296,15 +323,31 @@ class QEMUKvm(VirtBase):
                         qemu-system-x86_64 -cpu help
         number: '4' #number of vcpus
         cpupin: '3 4 5 6' # host cpu list
+        numa: [auto | 0 | 1 ...] # allocate vcpus on numa node, auto means
+                                 # node of assigned devices or DUT ports
+        threads: '2' # vcpus on each physical core, default is 1
+        emulator: '1' # number of host cpus for emulator threads
         """
         if 'model' in options.keys() and \
                 options['model']:
             cpu_boot_line = '-cpu %s' % options['model']
             self.__add_boot_line(cpu_boot_line)
+        threads = int(options.get('threads') or 1)
         if 'number' in options.keys() and \
                 options['number']:
             smp_cmd_line = '-smp %d' % int(options['number'])
+            if threads > 1:
+                # guest sees sibling threads as host allocated
+                smp_cmd_line += ',sockets=1,cores=%d,threads=%d' % \
+                    (int(options['number']) / threads, threads)
             self.__add_boot_line(smp_cmd_line)
+        if 'numa' in options.keys() and \
+                options['numa']:
+            self.numa_request = {'numa': options['numa'],
+                                 'number': int(options.get('number') or 1),
+                                 'threads': threads,
+                                 'emulator':
+                                 int(options.get('emulator') or 1)}
         if 'cpupin' in options.keys() and \
                 options['cpupin']:
             self.vcpus_pinned_to_vm = str(options['cpupin'])
@@ -318,20 +361,47 @@ class QEMUKvm(VirtBase):
             self.__add_boot_line(mem_boot_line)
         if 'hugepage' in options.keys():
             if options['hugepage'] == 'yes':
-                mem_boot_huge = '-object memory-backend-file,' \
-                                + 'id=mem,size=%sM,mem-path=%s,share=on' \
-                                % (options['size'], self.host_dut.hugepage_path)
-
-                self.__add_boot_line(mem_boot_huge)
-                mem_boot_huge_opt = "-numa node,memdev=mem -mem-prealloc"
-                self.__add_boot_line(mem_boot_huge_opt)
+                # numa node of memory decided when VM started
+                self.hugepage_mem = options['size']
+
+    def prepare_image(self, set_target=True):
+        """
+        When guest image cache enabled, start VM from qcow2 overlay of golden
+        image which has DPDK built for target.
+        """
+        if load_global_setting(VM_IMAGE_CACHE_SETTING) != 'yes':
+            return
+        if not set_target or self.host_dut.skip_setup:
+            return
+        if self.golden_builder:
+            return
+        # backup VM of migration should share disk with source VM
+        if self.find_option_index('migration') is not None:
+            return
+
+        index = self.find_option_index('disk')
+        if index is None or 'file' not in self.params[index]['disk'][0]:
+            return
+
+        base_image = self.params[index]['disk'][0]['file']
+        golden = GoldenImage(self, base_image, self.host_dut.target)
+        image = golden.prepare()
+        if image is None:
+            self.host_logger.warning("Start VM %s from %s" %
+                                     (self.vm_name, base_image))
+            return
+
+        overlay = "%s/overlay_%s.qcow2" % (VM_IMAGE_CACHE, self.vm_name)
+        if golden.create_overlay(image, overlay):
+            self.image_overlays[base_image] = overlay
 
     def add_vm_disk(self, **options):
         """
         file: /home/image/test.img
         """
         if 'file' in options.keys():
-            disk_boot_line = '-drive file=%s' % options['file']
+            image = self.image_overlays.get(options['file'], options['file'])
+            disk_boot_line = '-drive file=%s' % image
             self.__add_boot_line(disk_boot_line)
 
     def add_vm_login(self, **options):
@@ -785,6 +855,28 @@ class QEMUKvm(VirtBase):
         else:
             self.monitor_sock_path = None
 
+    def set_vm_qmp(self):
+        """
+        Set VM boot option to enable QMP monitor.
+        """
+        path = QMP_SOCK_PATH_TEMPLATE % {'vm_name': self.vm_name}
+        index = self.find_option_index('qmp')
+        if index:
+            self.params[index] = {'qmp': [{'path': path}]}
+        else:
+            self.params.append({'qmp': [{'path': path}]})
+
+    def add_vm_qmp(self, **options):
+        """
+        path: unix socket path of QMP monitor
+        """
+        if 'path' in options.keys():
+            qmp_boot_line = '-qmp unix:%s,server,nowait' % options['path']
+            self.__add_boot_line(qmp_boot_line)
+            self.qmp_sock_path = options['path']
+        else:
+            self.qmp_sock_path = None
+
     def set_vm_qga(self, enable='yes'):
         """
         Set VM qemu-guest-agent.
@@ -936,19 +1028,137 @@ class QEMUKvm(VirtBase):
         if type(ret) is int and ret != 0:
             raise StartVMFailedException('Start VM failed!!!')
 
-        self.__get_pci_mapping()
+        self.__open_qmp_client()
+        try:
+            if self.numa_request:
+                self.__pin_vcpus()
+
+            self.__get_pci_mapping()
+
+            # query status
+            self.update_status()
 
-        # query status
-        self.update_status()
+            # when vm is waiting for migration, can't ping
+            if self.vm_status is not ST_PAUSE:
+                # if VM waiting for migration, can't return ping
+                if not self.__wait_guest_agent(120):
+                    raise StartVMFailedException(
+                        'Not response in 120 seconds!!!')
 
-        # when vm is waiting for migration, can't ping
-        if self.vm_status is not ST_PAUSE:
-            # if VM waiting for migration, can't return ping
-            out = self.__control_session('ping', '120')
-            if "Not responded" in out:
-                raise StartVMFailedException('Not response in 120 seconds!!!')
+                self.__wait_vmnet_ready()
+        except Exception:
+            self.__close_qmp_client()
+            raise
 
-            self.__wait_vmnet_ready()
+    def __open_qmp_client(self):
+        """
+        Connect QMP monitor and guest agent through relay on host. Monitor
+        session and guest agent client will be used when failed.
+        """
+        if not self.qmp_sock_path:
+            return
+
+        sockets = {QMP: self.qmp_sock_path}
+        if self.qga_sock_path:
+            sockets[QGA] = self.qga_sock_path
+        command = ssh_relay_command(self.host_dut.get_ip_address(), USERNAME,
+                                    sockets)
+        try:
+            self.qmp_client = QMPClient(command,
+                                        self.host_dut.get_password(),
+                                        self.host_logger)
+            self.qmp_client.connect(QMP)
+            events = self.qmp_client.execute(QMP, 'query-events')
+            self.qmp_events = [event['name'] for event in events]
+        except Exception as e:
+            self.host_logger.warning("Failed to connect QMP of %s: %s" %
+                                     (self.vm_name, str(e)))
+            self.__close_qmp_client()
+
+    def __close_qmp_client(self):
+        if self.qmp_client is not None:
+            self.qmp_client.close()
+            self.qmp_client = None
+
+    def __qmp(self, command, arguments=None, timeout=30):
+        """
+        Execute QMP command, return None when failed.
+        """
+        try:
+            return self.qmp_client.execute(QMP, command, arguments, timeout)
+        except (TimeoutException, QMPException) as e:
+            self.host_logger.warning(str(e))
+            return None
+
+    def __guest_agent_ready(self):
+        try:
+            self.qmp_client.execute(QGA, 'guest-ping', timeout=5)
+            return True
+        except (TimeoutException, QMPException):
+            return False
+
+    def __wait_guest_agent(self, timeout):
+        """
+        Wait for guest agent responding, guest agent opening its serial port
+        is notified by VSERPORT_CHANGE event.
+        """
+        if self.qmp_client is None:
+            out = self.__control_session('ping', str(timeout))
+            return "Not responded" not in (out or '')
+
+        if not self.qga_sock_path:
+            return True
+
+        start = time.time()
+        if 'VSERPORT_CHANGE' in self.qmp_events:
+            self.qmp_client.wait_event('VSERPORT_CHANGE', timeout, since=0,
+                                       match=lambda data: data.get('open'))
+        remaining = max(timeout - (time.time() - start), 5)
+        return self.host_dut.wait_until(self.__guest_agent_ready, remaining,
+                                        "guest agent of %s" % self.vm_name)
+
+    def __guest_ips(self):
+        """
+        Return IPv4 addresses of guest interfaces.
+        """
+        if self.qmp_client is None:
+            out = self.__control_session('ifconfig') or ''
+            return re.findall(r'inet (\d+\.\d+\.\d+\.\d+)', out)
+
+        try:
+            intfs = self.qmp_client.execute(QGA, 'guest-network-get-interfaces')
+        except (TimeoutException, QMPException):
+            return []
+
+        ips = []
+        for intf in intfs:
+            for addr in intf.get('ip-addresses', []):
+                if addr.get('ip-address-type') == 'ipv4':
+                    ips.append(addr['ip-address'])
+        return ips
+
+    def __migration_status(self, status_list, timeout):
+        """
+        Wait for migration status in status_list, MIGRATION events are waited
+        and migration status is queried with backoff in case of no event.
+        Return the last status.
+        """
+        deadline = time.time() + timeout
+        interval = 1
+        while True:
+            remaining = deadline - time.time()
+            event = self.qmp_client.wait_event(
+                'MIGRATION', min(interval, max(remaining, 0)),
+                since=self.migration_mark,
+                match=lambda data: data.get('status') in status_list)
+            if event is not None:
+                return event['data']['status']
+
+            info = self.__qmp('query-migrate') or {}
+            status = info.get('status', '')
+            if status in status_list or time.time() >= deadline:
+                return status
+            interval = min(interval * 2, 10)
 
     def start_migration(self, remote_ip, remote_port):
         """
@@ -958,8 +1168,20 @@ class QEMUKvm(VirtBase):
         migration_port = 'tcp:%(IP)s:%(PORT)s' % {
             'IP': remote_ip, 'PORT': remote_port}
 
+        if self.qmp_client is not None:
+            self.migration_mark = self.qmp_client.event_mark()
+            # MIGRATION events only sent when capability enabled
+            self.__qmp('migrate-set-capabilities',
+                       {'capabilities': [{'capability': 'events',
+                                          'state': True}]})
+            if self.__qmp('migrate', {'uri': migration_port}) is None:
+                return False
+            status = self.__migration_status(['active'] +
+                                             MIGRATION_DONE_STATUS, 10)
+            return status in ['active', 'completed']
+
         self.__monitor_session('migrate', '-d', migration_port)
-        time.sleep(2)
+        profiler.sleep(2)
         out = self.__monitor_session('info', 'migrate')
         if "Migration status: active" in out:
             return True
@@ -971,6 +1193,16 @@ class QEMUKvm(VirtBase):
         Wait for migration done. If not finished after three minutes
         will raise exception.
         """
+        if self.qmp_client is not None:
+            status = self.__migration_status(MIGRATION_DONE_STATUS, 180)
+            if status == 'completed':
+                self.host_logger.info("%s" % self.__qmp('query-migrate'))
+                # after migration done, status is pause
+                self.vm_status = ST_PAUSE
+                return True
+            raise StartVMFailedException(
+                'Virtual machine migration status %s!!!' % status)
+
         # wait for migration done
         count = 30
         while count:
@@ -981,7 +1213,7 @@ class QEMUKvm(VirtBase):
                 self.vm_status = ST_PAUSE
                 return True
 
-            time.sleep(6)
+            profiler.sleep(6)
             count -= 1
 
         raise StartVMFailedException(
@@ -993,31 +1225,150 @@ class QEMUKvm(VirtBase):
         """
         qemu_emulator = self.qemu_emulator
 
-        if self.vcpus_pinned_to_vm.strip():
+        if self.numa_request:
+            self.__alloc_placement()
+        mem_boot_line = self.__hugepage_mem_line()
+
+        if self.numa_request:
+            # all threads start on emulator cpus, vcpus pinned after started
+            qemu_boot_line = 'taskset -c %s ' % \
+                ','.join(self.placement['emulator']) + \
+                qemu_emulator + ' ' + \
+                self.qemu_boot_line + mem_boot_line
+        elif self.vcpus_pinned_to_vm.strip():
             vcpus = self.__alloc_vcpus()
 
             if vcpus.strip():
                 qemu_boot_line = 'taskset -c %s ' % vcpus + \
                     qemu_emulator + ' ' + \
-                    self.qemu_boot_line
+                    self.qemu_boot_line + mem_boot_line
         else:
             qemu_boot_line = qemu_emulator + ' ' + \
-                self.qemu_boot_line
+                self.qemu_boot_line + mem_boot_line
 
         return qemu_boot_line
 
+    def __hugepage_mem_line(self):
+        """
+        Generate hugepage backend memory options, memory bound to numa node
+        of vcpus when node has enough free hugepages.
+        """
+        if not self.hugepage_mem:
+            return ''
+
+        mem_boot_line = ' -object memory-backend-file,' \
+                        + 'id=mem,size=%sM,mem-path=%s,share=on' \
+                        % (self.hugepage_mem, self.host_dut.hugepage_path)
+
+        numa = self.placement.get('numa', -1)
+        if numa != -1:
+            free_mem = self.virt_pool.get_free_hugepage_mem(numa)
+            if free_mem >= int(self.hugepage_mem):
+                policy = 'bind'
+            else:
+                self.host_logger.warning(
+                    "Only %dM free hugepage memory on node %d for %s" %
+                    (free_mem, numa, self.vm_name))
+                policy = 'preferred'
+            mem_boot_line += ',host-nodes=%d,policy=%s' % (numa, policy)
+            self.placement['memory'] = {'numa': numa, 'policy': policy,
+                                        'size': int(self.hugepage_mem)}
+
+        mem_boot_line += ' -numa node,memdev=mem -mem-prealloc'
+        return mem_boot_line
+
+    def __placement_numa(self):
+        """
+        Return numa node which VM should be placed on, -1 when no request.
+        """
+        if not self.numa_request:
+            return -1
+
+        numa = self.numa_request['numa']
+        if numa != 'auto':
+            return int(numa)
+
+        # assigned devices first, then ports of DUT used by vhost
+        numa = self.virt_pool.get_pcis_numa(self.pt_devices)
+        if numa == -1:
+            numa = self.virt_pool.get_pcis_numa()
+        return numa
+
+    def __alloc_placement(self):
+        """
+        Allocate vcpus and emulator cpus on numa node.
+        """
+        self.placement = {}
+        placement = self.virt_pool.alloc_numa_cpu(
+            vm=self.vm_name, number=self.numa_request['number'],
+            socket=self.__placement_numa(),
+            threads=self.numa_request['threads'],
+            emulator=self.numa_request['emulator'])
+        if placement is None:
+            raise StartVMFailedException("No enough cores for %s!!!" %
+                                         self.vm_name)
+
+        self.placement.update(placement)
+
+    def __vcpu_threads(self):
+        """
+        Return host thread ids of vcpus in vcpu index order.
+        """
+        if self.qmp_client is not None:
+            cpus = self.__qmp('query-cpus-fast')
+            if cpus is not None:
+                return [cpu['thread-id'] for cpu in
+                        sorted(cpus, key=lambda cpu: cpu['cpu-index'])]
+            cpus = self.__qmp('query-cpus')
+            if cpus is not None:
+                return [cpu['thread_id'] for cpu in
+                        sorted(cpus, key=lambda cpu: cpu['CPU'])]
+
+        out = self.__monitor_session('info', 'cpus')
+        if not out:
+            return []
+        return [int(tid) for tid in re.findall(r"thread_id=(\d+)", out)]
+
+    def __pin_vcpus(self):
+        """
+        Pin vcpu threads to allocated cpus one by one, other threads of qemu
+        are left on emulator cpus. Placement will be reported in log.
+        """
+        threads = self.__vcpu_threads()
+        if len(threads) != len(self.placement['vcpus']):
+            self.host_logger.warning(
+                "Found %d vcpu threads of %s, expect %d" %
+                (len(threads), self.vm_name, len(self.placement['vcpus'])))
+
+        self.placement['vcpu_threads'] = {}
+        for index, (tid, cpu) in enumerate(zip(threads,
+                                               self.placement['vcpus'])):
+            self.host_session.send_expect("taskset -pc %s %d" % (cpu, tid),
+                                          "# ")
+            self.placement['vcpu_threads'][index] = tid
+
+        vcpus = ', '.join(['vcpu%d->%s' % (index, cpu) for index, cpu in
+                           enumerate(self.placement['vcpus'])])
+        report = "Placement of %s on node %d: %s, emulator->%s" % \
+            (self.vm_name, self.placement['numa'], vcpus,
+             ','.join(self.placement['emulator']))
+        if 'memory' in self.placement:
+            report += ", memory->node %d (%s)" % \
+                (self.placement['memory']['numa'],
+                 self.placement['memory']['policy'])
+        self.host_logger.info(report)
+
     def __wait_vmnet_ready(self):
         """
         wait for 120 seconds for vm net ready
         10.0.2.* is the default ip address allocated by qemu
         """
-        count = 40
-        while count:
-            out = self.__control_session('ifconfig')
-            if "10.0.2" in out:
-                return True
-            time.sleep(6)
-            count -= 1
+        def vmnet_ready():
+            return any(ip.startswith('10.0.2') for ip in self.__guest_ips())
+
+        if self.host_dut.wait_until(vmnet_ready, 120,
+                                    "control net of %s" % self.vm_name):
+            return True
 
         raise StartVMFailedException(
             'Virtual machine control net not ready in 120 seconds!!!')
@@ -1145,11 +1496,9 @@ class QEMUKvm(VirtBase):
         """
         Get IP which VM is connected by bridge.
         """
-        out = self.__control_session('ping', '60')
-        if not out:
-            time.sleep(10)
-            out = self.__control_session('ifconfig')
-            ips = re.findall(r'inet (\d+\.\d+\.\d+\.\d+)', out)
+        if self.__wait_guest_agent(60):
+            profiler.sleep(10)
+            ips = self.__guest_ips()
 
             if '127.0.0.1' in ips:
                 ips.remove('127.0.0.1')
@@ -1210,15 +1559,25 @@ class QEMUKvm(VirtBase):
         """
         Query and update VM status
         """
-        out = self.__monitor_session('info', 'status')
-        self.host_logger.info("Virtual machine status: %s" % out)
-
-        if 'paused' in out:
-            self.vm_status = ST_PAUSE
-        elif 'running' in out:
-            self.vm_status = ST_RUNNING
+        if self.qmp_client is not None:
+            status = self.__qmp('query-status') or {}
+            self.host_logger.info("Virtual machine status: %s" % status)
+            if status.get('running'):
+                self.vm_status = ST_RUNNING
+            elif status.get('status') in QMP_PAUSED_STATUS:
+                self.vm_status = ST_PAUSE
+            else:
+                self.vm_status = ST_UNKNOWN
         else:
-            self.vm_status = ST_UNKNOWN
+            out = self.__monitor_session('info', 'status')
+            self.host_logger.info("Virtual machine status: %s" % out)
+
+            if 'paused' in out:
+                self.vm_status = ST_PAUSE
+            elif 'running' in out:
+                self.vm_status = ST_RUNNING
+            else:
+                self.vm_status = ST_UNKNOWN
 
         info = self.host_session.send_expect('cat %s' % self.__pid_file, "# ")
         try:
@@ -1236,6 +1595,22 @@ class QEMUKvm(VirtBase):
         id_reg = r'^.*id \"(.*)\"'
 
         pcis = []
+        if self.qmp_client is not None:
+            buses = self.__qmp('query-pci') or []
+            devices = []
+            for bus in buses:
+                devices += bus['devices']
+            for device in devices:
+                # devices behind pci bridge
+                bridge = device.get('pci_bridge', {})
+                devices += bridge.get('devices', [])
+                if device.get('qdev_id'):
+                    pcis.append({'pci': '%02x:%02x.%x' % (device['bus'],
+                                                          device['slot'],
+                                                          device['function']),
+                                 'id': device['qdev_id']})
+            return pcis
+
         out = self.__monitor_session('info', 'pci')
 
         if out is None:
@@ -1294,8 +1669,28 @@ class QEMUKvm(VirtBase):
         """
         Stop VM.
         """
-        if self.vm_status is ST_RUNNING:
-            self.__control_session('powerdown')
+        if self.qmp_client is not None:
+            mark = self.qmp_client.event_mark()
+            try:
+                if self.vm_status is ST_RUNNING and self.qga_sock_path:
+                    # no reply when guest shutdown succeeded
+                    self.qmp_client.execute(QGA, 'guest-shutdown',
+                                            reply=False)
+                    self.qmp_client.wait_event('SHUTDOWN', 30, since=mark)
+                else:
+                    self.qmp_client.execute(QMP, 'quit', reply=False)
+                # qemu exited after monitor closed
+                self.qmp_client.wait_closed(QMP, 10)
+            except (TimeoutException, QMPException) as e:
+                self.host_logger.warning(str(e))
+            self.__close_qmp_client()
         else:
-            self.__monitor_session('quit')
-        time.sleep(5)
+            if self.vm_status is ST_RUNNING:
+                self.__control_session('powerdown')
+            else:
+                self.__monitor_session('quit')
+            profiler.sleep(5)
+
+        for overlay in self.image_overlays.values():
+            self.host_session.send_expect("rm -f %s" % overlay, "# ")
+        self.image_overlays = {}
@@ -42,6 +42,7 @@ from logger import getLogger
 from config import VirtConf
 from config import VIRTCONF
 from exception import StartVMFailedException
+from profiler import profiler
 import xml.etree.ElementTree as ET
 from xml.etree.ElementTree import ElementTree
 
@@ -481,7 +482,7 @@ class LibvirtKvm(VirtBase):
             pass
         self.root.write(xml_file)
         self.host_session.copy_file_to(xml_file)
-        time.sleep(2)
+        profiler.sleep(2)
 
         self.host_session.send_expect("virsh", "virsh #")
         self.host_session.send_expect(
@@ -504,7 +505,7 @@ class LibvirtKvm(VirtBase):
             out = self.__control_session('ifconfig')
             if "10.0.2" in out:
                 return True
-            time.sleep(6)
+            profiler.sleep(6)
             count -= 1
 
         raise StartVMFailedException("Virtual machine control net not ready " +
@@ -512,4 +513,4 @@ class LibvirtKvm(VirtBase):
 
     def stop(self):
         self.__control_session("shutdown")
-        time.sleep(5)
+        profiler.sleep(5)
@@ -0,0 +1,422 @@
+# BSD LICENSE
+#
+# Copyright(c) 2010-2017 Intel Corporation. All rights reserved.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of Intel Corporation nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import sys
+import json
+import time
+import pipes
+import threading
+import itertools
+import pexpect
+from collections import deque
+
+from exception import TimeoutException, QMPException
+
+"""
+Persistent JSON client of QEMU monitor (QMP) and guest agent (QGA) of one VM.
+Both sockets are multiplexed over one relay process started on host, replies
+and asynchronous events are dispatched by a reader thread.
+"""
+
+QMP = 'qmp'
+QGA = 'qga'
+RELAY = 'relay'
+RELAY_PATH = '~/QMP/qmp_relay.py'
+# number of latest events kept for waiters
+EVENT_HISTORY = 256
+
+
+def relay_command(sockets, relay=RELAY_PATH, python='python'):
+    """
+    Command of running relay locally, sockets is dict of channel and path.
+    """
+    args = ' '.join(['%s=%s' % item for item in sockets.items()])
+    return '%s -u %s %s' % (python, relay, args)
+
+
+def ssh_relay_command(host, username, sockets):
+    """
+    Command of running relay on host by ssh.
+    """
+    if ':' in host:
+        ip, port = host.split(':')
+    else:
+        ip, port = host, '22'
+    args = ' '.join(['%s=%s' % item for item in sockets.items()])
+    remote = 'PY=$(command -v python3 || command -v python); ' \
+        'exec $PY -u %s %s' % (RELAY_PATH, args)
+    return 'ssh -T -o StrictHostKeyChecking=no ' \
+        '-o UserKnownHostsFile=/dev/null -p %s %s@%s %s' % \
+        (port, username, ip, pipes.quote(remote))
+
+
+class QMPClient(object):
+
+    """
+    Client of relay process. Commands of one channel are executed one by one,
+    events of QMP channel can be subscribed or waited.
+    """
+
+    def __init__(self, command, password='', logger=None, timeout=30):
+        self.logger = logger
+        self.cond = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.channel_locks = {}
+        self.connected = set()
+        self.closed = {}
+        self.replies = {}
+        self.events = deque(maxlen=EVENT_HISTORY)
+        self.event_seq = 0
+        self.subscribers = {}
+        self.ids = itertools.count(1)
+        self.alive = True
+
+        self.process = pexpect.spawn(command, echo=False)
+        self.__login(password, timeout)
+
+        self.reader = threading.Thread(target=self.__read_loop)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def __login(self, password, timeout):
+        ssh_newkey = 'Are you sure you want to continue connecting'
+        ready = RELAY + r' \{"ready": true\}'
+        patterns = [ssh_newkey, '[pP]assword', ready, pexpect.EOF,
+                    pexpect.TIMEOUT]
+        password_sent = False
+        while True:
+            index = self.process.expect(patterns, timeout)
+            if index == 0:
+                self.process.sendline('yes')
+            elif index == 1 and not password_sent:
+                self.process.sendline(password)
+                password_sent = True
+            elif index == 2:
+                return
+            else:
+                output = self.process.before
+                self.process.close(force=True)
+                raise QMPException(RELAY, output)
+
+    def __log(self, message):
+        if self.logger is not None:
+            self.logger.debug(message)
+
+    def __read_loop(self):
+        while self.alive:
+            try:
+                index = self.process.expect(['\n', pexpect.EOF,
+                                             pexpect.TIMEOUT], timeout=1)
+            except Exception:
+                break
+            if index == 1:
+                break
+            if index == 0:
+                self.__dispatch(self.process.before.strip())
+
+        with self.cond:
+            self.alive = False
+            self.cond.notify_all()
+
+    def __dispatch(self, line):
+        name, _, data = line.partition(' ')
+        try:
+            message = json.loads(data)
+        except ValueError:
+            self.__log("Unknown relay output: %s" % line)
+            return
+
+        self.__log("%s << %s" % (name, data))
+        callbacks = []
+        with self.cond:
+            if 'relay-closed' in message:
+                self.connected.discard(name)
+                self.closed[name] = message['relay-closed']
+            elif 'event' in message:
+                self.event_seq += 1
+                self.events.append((self.event_seq, message))
+                callbacks = self.subscribers.get(message['event'], []) + \
+                    self.subscribers.get('*', [])
+            else:
+                self.replies.setdefault(name, []).append(message)
+            self.cond.notify_all()
+
+        for callback in callbacks:
+            try:
+                callback(message)
+            except Exception as e:
+                self.__log("Event callback failed: %s" % str(e))
+
+    def __send(self, channel, message):
+        line = channel + ' '
+        if message is not None:
+            line += json.dumps(message)
+        self.__log("%s >> %s" % (channel, line[len(channel) + 1:]))
+        with self.write_lock:
+            if not self.alive:
+                raise QMPException(channel, 'relay exited')
+            self.process.send(line + '\n')
+
+    def __wait_reply(self, channel, command, timeout, match):
+        deadline = time.time() + timeout
+        with self.cond:
+            while True:
+                for response in self.replies.get(channel, []):
+                    if match(response):
+                        self.replies[channel].remove(response)
+                        return response
+                if channel in self.closed:
+                    raise QMPException(command, self.closed[channel])
+                if not self.alive:
+                    raise QMPException(command, 'relay exited')
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutException(command, '')
+                self.cond.wait(remaining)
+
+    def __request(self, channel, message, timeout, reply=True, match=None):
+        msg_id = next(self.ids)
+        message['id'] = msg_id
+        if match is None:
+            # guest agent of old version does not return id
+            match = lambda response: response.get('id', msg_id) == msg_id
+        with self.cond:
+            # drop late replies of commands timeout before
+            self.replies[channel] = []
+        self.__send(channel, message)
+        if not reply:
+            return None
+
+        response = self.__wait_reply(channel, message['execute'], timeout,
+                                     match)
+        if 'error' in response:
+            error = response['error']
+            if isinstance(error, dict):
+                error = error.get('desc', error)
+            raise QMPException(message['execute'], error)
+        return response.get('return')
+
+    def __channel_lock(self, channel):
+        with self.cond:
+            if channel not in self.channel_locks:
+                self.channel_locks[channel] = threading.Lock()
+            return self.channel_locks[channel]
+
+    def connect(self, channel=QMP, timeout=30):
+        """
+        Connect channel, events will be received after QMP connected.
+        """
+        with self.__channel_lock(channel):
+            if channel not in self.connected:
+                self.__connect(channel, timeout)
+
+    def __connect(self, channel, timeout):
+        with self.cond:
+            self.closed.pop(channel, None)
+            self.replies[channel] = []
+
+        if channel == QMP:
+            self.__send(channel, None)
+            self.__wait_reply(channel, 'connect', timeout,
+                              lambda response: 'QMP' in response)
+            self.__request(channel, {'execute': 'qmp_capabilities'}, timeout)
+        else:
+            # skip replies of commands sent before guest agent ready
+            sync_id = next(self.ids)
+            message = {'execute': 'guest-sync', 'arguments': {'id': sync_id}}
+            self.__request(channel, message, timeout,
+                           match=lambda response:
+                           response.get('return') == sync_id or
+                           'error' in response)
+
+        with self.cond:
+            self.connected.add(channel)
+
+    def execute(self, channel, command, arguments=None, timeout=30,
+                reply=True):
+        """
+        Execute command on channel and return its result. QMPException will
+        be raised when command failed and TimeoutException when no reply in
+        time. Commands without reply, like guest-shutdown, should not wait
+        for reply.
+        """
+        with self.__channel_lock(channel):
+            if channel not in self.connected:
+                self.__connect(channel, timeout)
+            message = {'execute': command}
+            if arguments:
+                message['arguments'] = arguments
+            return self.__request(channel, message, timeout, reply)
+
+    def subscribe(self, event, callback):
+        """
+        Call callback with event message when event arrived, '*' stands for
+        all events. Callback runs in reader thread and should not block.
+        """
+        with self.cond:
+            self.subscribers.setdefault(event, []).append(callback)
+
+    def unsubscribe(self, event, callback):
+        with self.cond:
+            if callback in self.subscribers.get(event, []):
+                self.subscribers[event].remove(callback)
+
+    def event_mark(self):
+        """
+        Return sequence of latest event, used as start point of wait_event.
+        """
+        with self.cond:
+            return self.event_seq
+
+    def wait_event(self, events, timeout=30, since=None, match=None):
+        """
+        Wait for one of events arrived after since mark, match is optional
+        check of event data. Return event message or None when timeout.
+        """
+        if isinstance(events, basestring):
+            events = [events]
+        if since is None:
+            since = self.event_mark()
+
+        deadline = time.time() + timeout
+        with self.cond:
+            while True:
+                for seq, message in self.events:
+                    if seq <= since or message['event'] not in events:
+                        continue
+                    if match is None or match(message.get('data', {})):
+                        return message
+                remaining = deadline - time.time()
+                if not self.alive or remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+
+    def wait_closed(self, channel, timeout=30):
+        """
+        Wait for channel closed by peer, like qemu exited.
+        """
+        deadline = time.time() + timeout
+        with self.cond:
+            while channel not in self.closed and self.alive:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+            return True
+
+    def isalive(self):
+        return self.alive
+
+    def close(self):
+        with self.cond:
+            self.alive = False
+            self.cond.notify_all()
+        self.reader.join(5)
+        self.process.close(force=True)
+
+
+if __name__ == "__main__":
+    import socket
+    import tempfile
+
+    def stub_server(path, handle):
+        """
+        Unix socket server handles one connection, handle returns lines
+        replied for each line received.
+        """
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen(1)
+
+        def serve():
+            conn, _ = server.accept()
+            for line in handle(None):
+                conn.sendall(line + '\r\n')
+            for line in conn.makefile():
+                replies = handle(json.loads(line))
+                if replies is None:
+                    break
+                for reply in replies:
+                    conn.sendall(reply + '\r\n')
+            conn.close()
+
+        thread = threading.Thread(target=serve)
+        thread.daemon = True
+        thread.start()
+
+    def qmp_stub(message):
+        if message is None:
+            return [json.dumps({'QMP': {'version': {}, 'capabilities': []}})]
+        reply = json.dumps({'return': {}, 'id': message.get('id')})
+        command = message['execute']
+        if command == 'query-status':
+            return [json.dumps({'return': {'status': 'running',
+                                           'running': True},
+                                'id': message['id']})]
+        if command == 'migrate':
+            return [reply] + [json.dumps({'event': 'MIGRATION',
+                                          'data': {'status': status}})
+                              for status in ['setup', 'active', 'completed']]
+        if command == 'quit':
+            return None
+        return [reply]
+
+    def qga_stub(message):
+        if message is None:
+            return []
+        if message['execute'] == 'guest-sync':
+            return [json.dumps({'return': message['arguments']['id']})]
+        return [json.dumps({'return': {}})]
+
+    folder = tempfile.mkdtemp()
+    sockets = {QMP: os.path.join(folder, 'qmp.sock'),
+               QGA: os.path.join(folder, 'qga.sock')}
+    stub_server(sockets[QMP], qmp_stub)
+    stub_server(sockets[QGA], qga_stub)
+
+    relay = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '..', 'dep', 'QMP', 'qmp_relay.py')
+    client = QMPClient(relay_command(sockets, relay, sys.executable))
+    client.subscribe('MIGRATION', lambda event: sys.stdout.write(
+        "event %s\n" % event['data']['status']))
+    print client.execute(QMP, 'query-status')
+    print client.execute(QGA, 'guest-ping')
+    mark = client.event_mark()
+    client.execute(QMP, 'migrate', {'uri': 'tcp:127.0.0.1:4444'})
+    print client.wait_event('MIGRATION', 5, since=mark,
+                            match=lambda data: data['status'] == 'completed')
+    client.execute(QMP, 'quit', reply=False)
+    print client.wait_closed(QMP, 5)
+    client.close()
+    for path in sockets.values():
+        os.remove(path)
+    os.rmdir(folder)
@@ -0,0 +1,163 @@
+# BSD LICENSE
+#
+# Copyright(c) 2010-2017 Intel Corporation. All rights reserved.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of Intel Corporation nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+RFC2544 zero loss throughput search.
+"""
+
+import time
+from exception import VerifyFailure
+
+# trial duration in seconds while searching
+RFC2544_SEARCH_DELAY = 10
+# stop searching when pass/fail rates are closer than this percentage
+RFC2544_RESOLUTION = 0.5
+RFC2544_MAX_ITERATIONS = 20
+
+
+class RFC2544Search(object):
+
+    """
+    Binary search of the highest rate without loss. Search trials are short,
+    the found rate is verified by one full length trial before accepted.
+
+    trial is callable with arguments (rate_percent, delay) and returns tuple
+    of (loss_rate, tx_num, rx_num), like Tester.traffic_generator_loss.
+    """
+
+    def __init__(self, trial, logger, delay=120, permit_loss_rate=0,
+                 resolution=RFC2544_RESOLUTION,
+                 search_delay=RFC2544_SEARCH_DELAY,
+                 max_iterations=RFC2544_MAX_ITERATIONS,
+                 min_rate=0, max_rate=100):
+        self.trial = trial
+        self.logger = logger
+        self.delay = delay
+        self.permit_loss_rate = permit_loss_rate
+        self.resolution = float(resolution)
+        self.search_delay = min(search_delay, delay)
+        self.max_iterations = max_iterations
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.trials = []
+        self.trial_delay = self.search_delay
+
+    def run_trial(self, rate, delay, phase, lower, upper):
+        """
+        Run one trial and record its telemetry.
+        """
+        start = time.time()
+        result = self.trial(rate, delay)
+        if result is None:
+            raise VerifyFailure("Traffic generator returned no loss result")
+
+        loss_rate, tx_num, rx_num = result
+        passed = loss_rate <= self.permit_loss_rate
+        record = {'iteration': len(self.trials) + 1,
+                  'phase': phase,
+                  'rate': rate,
+                  'delay': delay,
+                  'lower': lower,
+                  'upper': upper,
+                  'loss_rate': loss_rate,
+                  'tx': tx_num,
+                  'rx': rx_num,
+                  'passed': passed,
+                  'duration': time.time() - start}
+        self.trials.append(record)
+
+        self.logger.info("RFC2544 %(phase)s trial %(iteration)d: "
+                         "rate %(rate).3f%% [%(lower).3f, %(upper).3f] "
+                         "loss %(loss_rate).6f tx %(tx)s rx %(rx)s" % record)
+        return record
+
+    def search(self, lower, upper):
+        """
+        Bisect between passed rate lower and failed rate upper, return the
+        highest passed rate found.
+        """
+        while upper - lower > self.resolution:
+            if len(self.trials) >= self.max_iterations:
+                self.logger.warning("RFC2544 search stopped after %d trials" %
+                                    len(self.trials))
+                break
+            rate = (lower + upper) / 2
+            record = self.run_trial(rate, self.trial_delay, 'search',
+                                    lower, upper)
+            if record['passed']:
+                lower = rate
+            else:
+                upper = rate
+        return lower, upper
+
+    def run(self):
+        """
+        Return zero loss rate and tx/rx numbers of its verification trial.
+        """
+        self.trials = []
+        self.trial_delay = self.search_delay
+        lower, upper = self.min_rate, self.max_rate
+
+        record = self.run_trial(upper, self.trial_delay, 'search',
+                                lower, upper)
+        if record['passed']:
+            lower = upper
+
+        while True:
+            lower, upper = self.search(lower, upper)
+            if lower <= self.min_rate:
+                break
+
+            passed = [r for r in self.trials
+                      if r['passed'] and r['rate'] == lower]
+            if self.trial_delay >= self.delay:
+                # search trials already have full length
+                record = passed[-1]
+            else:
+                record = self.run_trial(lower, self.delay, 'verify',
+                                        lower, upper)
+            if record['passed']:
+                self.logger.info("zero loss rate is %s" % record['rate'])
+                return record['rate'], record['tx'], record['rx']
+
+            if len(self.trials) >= self.max_iterations:
+                self.logger.warning("RFC2544 verification failed at %s" %
+                                    record['rate'])
+                break
+            # short trials are not reliable around this rate, search again
+            # below it with full length trials
+            self.trial_delay = self.delay
+            upper = lower
+            lower = self.min_rate
+
+        last = self.trials[-1]
+        self.logger.info("zero loss rate is %s" % self.min_rate)
+        return self.min_rate, last['tx'], last['rx']
@@ -0,0 +1,157 @@
+# BSD LICENSE
+#
+# Copyright(c) 2010-2017 Intel Corporation. All rights reserved.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of Intel Corporation nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Scheduler of suites on independent DUT/tester pairs.
+"""
+
+import os
+import json
+
+from settings import get_nic_name
+from test_case import TestCase
+from utils import get_subclasses
+
+
+class SuiteScheduler(object):
+
+    """
+    Shard suites on CRBs which meet the requirements of suites. Suites are
+    balanced by durations of previous executions, the longest suite goes to
+    the least loaded CRB first.
+    """
+
+    def __init__(self, history_file, logger=None):
+        self.history_file = history_file
+        self.logger = logger
+        self.durations = {}
+        self.load_durations()
+
+    def load_durations(self):
+        try:
+            with open(self.history_file) as history:
+                self.durations = json.load(history)
+        except (IOError, ValueError):
+            self.durations = {}
+
+    def save_durations(self):
+        try:
+            with open(self.history_file, 'w') as history:
+                json.dump(self.durations, history, indent=4, sort_keys=True)
+        except IOError:
+            pass
+
+    def update_durations(self, timings):
+        """
+        Update suite durations by timing records of one execution. Duration
+        is the time of suite on one DUT and target.
+        """
+        totals = {}
+        for timing in timings:
+            key = (timing['suite'], timing['dut'], timing['target'])
+            totals[key] = totals.get(key, 0) + timing['total']
+
+        runs = {}
+        for (suite, _, _), seconds in totals.items():
+            runs.setdefault(suite, []).append(seconds)
+        for suite, seconds in runs.items():
+            self.durations[suite] = sum(seconds) / len(seconds)
+
+    def suite_duration(self, suite):
+        if suite in self.durations:
+            return self.durations[suite]
+        # unknown suite is estimated as average one
+        if self.durations:
+            return sum(self.durations.values()) / len(self.durations)
+        return 1.0
+
+    def suite_requirements(self, suite):
+        """
+        Return requirements declared by test classes of suite.
+        """
+        requirements = {'nics': [], 'ports': 0, 'socket': -1}
+        try:
+            suite_module = __import__('TestSuite_' + suite)
+        except Exception:
+            return requirements
+
+        for _, test_class in get_subclasses(suite_module, TestCase):
+            requirements['nics'] += test_class.required_nics
+            requirements['ports'] = max(requirements['ports'],
+                                        test_class.required_ports)
+            if test_class.required_socket != -1:
+                requirements['socket'] = test_class.required_socket
+        return requirements
+
+    def crb_ports(self, dut):
+        """
+        Return nic name and socket of each DUT port.
+        """
+        return [(get_nic_name(port_info['type']), port_info['numa'])
+                for port_info in dut.ports_info]
+
+    def meet_requirements(self, requirements, ports):
+        matched = 0
+        for nic, socket in ports:
+            if requirements['nics'] and nic not in requirements['nics']:
+                continue
+            if requirements['socket'] not in (-1, socket) and socket != -1:
+                continue
+            matched += 1
+        return matched >= requirements['ports']
+
+    def shard(self, suites, crbs_ports):
+        """
+        Split suites into one list for each CRB. Suite which can't be met
+        by any CRB still goes to the least loaded one, so it will be reported
+        by itself.
+        """
+        loads = [0.0] * len(crbs_ports)
+        shards = [[] for _ in crbs_ports]
+
+        ordered = sorted(suites, key=self.suite_duration, reverse=True)
+        for suite in ordered:
+            requirements = self.suite_requirements(suite)
+            candidates = [index for index, ports in enumerate(crbs_ports)
+                          if self.meet_requirements(requirements, ports)]
+            if not candidates:
+                if self.logger:
+                    self.logger.warning("No CRB meets requirements of "
+                                        "suite %s" % suite)
+                candidates = range(len(crbs_ports))
+
+            index = min(candidates, key=lambda index: loads[index])
+            loads[index] += self.suite_duration(suite)
+            shards[index].append(suite)
+
+        # keep the order in execution file
+        return [[suite for suite in suites if suite in shard]
+                for shard in shards]
@@ -40,10 +40,12 @@ class Singleton(type):
     _instances = {}
 
     def __call__(self, *args, **kwargs):
-        if self not in self._instances:
-            self._instances[self] = \
+        # one instance for each name
+        key = (self, args)
+        if key not in self._instances:
+            self._instances[key] = \
                 super(Singleton, self).__call__(*args, **kwargs)
-        return self._instances[self]
+        return self._instances[key]
 
 
 class Serializer(object):
@@ -53,12 +55,14 @@ class Serializer(object):
     using using a key-value model. It uses the pickle module to store objects
     into a file.
     This class implements the Singleton pattern. Everytime its constructor
-    is called it will return a reference to the same instance.
+    is called it will return a reference to the same instance. Constructor
+    called with different name returns independent instance, which is used
+    by CRBs running concurrently.
     """
 
     __metaclass__ = Singleton
 
-    def __init__(self):
+    def __init__(self, name=''):
         self.volatile_cache = {}
         self.filename = 'serializer.cache'
 
@@ -0,0 +1,154 @@
+# BSD LICENSE
+#
+# Copyright(c) 2010-2017 Intel Corporation. All rights reserved.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of Intel Corporation nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import threading
+from ssh_connection import SSHConnection
+from exception import SSHSessionDeadException
+from settings import SESSION_POOL_SIZE
+
+"""
+Pool of logged in sessions for running independent commands on CRB
+concurrently.
+"""
+
+
+class SessionPool(object):
+
+    """
+    Bounded pool of ssh sessions to one CRB. Sessions are created on demand,
+    reused after released and checked before handed out again.
+    """
+
+    def __init__(self, crb, size=SESSION_POOL_SIZE):
+        self.crb = crb
+        self.size = size
+        self.idle = []
+        self.sessions = []
+        self.index = 0
+        # increased when pool closed
+        self.generation = 0
+        self.cond = threading.Condition()
+
+    def __create_session(self):
+        """
+        Login new session, logs will be saved by CRB logger.
+        """
+        with self.cond:
+            self.index += 1
+            name = '%s_pool%d' % (self.crb.name, self.index)
+        session = SSHConnection(self.crb.get_ip_address(), name,
+                                self.crb.get_password())
+        session.init_log(self.crb.logger)
+        return session
+
+    def __discard_session(self, session):
+        try:
+            session.close(force=True)
+        except Exception:
+            pass
+        with self.cond:
+            if session in self.sessions:
+                self.sessions.remove(session)
+            self.cond.notify()
+
+    def acquire(self):
+        """
+        Return one available session, will wait when all sessions are in use.
+        """
+        while True:
+            session = None
+            create = False
+            with self.cond:
+                while not self.idle and len(self.sessions) >= self.size:
+                    self.cond.wait()
+                if self.idle:
+                    session = self.idle.pop()
+                else:
+                    # hold the slot before login
+                    create = True
+                    generation = self.generation
+                    self.sessions.append(None)
+
+            if create:
+                try:
+                    session = self.__create_session()
+                except Exception:
+                    with self.cond:
+                        # slot has gone when pool closed during login
+                        if generation == self.generation:
+                            self.sessions.remove(None)
+                            self.cond.notify()
+                    raise
+
+                with self.cond:
+                    if generation == self.generation:
+                        self.sessions[self.sessions.index(None)] = session
+                        return session
+
+                # pool has been closed during login
+                try:
+                    session.close(force=True)
+                except Exception:
+                    pass
+                raise SSHSessionDeadException(self.crb.get_ip_address())
+
+            # health check before reuse
+            if session.isalive() and session.check_available():
+                return session
+
+            self.crb.logger.warning("Session %s not available, "
+                                    "drop it from pool" % session.name)
+            self.__discard_session(session)
+
+    def release(self, session):
+        """
+        Give back session into pool.
+        """
+        with self.cond:
+            if session in self.sessions:
+                self.idle.append(session)
+                self.cond.notify()
+
+    def close(self):
+        """
+        Close all sessions in pool.
+        """
+        with self.cond:
+            sessions = [session for session in self.sessions if session]
+            self.sessions = []
+            self.idle = []
+            self.generation += 1
+            self.cond.notify_all()
+        for session in sessions:
+            try:
+                session.close()
+            except Exception:
+                pass
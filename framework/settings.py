@@ -155,6 +155,14 @@ SCAPY2IXIA = [
     'SCTP'
 ]
 
+"""
+IXIA statistics sampling: poll interval in seconds, max coefficient of
+variation of rx rate for stable result and times to sample again.
+"""
+IXIA_SAMPLE_INTERVAL = 1
+IXIA_SAMPLE_MAX_CV = 0.02
+IXIA_SAMPLE_RETRIES = 2
+
 USERNAME = 'root'
 
 
@@ -181,11 +189,29 @@ Default session timeout.
 """
 TIMEOUT = 15
 
+"""
+Maximum number of concurrent sessions to one CRB.
+"""
+SESSION_POOL_SIZE = 8
+
+
+"""
+Folder on DUT for saving DPDK builds and maximum number of builds kept.
+"""
+DPDK_BUILD_CACHE = "/tmp/dts_build_cache"
+DPDK_BUILD_CACHE_SIZE = 8
+
+"""
+Folder on DUT for saving golden guest images and maximum number of images kept.
+"""
+VM_IMAGE_CACHE = "/var/tmp/dts_image_cache"
+VM_IMAGE_CACHE_SIZE = 4
 
 """
 Global macro for dts.
 """
 IXIA = "ixia"
+SOFT_PKTGEN = "soft pktgen"
 
 """
 The root path of framework configs.
@@ -208,6 +234,9 @@ HOST_NIC_SETTING = "DTS_HOST_NIC"
 DEBUG_SETTING = "DTS_DEBUG_ENABLE"
 DEBUG_CASE_SETTING = "DTS_DEBUGCASE_ENABLE"
 DPDK_RXMODE_SETTING = "DTS_DPDK_RXMODE"
+SSH_TRANSPORT_SETTING = "DTS_SSH_TRANSPORT"
+PKG_SYNC_SETTING = "DTS_PKG_SYNC"
+VM_IMAGE_CACHE_SETTING = "DTS_VM_IMAGE_CACHE"
 DTS_ERROR_ENV = "DTS_RUNNING_ERROR"
 
 """
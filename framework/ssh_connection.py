@@ -29,24 +29,44 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import threading
 from ssh_pexpect import SSHPexpect
-from settings import USERNAME
+from ssh_mux import SSHMux
+from settings import USERNAME, TIMEOUT, SSH_TRANSPORT_SETTING, load_global_setting
+from profiler import profiler, OVERHEAD_SSH, OVERHEAD_SSH_READ, OVERHEAD_COPY
 
 """
 Global structure for saving connections
 """
 CONNECTIONS = []
 
+"""
+Supported ssh session backends
+"""
+TRANSPORTS = {
+    'pexpect': SSHPexpect,
+    'mux': SSHMux,
+}
+
 class SSHConnection(object):
 
     """
     Module for create session to host.
     Implement send_expect/copy function upper SSHPexpet module.
+    Session backend is selected by transport argument or DTS global setting,
+    default backend is SSHPexpect.
     """
 
-    def __init__(self, host, session_name, password=''):
-        self.session = SSHPexpect(host, USERNAME, password)
+    def __init__(self, host, session_name, password='', transport=None):
+        if transport is None:
+            transport = load_global_setting(SSH_TRANSPORT_SETTING)
+        if transport not in TRANSPORTS:
+            transport = 'pexpect'
+        self.transport = transport
+        self.session = TRANSPORTS[transport](host, USERNAME, password)
         self.name = session_name
+        # session may be shared by threads, one command at a time
+        self.lock = threading.RLock()
         connection = {}
         connection[self.name] = self.session
         CONNECTIONS.append(connection)
@@ -56,20 +76,27 @@ class SSHConnection(object):
         self.session.init_log(logger, self.name)
 
     def send_expect(self, cmds, expected, timeout=15, verify=False):
-        self.logger.info(cmds)
-        out = self.session.send_expect(cmds, expected, timeout, verify)
-        self.logger.debug(out)
+        with self.lock:
+            self.logger.info(cmds)
+            with profiler.overhead(OVERHEAD_SSH):
+                out = self.session.send_expect(cmds, expected, timeout,
+                                               verify)
+            self.logger.debug(out)
         return out
 
     def send_command(self, cmds, timeout=1):
-        self.logger.info(cmds)
-        out = self.session.send_command(cmds)
-        self.logger.debug(out)
+        with self.lock:
+            self.logger.info(cmds)
+            with profiler.overhead(OVERHEAD_SSH):
+                out = self.session.send_command(cmds)
+            self.logger.debug(out)
         return out
 
     def get_session_before(self, timeout=15):
-        out = self.session.get_session_before(timeout)
-        self.logger.debug(out)
+        with self.lock:
+            with profiler.overhead(OVERHEAD_SSH_READ):
+                out = self.session.get_session_before(timeout)
+            self.logger.debug(out)
         return out
 
     def close(self, force=False):
@@ -86,6 +113,14 @@ class SSHConnection(object):
 
     def check_available(self):
         MAGIC_STR = "DTS_CHECK_SESSION"
+        if self.transport == 'mux':
+            try:
+                _, out, _ = self.session.execute('echo %s' % MAGIC_STR,
+                                                 timeout=2)
+            except Exception:
+                return False
+            return MAGIC_STR in out
+
         out = self.session.send_command('echo %s' % MAGIC_STR, timeout=0.1)
         # if not avaiable, try to send ^C and check again
         if MAGIC_STR not in out:
@@ -98,7 +133,9 @@ class SSHConnection(object):
         return True
 
     def copy_file_from(self, src, dst=".", password=''):
-        self.session.copy_file_from(src, dst, password)
+        with profiler.overhead(OVERHEAD_COPY):
+            self.session.copy_file_from(src, dst, password)
 
     def copy_file_to(self, src, dst="~/", password=''):
-        self.session.copy_file_to(src, dst, password)
+        with profiler.overhead(OVERHEAD_COPY):
+            self.session.copy_file_to(src, dst, password)
@@ -0,0 +1,312 @@
+# BSD LICENSE
+#
+# Copyright(c) 2010-2017 Intel Corporation. All rights reserved.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of Intel Corporation nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import time
+import select
+import tempfile
+import threading
+import subprocess
+import pexpect
+from debugger import ignore_keyintr, aware_keyintr
+from exception import TimeoutException, SSHConnectionException, SSHSessionDeadException
+from ssh_pexpect import SSHPexpect
+from utils import RED
+
+"""
+Module handle multiplexed ssh sessions between tester and DUT.
+Commands are framed and executed in one persistent shell over an OpenSSH
+ControlMaster connection, so exit status and output of each command are
+returned in a single round trip without prompt matching.
+Interactive applications (testpmd, scapy...) still run in a pexpect session.
+"""
+
+# expected strings which stand for the end of a shell command
+SHELL_PROMPTS = ['#', '$']
+# seconds master connection keeps alive after last session closed
+CONTROL_PERSIST = 600
+# serialize master connection creation for sessions on the same host
+MASTER_LOCK = threading.Lock()
+
+
+class SSHMux(object):
+
+    def __init__(self, host, username, password):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.name = host
+        self.logger = None
+        self.shell = None
+        self.seq = 0
+        self.cwd = ''
+        # pexpect session for interactive applications
+        self.pexpect_session = None
+        self.interactive = False
+        self.interactive_cwd = ''
+
+        if ':' in host:
+            self.ip = host.split(':')[0]
+            self.port = int(host.split(':')[1])
+        else:
+            self.ip = host
+            self.port = 22
+        self.control_path = os.path.join(tempfile.gettempdir(),
+            'dts-%s@%s:%d' % (username, self.ip, self.port))
+
+        try:
+            self.__start_master()
+            self.__start_shell()
+        except Exception, e:
+            print RED(e)
+            raise SSHConnectionException(host)
+
+    def init_log(self, logger, name):
+        self.logger = logger
+        self.name = name
+        self.logger.info("ssh %s@%s (multiplexed)" % (self.username, self.host))
+
+    def __login(self):
+        return '%s@%s' % (self.username, self.ip)
+
+    def __ssh_options(self):
+        return ['-o', 'ControlPath=%s' % self.control_path,
+                '-o', 'NoHostAuthenticationForLocalhost=yes']
+
+    def __master_alive(self):
+        command = ['ssh'] + self.__ssh_options() + \
+            ['-p', str(self.port), '-O', 'check', self.__login()]
+        with open(os.devnull, 'w') as null:
+            return subprocess.call(command, stdout=null, stderr=null) == 0
+
+    def __start_master(self):
+        """
+        Create master connection if there's no one for this host. Password is
+        only required here, later sessions are authenticated by master.
+        """
+        with MASTER_LOCK:
+            if self.__master_alive():
+                return
+
+            command = 'ssh -M -N -f -o ControlPersist=%d %s -p %d %s' % (
+                CONTROL_PERSIST, ' '.join(self.__ssh_options()), self.port,
+                self.__login())
+            p = pexpect.spawn(command)
+            ssh_newkey = 'Are you sure you want to continue connecting'
+            i = p.expect([ssh_newkey, '[pP]assword', pexpect.EOF,
+                          pexpect.TIMEOUT], 20)
+            if i == 0:  # add once in trust list
+                p.sendline('yes')
+                i = p.expect([ssh_newkey, '[pP]assword', pexpect.EOF,
+                              pexpect.TIMEOUT], 20)
+            if i == 1:
+                p.sendline(self.password)
+                p.expect([pexpect.EOF, pexpect.TIMEOUT], 20)
+            p.close()
+
+            if not self.__master_alive():
+                raise SSHConnectionException(self.host)
+
+    def __start_shell(self):
+        """
+        Start persistent login shell over master connection.
+        """
+        command = ['ssh'] + self.__ssh_options() + \
+            ['-p', str(self.port), '-T', self.__login(), 'exec bash -l']
+        self.shell = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE,
+                                      bufsize=0, close_fds=True)
+        cwd = self.cwd
+        self.execute('shopt -s expand_aliases', timeout=20)
+        if cwd:
+            self.execute('cd %s' % cwd, timeout=20)
+
+    def __stop_shell(self):
+        if self.shell is None:
+            return
+        if self.shell.poll() is None:
+            self.shell.kill()
+        self.shell.wait()
+        self.shell = None
+
+    def execute(self, command, timeout=15):
+        """
+        Run command in persistent shell, return exit status, stdout and
+        stderr. TimeoutException will be raised if command not finished
+        before timeout and the shell will be restarted.
+        """
+        if not self.isalive():
+            raise SSHSessionDeadException(self.host)
+
+        self.seq += 1
+        marker = 'DTS_MUX_%d_%d' % (os.getpid(), self.seq)
+        frame = '{ %s\n} < /dev/null\n' % command + \
+            '__dts_rc=$?; echo; echo "%s $__dts_rc $PWD"; ' % marker + \
+            'echo >&2; echo %s >&2\n' % marker
+        try:
+            self.shell.stdin.write(frame)
+        except IOError:
+            raise SSHSessionDeadException(self.host)
+
+        out_tail = '\n%s ' % marker
+        err_tail = '\n%s\n' % marker
+        out = ''
+        err = ''
+        deadline = time.time() + timeout
+        while True:
+            pos = out.find(out_tail)
+            if pos != -1 and out.endswith('\n') and err.endswith(err_tail):
+                break
+
+            remain = deadline - time.time()
+            if remain <= 0:
+                self.__stop_shell()
+                self.__start_shell()
+                raise TimeoutException(command, out + err)
+
+            readable, _, _ = select.select([self.shell.stdout,
+                                            self.shell.stderr], [], [], remain)
+            for pipe in readable:
+                data = os.read(pipe.fileno(), 4096)
+                if not data:
+                    self.__stop_shell()
+                    raise SSHSessionDeadException(self.host)
+                if pipe is self.shell.stdout:
+                    out += data
+                else:
+                    err += data
+
+        status, self.cwd = out[pos + len(out_tail):-1].split(' ', 1)
+        return int(status), out[:pos], err[:-len(err_tail)]
+
+    def __interactive_session(self):
+        """
+        Return pexpect session for interactive applications, its working
+        directory will follow the framed shell.
+        """
+        if self.pexpect_session is None:
+            self.pexpect_session = SSHPexpect(self.host, self.username,
+                                              self.password)
+            if self.logger is not None:
+                self.pexpect_session.init_log(self.logger, self.name)
+
+        if not self.interactive and self.cwd and \
+                self.cwd != self.interactive_cwd:
+            self.pexpect_session.send_expect('cd %s' % self.cwd, '# ')
+            self.interactive_cwd = self.cwd
+
+        return self.pexpect_session
+
+    def send_expect(self, command, expected, timeout=15, verify=False):
+        if self.interactive or expected.strip() not in SHELL_PROMPTS:
+            session = self.__interactive_session()
+            self.interactive = True
+            ret = session.send_expect(command, expected, timeout, verify)
+            # application exited and back to shell
+            if expected.strip() in SHELL_PROMPTS:
+                self.interactive = False
+            return ret
+
+        ignore_keyintr()
+        try:
+            status, out, err = self.execute(command, timeout)
+        finally:
+            aware_keyintr()
+
+        # keep output format same as pexpect session
+        ret = (out + err).rstrip('\n').replace('\n', '\r\n')
+        if verify and status:
+            self.logger.error("Command: %s failure!" % command)
+            self.logger.error(ret)
+            return status
+
+        return ret
+
+    def send_command(self, command, timeout=1):
+        # no end mark for the command, can only be handled by pexpect
+        session = self.__interactive_session()
+        self.interactive = True
+        return session.send_command(command, timeout)
+
+    def get_session_before(self, timeout=15):
+        if self.pexpect_session is None:
+            return ''
+        return self.pexpect_session.get_session_before(timeout)
+
+    @property
+    def session(self):
+        """
+        Pexpect object of interactive session, used by debug module.
+        """
+        return self.__interactive_session().session
+
+    def close(self, force=False):
+        if self.pexpect_session is not None:
+            self.pexpect_session.close(force)
+            self.pexpect_session = None
+
+        if self.shell is not None and not force and self.isalive():
+            try:
+                self.shell.stdin.write('exit\n')
+            except IOError:
+                pass
+        self.__stop_shell()
+
+    def isalive(self):
+        return self.shell is not None and self.shell.poll() is None
+
+    def copy_file_from(self, src, dst=".", password=''):
+        """
+        Copies a file from a remote place into local.
+        """
+        command = ['scp'] + self.__ssh_options() + \
+            ['-P', str(self.port), '%s:%s' % (self.__login(), src), dst]
+        self.__scp(command)
+
+    def copy_file_to(self, src, dst="~/", password=''):
+        """
+        Sends a local file to a remote place.
+        """
+        command = ['scp'] + self.__ssh_options() + \
+            ['-P', str(self.port), src, '%s:%s' % (self.__login(), dst)]
+        self.__scp(command)
+
+    def __scp(self, command):
+        """
+        Transfer a file with SCP over master connection.
+        """
+        self.logger.info(' '.join(command))
+        p = subprocess.Popen(command, stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT)
+        out = p.communicate()[0]
+        if p.returncode:
+            self.logger.error("SCP error %d: %s" % (p.returncode, out))
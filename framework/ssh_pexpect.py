@@ -4,6 +4,7 @@ from pexpect import pxssh
 from debugger import ignore_keyintr, aware_keyintr
 from exception import TimeoutException, SSHConnectionException, SSHSessionDeadException
 from utils import RED, GREEN
+from profiler import profiler
 
 """
 Module handle ssh sessions between tester and DUT.
@@ -174,7 +175,6 @@ class SSHPexpect(object):
         """
         self.logger.info(scp_cmd)
         p = pexpect.spawn(scp_cmd)
-        time.sleep(0.5)
         ssh_newkey = 'Are you sure you want to continue connecting'
         i = p.expect([ssh_newkey, '[pP]assword', "# ", pexpect.EOF,
                       pexpect.TIMEOUT], 120)
@@ -183,7 +183,7 @@ class SSHPexpect(object):
             i = p.expect([ssh_newkey, '[pP]assword', pexpect.EOF], 2)
 
         if i == 1:
-            time.sleep(0.5)
+            profiler.sleep(0.5)
             p.sendline(password)
             p.expect("Exit status 0", 60)
         if i == 4:
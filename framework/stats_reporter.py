@@ -33,6 +33,8 @@
 Simple text file statistics generator
 """
 
+from profiler import summarize_timings
+
 
 class StatsReporter(object):
 
@@ -73,6 +75,27 @@ class StatsReporter(object):
         if self.total > 0:
             rate = self.passed * 100.0 / self.total
         self.stats_file.write("Pass rate  = %.1f\n" % rate)
+        for dut, target, seconds in self.result.all_build_times():
+            self.stats_file.write("Build time = %.1f (%s %s)\n" %
+                                  (seconds, dut, target))
+        self.__write_timings()
+
+    def __write_timings(self):
+        slowest, overheads = summarize_timings(self.result.all_case_timings())
+        if not slowest:
+            return
+        self.stats_file.write("\nSlowest cases:\n")
+        for timing in slowest:
+            phases = ', '.join("%s %.1f" % (name, seconds) for name, seconds
+                               in sorted(timing['phases'].items()))
+            self.stats_file.write("%10.1f  %s/%s (%s)\n" %
+                                  (timing['total'], timing['suite'],
+                                   timing['case'], phases))
+        self.stats_file.write("\nOverheads:\n")
+        for category, stat in overheads:
+            self.stats_file.write("%10.1f  %-10s count %d, max %.1f\n" %
+                                  (stat['time'], category, stat['count'],
+                                   stat['max']))
 
     def save(self, result):
         self.passed = 0
@@ -33,6 +33,7 @@
 A base class for creating DTF test cases.
 """
 import re
+import sys
 import debugger
 import traceback
 import signal
@@ -43,10 +44,18 @@ from settings import PERF_SETTING, FUNC_SETTING, DEBUG_SETTING, DEBUG_CASE_SETTI
 from rst import RstReport
 from test_result import ResultTable, Result
 from logger import getLogger
+from profiler import profiler
+from journal import restore_case_result
 
 
 class TestCase(object):
 
+    # requirements for scheduling suite on CRB, supported nic names (empty
+    # for any), minimal number of DUT ports and socket of them (-1 for any)
+    required_nics = []
+    required_ports = 0
+    required_socket = -1
+
     def __init__(self, duts, tester, target, suitename):
         self.suite_name = suitename
         self.dut = duts[0]
@@ -60,6 +69,13 @@ class TestCase(object):
         self.logger.config_suite(class_name)
         # local variable
         self._requested_tests = None
+        # timing of suite setup, teardown and each case
+        self._timings = []
+        # journal of execution and cases completed in it
+        self._journal = None
+        self._journal_dut = None
+        self._completed_cases = {}
+        self._skip_suite = False
 
         # check session and reconnect if possible
         for dutobj in self.duts:
@@ -201,6 +217,46 @@ class TestCase(object):
         """
         self._requested_tests = case_list
 
+    def set_journal(self, journal, dut):
+        """
+        Record case results into journal, cases completed in journal will
+        not be executed again.
+        """
+        self._journal = journal
+        self._journal_dut = dut
+        self._completed_cases = journal.completed_cases(dut, self.target,
+                                                        self.suite_name)
+
+    def has_pending_cases(self):
+        """
+        Check whether any requested case has not been completed in journal.
+        """
+        cases = []
+        if self._enable_func:
+            cases += list(self._get_functional_cases())
+        if self._enable_perf:
+            cases += list(self._get_performance_cases())
+        return any(case_obj.__name__ not in self._completed_cases
+                   for case_obj in cases)
+
+    def skip_suite(self):
+        """
+        Skip setup and teardown of suite, only results in journal are
+        restored.
+        """
+        self._skip_suite = True
+
+    def _journal_case(self, case_name):
+        if self._journal is None:
+            return
+        case_result = self._suite_result.result_for(
+            self._suite_result.dut, self.target, self.suite_name, case_name)
+        # case may be interrupted before result recorded
+        if case_result:
+            self._journal.record_case(self._journal_dut, self.target,
+                                      self.nic, self.suite_name, case_name,
+                                      case_result[0], case_result[1])
+
     def _get_test_cases(self, test_name_regex):
         """
         Return case list which name matched regex.
@@ -219,8 +275,10 @@ class TestCase(object):
             dutobj.get_session_output(timeout=0.1)
         self.tester.get_session_output(timeout=0.1)
 
+        profiler.start_case(self.suite_name, 'set_up_all')
         try:
-            self.set_up_all()
+            with profiler.phase('set_up_all'):
+                self.set_up_all()
             return True
         except Exception:
             self.logger.error('set_up_all failed:\n' + traceback.format_exc())
@@ -234,6 +292,8 @@ class TestCase(object):
                     self._suite_result.test_case = case_obj.__name__
                     self._suite_result.test_case_blocked('set_up_all failed')
             return False
+        finally:
+            self._timings.append(profiler.end_case())
 
     def _execute_test_case(self, case_obj):
         """
@@ -245,11 +305,20 @@ class TestCase(object):
 
         self._rst_obj.write_title("Test Case: " + case_name)
 
+        if case_name in self._completed_cases:
+            status, message = self._completed_cases[case_name]
+            self.logger.info('Test Case %s Result %s in journal' %
+                             (case_name, status))
+            self._rst_obj.write_result(status)
+            restore_case_result(self._suite_result, status, message)
+            return
+
         if self._check_inst is not None:
             if self._check_inst.case_skip(case_name[len("test_"):]):
                 self.logger.info('Test Case %s Result SKIPED:' % case_name)
                 self._rst_obj.write_result("N/A")
                 self._suite_result.test_case_skip(self._check_inst.comments)
+                self._journal_case(case_name)
                 return
 
         if self._support_inst is not None:
@@ -257,10 +326,12 @@ class TestCase(object):
                 self.logger.info('Test Case %s Result SKIPED:' % case_name)
                 self._rst_obj.write_result("N/A")
                 self._suite_result.test_case_skip(self._support_inst.comments)
+                self._journal_case(case_name)
                 return
 
         if self._enable_perf:
             self._rst_obj.write_annex_title("Annex: " + case_name)
+        profiler.start_case(self.suite_name, case_name)
         try:
             self.logger.info('Test Case %s Begin' % case_name)
 
@@ -270,7 +341,8 @@ class TestCase(object):
                 dutobj.get_session_output(timeout=0.1)
             self.tester.get_session_output(timeout=0.1)
             # run set_up function for each case
-            self.set_up()
+            with profiler.phase('set_up'):
+                self.set_up()
             # prepare debugger re-run case environment
             if self._enable_debug or self._debug_case:
                 debugger.AliveSuite = self
@@ -279,7 +351,8 @@ class TestCase(object):
             if self._debug_case:
                 debugger.keyboard_handle(signal.SIGINT, None)
             else:
-                case_obj()
+                with profiler.phase('case'):
+                    case_obj()
 
             self._suite_result.test_case_passed()
 
@@ -293,7 +366,8 @@ class TestCase(object):
         except KeyboardInterrupt:
             self._suite_result.test_case_blocked("Skipped")
             self.logger.error('Test Case %s SKIPED: ' % (case_name))
-            self.tear_down()
+            with profiler.phase('tear_down'):
+                self.tear_down()
             raise KeyboardInterrupt("Stop DTS")
         except TimeoutException as e:
             self._rst_obj.write_result("FAIL")
@@ -306,7 +380,15 @@ class TestCase(object):
             self._suite_result.test_case_failed(trace)
             self.logger.error('Test Case %s Result ERROR: ' % (case_name) + trace)
         finally:
-            self.tear_down()
+            with profiler.phase('tear_down'):
+                self.tear_down()
+            # stop background captures started by this case, cases of
+            # other DUT/tester pairs may be running in other threads
+            packet = sys.modules.get('packet')
+            if packet is not None and hasattr(packet, 'stop_all_sniff'):
+                packet.stop_all_sniff()
+            self._timings.append(profiler.end_case())
+            self._journal_case(case_name)
 
     def execute_test_cases(self):
         """
@@ -322,23 +404,36 @@ class TestCase(object):
     def get_result(self):
         return self._suite_result
 
+    def get_timings(self):
+        """
+        Return timing of suite setup, teardown and each executed case.
+        """
+        return self._timings
+
     def execute_tear_downall(self):
         """
         execute suite tear_down_all function
         """
-        try:
-            self.tear_down_all()
-        except Exception:
-            self.logger.error('tear_down_all failed:\n' + traceback.format_exc())
+        if self._skip_suite:
+            return
 
-        for dutobj in self.duts:
-            dutobj.kill_all()
-        self.tester.kill_all()
+        profiler.start_case(self.suite_name, 'tear_down_all')
+        with profiler.phase('tear_down_all'):
+            try:
+                self.tear_down_all()
+            except Exception:
+                self.logger.error('tear_down_all failed:\n' + traceback.format_exc())
 
-        for dutobj in self.duts:
-            dutobj.virt_exit()
-            # destroy all vfs
-            dutobj.destroy_all_sriov_vfs()
+            for dutobj in self.duts:
+                dutobj.kill_all()
+            self.tester.kill_all()
+            self.tester.stop_scapy_worker()
+
+            for dutobj in self.duts:
+                dutobj.virt_exit()
+                # destroy all vfs
+                dutobj.destroy_all_sriov_vfs()
+        self._timings.append(profiler.end_case())
 
 
     def wirespeed(self, nic, frame_size, num_ports):
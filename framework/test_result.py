@@ -76,6 +76,8 @@ class Result(object):
         self.__internals = []
         self.__failed_duts = {}
         self.__failed_targets = {}
+        self.__build_times = {}
+        self.__case_timings = []
 
     def __set_dut(self, dut):
         if dut not in self.__internals:
@@ -282,6 +284,64 @@ class Result(object):
         """
         return self.__failed_targets[dut + target]
 
+    def add_build_time(self, dut, target, seconds):
+        """
+        Record time used to build the given DUT, target
+        """
+        self.__build_times[(dut, target)] = seconds
+
+    def build_time(self, dut, target):
+        """
+        Returns build time of the given DUT, target
+        """
+        return self.__build_times.get((dut, target))
+
+    def all_build_times(self):
+        """
+        Returns all (DUT, target, build time) records
+        """
+        return [(dut, target, seconds) for (dut, target), seconds in
+                sorted(self.__build_times.items())]
+
+    def add_case_timings(self, dut, target, timings):
+        """
+        Record timing of suite phases and cases on the given DUT, target
+        """
+        for timing in timings:
+            timing = dict(timing)
+            timing['dut'] = dut
+            timing['target'] = target
+            self.__case_timings.append(timing)
+
+    def all_case_timings(self):
+        """
+        Returns all timing records
+        """
+        return self.__case_timings
+
+    def merge(self, other):
+        """
+        Append all results recorded in other Result object, suite already
+        recorded will be replaced by the one in other
+        """
+        for dut in other.all_duts():
+            self.dut = dut
+            for target in other.all_targets(dut):
+                self.target = target
+                self.nic = other.current_nic(dut, target)
+                for suite in other.all_test_suites(dut, target):
+                    self.test_suite = suite
+                    cases = []
+                    self.__current_suites()[self.__test_suite + 1] = cases
+                    for case in other.all_test_cases(dut, target, suite):
+                        cases.append(case)
+                        cases.append(list(other.result_for(dut, target,
+                                                           suite, case)))
+        self.__failed_duts.update(other.__failed_duts)
+        self.__failed_targets.update(other.__failed_targets)
+        self.__build_times.update(other.__build_times)
+        self.__case_timings.extend(other.__case_timings)
+
     """
     Attributes defined as properties to hide the implementation from the
     presented interface.
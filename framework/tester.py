@@ -34,17 +34,19 @@ Interface for bulk traffic generators.
 """
 
 import re
+import json
 import subprocess
-from time import sleep
 from settings import NICS, load_global_setting, PERF_SETTING
 from crb import Crb
+from rfc2544 import RFC2544Search, RFC2544_RESOLUTION
+from rfc2544 import RFC2544_SEARCH_DELAY, RFC2544_MAX_ITERATIONS
+from ssh_connection import SSHConnection
 from net_device import GetNicObj
-from etgen import IxiaPacketGenerator, SoftwarePacketGenerator
-from settings import IXIA
+from etgen import IxiaPacketGenerator, SOFT_PACKET_GENERATORS
+from settings import IXIA, SOFT_PKTGEN, LOG_NAME_SEP
 import random
-from utils import GREEN, convert_int2ip, convert_ip2int
+from utils import GREEN, convert_ip2int
 from exception import ParameterInvalidException
-from multiprocessing import Process
 
 
 class Tester(Crb):
@@ -58,10 +60,18 @@ class Tester(Crb):
     CORE_LIST_CACHE_KEY = 'tester_core_list'
     NUMBER_CORES_CACHE_KEY = 'tester_number_cores'
     PCI_DEV_CACHE_KEY = 'tester_pci_dev_info'
+    SCAPY_WORKER = 'dep/scapy_worker.py'
+    SCAPY_WORKER_PROMPT = 'SCAPY_WORKER> '
 
     def __init__(self, crb, serializer):
         self.NAME = 'tester'
-        super(Tester, self).__init__(crb, serializer, self.NAME)
+        name = self.NAME
+        # testers of concurrent DUT/tester pairs need separated loggers,
+        # pairs may share the same tester
+        if crb.get('parallel'):
+            name += LOG_NAME_SEP + crb['section'] + LOG_NAME_SEP + \
+                crb['My IP']
+        super(Tester, self).__init__(crb, serializer, name)
 
         self.bgProcIsRunning = False
         self.duts = None
@@ -69,6 +79,8 @@ class Tester(Crb):
         self.scapyCmds = []
         self.bgCmds = []
         self.bgItf = ''
+        self.scapy_worker = None
+        self.rfc2544_trials = []
 
     def init_ext_gen(self):
         """
@@ -76,7 +88,7 @@ class Tester(Crb):
         """
         if self.it_uses_external_generator():
             self.ixia_packet_gen = IxiaPacketGenerator(self)
-        self.packet_gen = SoftwarePacketGenerator(self)
+        self.packet_gen = self.get_soft_packet_generator()(self)
 
     def get_ip_address(self):
         """
@@ -108,6 +120,16 @@ class Tester(Crb):
         """
         return self.crb[IXIA]
 
+    def get_soft_packet_generator(self):
+        """
+        Return class of software packet generator configured for tester.
+        """
+        name = self.crb.get(SOFT_PKTGEN) or 'pktgen'
+        if name not in SOFT_PACKET_GENERATORS:
+            raise ParameterInvalidException("unknown software packet "
+                                            "generator %s" % name)
+        return SOFT_PACKET_GENERATORS[name]
+
     def it_uses_external_generator(self):
         """
         Check whether IXIA generator is ready for performance test.
@@ -219,22 +241,27 @@ class Tester(Crb):
         self.send_expect("modprobe e1000e", "# ", 20)
         self.send_expect("modprobe e1000", "# ", 20)
 
+        itfs = []
         try:
+            self.scan_pci_devices_detail()
             for (pci_bus, pci_id) in self.pci_devices_info:
                 addr_array = pci_bus.split(':')
                 port = GetNicObj(self, addr_array[0], addr_array[1], addr_array[2])
-                itf = port.get_interface_name()
-                self.enable_ipv6(itf)
-                self.send_expect("ifconfig %s up" % itf, "# ")
+                itfs.append(port.get_interface_name())
                 if port.get_interface2_name():
-                    itf = port.get_interface2_name()
-                    self.enable_ipv6(itf)
-                    self.send_expect("ifconfig %s up" % itf, "# ")
+                    itfs.append(port.get_interface2_name())
 
+            # interfaces are independent, enable them concurrently
+            self.run_parallel(["sysctl net.ipv6.conf.%s.disable_ipv6=0; "
+                               "ifconfig %s up" % (itf, itf)
+                               for itf in itfs if itf != 'N/A'])
         except Exception as e:
             self.logger.error("   !!! Restore ITF: " + e.message)
+        finally:
+            self.clear_pci_devices_detail()
 
-        sleep(2)
+        # interfaces without cable will never be up, keep old deadline
+        self.wait_link_status([itf for itf in itfs if itf != 'N/A'], 'up', 2)
 
     def set_promisc(self):
         try:
@@ -278,7 +305,12 @@ class Tester(Crb):
             self.scan_ports_cached()
 
         if not self.read_cache or self.ports_info is None:
-            self.scan_ports_uncached()
+            # ports' information will be taken from one bulk scan
+            self.scan_pci_devices_detail()
+            try:
+                self.scan_ports_uncached()
+            finally:
+                self.clear_pci_devices_detail()
             if self.it_uses_external_generator():
                 self.ports_info.extend(self.ixia_packet_gen.get_ports())
             self.save_serializer_ports()
@@ -421,24 +453,97 @@ class Tester(Crb):
         """
         self.scapyCmds.append(cmd)
 
+    def start_scapy_worker(self):
+        """
+        Start long-lived scapy interpreter on tester, it will be reused by
+        all later scapy_execute calls until stopped.
+        """
+        if self.scapy_worker is not None:
+            if self.scapy_worker.isalive():
+                return
+            self.stop_scapy_worker()
+
+        self.session.copy_file_to(self.SCAPY_WORKER,
+                                  password=self.get_password())
+        session = SSHConnection(self.get_ip_address(), self.NAME + '_scapy',
+                                self.get_password())
+        session.init_log(self.logger)
+        try:
+            session.send_expect("python -u %s" %
+                                self.SCAPY_WORKER.split('/')[-1],
+                                self.SCAPY_WORKER_PROMPT, 60)
+        except Exception:
+            session.close(force=True)
+            raise
+        self.scapy_worker = session
+
+    def stop_scapy_worker(self):
+        """
+        Exit scapy interpreter and close its session.
+        """
+        if self.scapy_worker is None:
+            return
+
+        session = self.scapy_worker
+        self.scapy_worker = None
+        try:
+            if session.isalive():
+                session.send_expect(json.dumps({'exit': True}), '# ', 5)
+            session.close()
+        except Exception:
+            session.close(force=True)
+
+    def scapy_worker_execute(self, cmds, timeout=60):
+        """
+        Execute command list in scapy worker, timeout is for each command.
+        Return list of dictionary with command, output and error.
+        """
+        self.start_scapy_worker()
+
+        request = json.dumps({'cmds': cmds})
+        try:
+            out = self.scapy_worker.send_expect(request,
+                                                self.SCAPY_WORKER_PROMPT,
+                                                timeout * max(len(cmds), 1))
+        except Exception:
+            # interpreter state unknown, restart it in next execution
+            self.stop_scapy_worker()
+            raise
+
+        m = re.search(r"SCAPY_RESULT: (.*)", out)
+        if m is None:
+            self.logger.error("Scapy worker returned no result:\n" + out)
+            self.stop_scapy_worker()
+            return []
+
+        results = json.loads(m.group(1))
+        for result in results:
+            if result['error']:
+                self.logger.warning("Scapy command [%s] failed:\n%s" %
+                                    (result['command'], result['error']))
+        return results
+
     def scapy_execute(self, timeout=60):
         """
-        Execute scapy command list.
+        Execute scapy command list in scapy worker.
         """
         self.kill_all()
 
-        self.send_expect("scapy", ">>> ")
-        if self.bgProcIsRunning:
-            self.send_expect('subprocess.call("scapy -c sniff.py &", shell=True)', ">>> ")
+        cmds = []
+        sniffing = self.bgProcIsRunning
+        if sniffing:
+            # wait for background sniffer ready before sending packets
+            cmds.append('subprocess.call("scapy -c sniff.py &", shell=True)')
+            cmds.append('time.sleep(2)')
             self.bgProcIsRunning = False
-        sleep(2)
-
-        for cmd in self.scapyCmds:
-            self.send_expect(cmd, ">>> ", timeout)
 
-        sleep(2)
+        cmds += self.scapyCmds
         self.scapyCmds = []
-        self.send_expect("exit()", "# ")
+
+        if sniffing:
+            cmds.append('time.sleep(2)')
+
+        return self.scapy_worker_execute(cmds, timeout)
 
     def scapy_background(self):
         """
@@ -487,23 +592,26 @@ class Tester(Crb):
         if not self.check_port_list(portList):
             self.logger.warning("exception by mixed port types")
             return None
-        return self.packet_gen.throughput(portList, rate_percent)
-
-    def run_rfc2544(self, portlist, delay=120, permit_loss_rate=0):
-        """
-        test_rate: the line rate we are going to test.
-        """
-        test_rate = float(100)
-
-        self.logger.info("test rate: %f " % test_rate)
-        loss_rate, tx_num, rx_num = self.traffic_generator_loss(portlist, test_rate, delay)
-        while loss_rate > permit_loss_rate:
-                test_rate = float(1 - loss_rate) * test_rate
-                loss_rate, tx_num, rx_num = self.traffic_generator_loss(portlist, test_rate, delay)
-
-        self.logger.info("zero loss rate is %s" % test_rate)
-        return test_rate, tx_num, rx_num
-
+        return self.packet_gen.throughput(portList, rate_percent, delay)
+
+    def run_rfc2544(self, portlist, delay=120, permit_loss_rate=0,
+                    resolution=RFC2544_RESOLUTION,
+                    search_delay=RFC2544_SEARCH_DELAY,
+                    max_iterations=RFC2544_MAX_ITERATIONS):
+        """
+        Search zero loss rate by bisection between passed and failed rates.
+        Searching trials last search_delay seconds, found rate is verified
+        by trial of delay seconds. Telemetry of trials is kept in
+        rfc2544_trials.
+        """
+        trial = lambda rate, duration: \
+            self.traffic_generator_loss(portlist, rate, duration)
+        search = RFC2544Search(trial, self.logger, delay, permit_loss_rate,
+                               resolution, search_delay, max_iterations)
+        try:
+            return search.run()
+        finally:
+            self.rfc2544_trials = search.trials
 
     def traffic_generator_loss(self, portList, ratePercent, delay=60):
         """
@@ -522,27 +630,25 @@ class Tester(Crb):
         """
         if self.check_port_list(portList, 'ixia'):
             return self.ixia_packet_gen.latency(portList, ratePercent, delay)
+        elif self.check_port_list(portList) and \
+                hasattr(self.packet_gen, 'latency'):
+            return self.packet_gen.latency(portList, ratePercent, delay)
         else:
             return None
 
-    def parallel_transmit_ptks(self, send_f=None, intf='', pkts=[], interval=0.01):
-        """
-        Callable function for parallel processes
+    def check_random_pkts(self, portList, pktnum=2000, interval=0.0001, allow_miss=True, params=None):
         """
-        print GREEN("Transmitting and sniffing packets, please wait few minutes...")
-        send_f(intf=intf, pkts=pkts, interval=interval)
-
-    def check_random_pkts(self, portList, pktnum=2000, interval=0.01, allow_miss=True, params=None):
-        """
-        Send several random packets and check rx packets matched
+        Send several random packets and check rx packets matched, interval
+        is the gap between packets sent on each port.
         """
         # load functions in packet module
         module = __import__("packet")
-        pkt_c = getattr(module, "Packet")
-        send_f = getattr(module, "send_packets")
+        template_c = getattr(module, "PacketTemplate")
+        transmit_f = getattr(module, "transmit_packets")
         sniff_f = getattr(module, "sniff_packets")
-        load_f = getattr(module, "load_sniff_packets")
-        compare_f = getattr(module, "compare_pktload")
+        iter_f = getattr(module, "iter_sniff_packets")
+        compare_c = getattr(module, "PacketComparator")
+        sequence_f = getattr(module, "frame_sequence")
         strip_f = getattr(module, "strip_pktload")
         save_f = getattr(module, "save_packets")
         tx_pkts = {}
@@ -552,36 +658,31 @@ class Tester(Crb):
         pkt_minlen = {'TCP': 64, 'UDP': 64, 'IPv6_TCP': 74, 'IPv6_UDP': 64}
         # at least wait 2 seconds
         timeout = int(pktnum * (interval + 0.01)) + 2
+        # build packet template once for each type
+        templates = {}
+        for pkt_type in random_type:
+            layers_config = []
+            # config packet if has parameters
+            if params and len(portList) == len(params):
+                layers_config += params
+            # hardcode src/dst port for some protocal may cause issue
+            if "TCP" in pkt_type:
+                layers_config.append(('tcp', {'src': 65535, 'dst': 65535}))
+            else:
+                layers_config.append(('udp', {'src': 65535, 'dst': 65535}))
+            templates[pkt_type] = template_c(pkt_type, layers_config)
+
         for txport, rxport in portList:
             pkts = []
             txIntf = self.get_interface(txport)
             rxIntf = self.get_interface(rxport)
-            print GREEN("Preparing transmit packets, please wait few minutes...")
+            print GREEN("Preparing transmit packets, please wait few seconds...")
             for num in range(pktnum):
-                # chose random packet
+                # chose random packet, sequence saved in layer3 source ip
                 pkt_type = random.choice(random_type)
-                pkt = pkt_c(pkt_type=pkt_type,
-                            pkt_len=random.randint(pkt_minlen[pkt_type], 1514),
-                            ran_payload=True)
-                # config packet if has parameters
-                if params and len(portList) == len(params):
-                    for param in params:
-                        layer, config = param
-                        pkt.config_layer(layer, config)
-                # hardcode src/dst port for some protocal may cause issue
-                if "TCP" in pkt_type:
-                    pkt.config_layer('tcp', {'src': 65535, 'dst': 65535})
-                else:
-                    pkt.config_layer('udp', {'src': 65535, 'dst': 65535})
-                # sequence saved in layer3 source ip
-                if "IPv6" in pkt_type:
-                    ip_str = convert_int2ip(num, 6)
-                    pkt.config_layer('ipv6', {'src': ip_str})
-                else:
-                    ip_str = convert_int2ip(num, 4)
-                    pkt.config_layer('ipv4', {'src': ip_str})
-
-                pkts.append(pkt)
+                pkt_len = random.randint(pkt_minlen[pkt_type], 1514)
+                pkts.append(templates[pkt_type].generate(num, pkt_len))
+
             tx_pkts[txport] = pkts
 
             # send and sniff packets
@@ -590,52 +691,48 @@ class Tester(Crb):
             rx_inst[rxport] = inst
 
         # Transmit packet simultaneously
-        processes = []
+        print GREEN("Transmitting and sniffing packets, please wait few seconds...")
+        intf_pkts = {}
         for txport, _ in portList:
-            txIntf = self.get_interface(txport)
-            processes.append(Process(target = self.parallel_transmit_ptks,
-                             args=(send_f, txIntf, tx_pkts[txport], interval)))
-
-        for transmit_proc in processes:
-            transmit_proc.start()
-
-        for transmit_proc in processes:
-            transmit_proc.join()
+            intf_pkts[self.get_interface(txport)] = tx_pkts[txport]
+        rate = 1.0 / interval if interval else None
+        tx_stats = transmit_f(intf_pkts, rate)
+        for intf, stats in tx_stats.items():
+            self.logger.info("Sent %d packets on %s at %.0f pps" %
+                             (stats['sent'], intf, stats['pps']))
+            if stats['errors']:
+                self.logger.warning("Send on %s failed %d times: %s" %
+                                    (intf, stats['errors'], stats['last_error']))
 
         # Verify all packets
         for txport, rxport in portList:
-            recv_pkts = load_f(rx_inst[rxport])
-
-            # only report when recevied number not matched
-            if len(tx_pkts[txport]) > len(recv_pkts):
-                print ("Pkt number not matched,%d sent and %d received\n" \
-                       % (len(tx_pkts[txport]), len(recv_pkts)))
-
-                if allow_miss is False:
-                    return False
+            # sent packets indexed by layer4 digest
+            comparator = compare_c(tx_pkts[txport], "L4")
 
             # check each received packet content
-            print GREEN("Comparing sniffed packets, please wait few minutes...")
-            for idx in range(len(recv_pkts)):
-                try:
-                    l3_type = recv_pkts[idx].strip_element_layer2('type')
-                    sip = recv_pkts[idx].strip_element_layer3('src')
-                except:
-                    continue
-                # ipv4 packet
-                if l3_type == 2048:
-                    t_idx = convert_ip2int(sip, 4)
-                # ipv6 packet
-                elif l3_type == 34525:
-                    t_idx = convert_ip2int(sip, 6)
-                else:
+            print GREEN("Comparing sniffed packets, please wait few seconds...")
+            recv_num = 0
+            for recv_pkt in iter_f(rx_inst[rxport]):
+                idx = recv_num
+                recv_num += 1
+                frame = recv_pkt.pktgen.get_frame()
+                t_idx = sequence_f(frame)
+                if t_idx is None or t_idx >= len(tx_pkts[txport]):
                     continue
 
-                if compare_f(tx_pkts[txport][t_idx], recv_pkts[idx], "L4") is False:
+                if comparator.match(frame, t_idx) is False:
                     print "Pkt recevied index %d not match original " \
                           "index %d" % (idx, t_idx)
                     print "Sent: %s" % strip_f(tx_pkts[txport][t_idx], "L4")
-                    print "Recv: %s" % strip_f(recv_pkts[idx], "L4")
+                    print "Recv: %s" % strip_f(recv_pkt, "L4")
+                    return False
+
+            # only report when recevied number not matched
+            if len(tx_pkts[txport]) > recv_num:
+                print ("Pkt number not matched,%d sent and %d received\n" \
+                       % (len(tx_pkts[txport]), recv_num))
+
+                if allow_miss is False:
                     return False
 
         return True
@@ -687,12 +784,14 @@ class Tester(Crb):
         """
         Close ssh session and IXIA tcl session.
         """
+        self.stop_scapy_worker()
         if self.session:
             self.session.close()
             self.session = None
         if self.alt_session:
             self.alt_session.close()
             self.alt_session = None
+        self.session_pool.close()
         if self.it_uses_external_generator():
             self.ixia_packet_gen.close()
 
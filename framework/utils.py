@@ -31,10 +31,15 @@
 
 import json         # json format
 import re
+import sys
 import os
 import inspect
+import math
 import socket
 import struct
+import threading
+import time
+from profiler import profiler
 
 DTS_ENV_PAT = r"DTS_*"
 
@@ -131,6 +136,81 @@ def copy_instance_attr(from_inst, to_inst):
         to_inst.__dict__[key] = from_inst.__dict__[key]
 
 
+def run_concurrently(funcs):
+    """
+    Call functions in separated threads and wait for all of them finished.
+    Return list of (return value, exception info) in the same order as
+    functions, exception info is None when function succeeded.
+    """
+    results = [(None, None)] * len(funcs)
+
+    def wrapper(index, func):
+        try:
+            results[index] = (func(), None)
+        except Exception:
+            results[index] = (None, sys.exc_info())
+
+    threads = []
+    for index, func in enumerate(funcs):
+        thread = threading.Thread(target=wrapper, args=(index, func))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        # join with timeout so that main thread still can be interrupted
+        while thread.is_alive():
+            thread.join(1)
+
+    return results
+
+
+def summarize_series(values):
+    """
+    Return aggregates of numeric time series: mean, min, max, p50, p99,
+    standard deviation and coefficient of variation.
+    """
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    count = len(ordered)
+    mean = float(sum(ordered)) / count
+    variance = sum((value - mean) ** 2 for value in ordered) / count
+
+    def percentile(pct):
+        # nearest rank
+        rank = int(math.ceil(pct / 100.0 * count)) - 1
+        return ordered[min(max(rank, 0), count - 1)]
+
+    stdev = math.sqrt(variance)
+    return {'count': count,
+            'mean': mean,
+            'min': ordered[0],
+            'max': ordered[-1],
+            'p50': percentile(50),
+            'p99': percentile(99),
+            'stdev': stdev,
+            'cv': stdev / mean if mean else 0.0}
+
+
+def wait_until(predicate, timeout=30, interval=0.1, max_interval=2):
+    """
+    Call predicate with exponential backoff until it returns true value or
+    timeout seconds passed. Return last value of predicate and the seconds
+    actually waited.
+    """
+    start = time.time()
+    deadline = start + timeout
+    while True:
+        value = predicate()
+        now = time.time()
+        if value or now >= deadline:
+            return value, now - start
+        profiler.sleep(min(interval, deadline - now))
+        interval = min(interval * 2, max_interval)
+
+
 def create_mask(indexes):
     """
     Convert index to hex mask.
@@ -141,6 +221,23 @@ def create_mask(indexes):
 
     return hex(val).rstrip("L")
 
+
+def parse_cpu_list(cpulist):
+    """
+    Convert kernel cpu list format like "1-3,8" to index list.
+    """
+    cpus = []
+    for field in cpulist.strip().split(','):
+        if not field:
+            continue
+        if '-' in field:
+            start, end = field.split('-')
+            cpus += range(int(start), int(end) + 1)
+        else:
+            cpus.append(int(field))
+
+    return cpus
+
 def convert_int2ip(value, ip_type):
     if ip_type == 4:
         ip_str = socket.inet_ntop(socket.AF_INET, struct.pack('!I', value))
@@ -42,6 +42,7 @@ from logger import getLogger
 from settings import CONFIG_ROOT_PATH
 from virt_dut import VirtDut
 from utils import remove_old_rsa_key
+from profiler import profiler, OVERHEAD_VM_BOOT
 
 ST_NOTSTART = "NOTSTART"
 ST_PAUSE = "PAUSE"
@@ -72,6 +73,9 @@ class VirtBase(object):
         # replace dut session
         self.host_session = self.host_dut.host_session
         self.host_logger = self.host_dut.logger
+        self.own_host_session = False
+        # reason of last start failure
+        self.start_error = None
         # base_dir existed for host dut has prepared it
         self.host_session.send_expect("cd %s" % self.host_dut.base_dir, "# ")
 
@@ -231,26 +235,55 @@ class VirtBase(object):
         self.load_global_config()
         self.load_local_config(self.suite)
 
-    def start(self, load_config=True, set_target=True, cpu_topo=''):
+    def init_vm_host_session(self):
+        """
+        Use dedicated host session and log for this VM, so that VMs can be
+        started and operated concurrently.
+        """
+        name = self.vm_name + '_host'
+        session = self.host_dut.create_session(name=name)
+        session.logger.config_suite(self.vm_name, 'dut')
+        session.send_expect("cd %s" % self.host_dut.base_dir, "# ")
+        self.host_session = session
+        self.host_logger = session.logger
+        self.own_host_session = True
+
+    def close_vm_host_session(self):
+        """
+        Close dedicated host session and fall back to shared one.
+        """
+        if self.own_host_session:
+            self.host_dut.destroy_session(self.host_session)
+            self.host_session = self.host_dut.host_session
+            self.host_logger = self.host_dut.logger
+            self.own_host_session = False
+
+    def start(self, load_config=True, set_target=True, cpu_topo='',
+              auto_portmap=True):
         """
         Start VM and instantiate the VM with VirtDut.
         """
+        self.start_error = None
         try:
             if load_config is True:
                 self.load_config()
+            self.prepare_image(set_target)
             # compose boot command for different hypervisors
             self.compose_boot_param()
 
-            # start virutal machine
-            self._start_vm()
+            with profiler.overhead(OVERHEAD_VM_BOOT):
+                # start virutal machine
+                self._start_vm()
 
-            if self.vm_status is ST_RUNNING:
-                # connect vm dut and init running environment
-                vm_dut = self.instantiate_vm_dut(set_target, cpu_topo)
-            else:
-                vm_dut = None
+                if self.vm_status is ST_RUNNING:
+                    # connect vm dut and init running environment
+                    vm_dut = self.instantiate_vm_dut(
+                        set_target, cpu_topo, auto_portmap=auto_portmap)
+                else:
+                    vm_dut = None
 
         except Exception as vm_except:
+            self.start_error = str(vm_except) or type(vm_except).__name__
             if self.handle_exception(vm_except):
                 print utils.RED("Handled expection " + str(type(vm_except)))
             else:
@@ -311,6 +344,12 @@ class VirtBase(object):
         else:
             return False
 
+    def prepare_image(self, set_target=True):
+        """
+        Prepare disk image of VM before boot command composed.
+        """
+        pass
+
     def _start_vm(self):
         """
         Start VM.
@@ -323,7 +362,8 @@ class VirtBase(object):
         """
         NotImplemented
 
-    def instantiate_vm_dut(self, set_target=True, cpu_topo='', bind_dev=True):
+    def instantiate_vm_dut(self, set_target=True, cpu_topo='', bind_dev=True,
+                           auto_portmap=True):
         """
         Instantiate the Dut class for VM.
         """
@@ -373,7 +413,8 @@ class VirtBase(object):
 
         try:
             # setting up dpdk in vm, must call at last
-            vm_dut.prerequisites(self.host_dut.package, self.host_dut.patches)
+            vm_dut.prerequisites(self.host_dut.package, self.host_dut.patches,
+                                 auto_portmap)
             if set_target:
                 target = self.host_dut.target
                 vm_dut.set_target(target, bind_dev)
@@ -402,6 +443,7 @@ class VirtBase(object):
         self._stop_vm()
 
         self.virt_pool.free_all_resource(self.vm_name)
+        self.close_vm_host_session()
 
     def register_exit_callback(self, callback):
         """
@@ -40,6 +40,8 @@ from project_dpdk import DPDKdut
 from dut import Dut
 from net_device import GetNicObj
 from net_device import RemoveNicObj
+from virt_image import GOLDEN_STAMP_FILE, build_stamp
+from profiler import profiler
 
 
 class VirtDut(DPDKdut):
@@ -71,6 +73,9 @@ class VirtDut(DPDKdut):
         self.ports_info = None
         self.ports_map = []
         self.virttype = virttype
+        self.build_time = {}
+        self.built_targets = {}
+        self.package_hash = None
 
     def init_log(self):
         self.logger.config_suite(self.host_dut.test_classname, 'virtdut')
@@ -82,6 +87,7 @@ class VirtDut(DPDKdut):
         if self.alt_session:
             self.alt_session.close(force)
             self.alt_session = None
+        self.session_pool.close()
         RemoveNicObj(self)
 
     def set_nic_type(self, nic_type):
@@ -101,9 +107,9 @@ class VirtDut(DPDKdut):
 
         return
 
-    def create_portmap(self):
+    def create_portmap(self, auto_portmap=True):
         # if not config ports in vm port config file, used ping6 get portmap
-        if not self.ports_cfg:
+        if not self.ports_cfg and auto_portmap:
             self.map_available_ports()
         port_num = len(self.ports_info)
         self.ports_map = [-1] * port_num
@@ -119,6 +125,26 @@ class VirtDut(DPDKdut):
                 pci_idx = self.tester.get_local_index(tester_pci)
                 self.ports_map[index] = pci_idx
 
+    def prebuilt(self, target):
+        """
+        Check whether DPDK package has been extracted and target built in
+        golden image which VM started from.
+        """
+        if settings.load_global_setting(
+                settings.VM_IMAGE_CACHE_SETTING) != 'yes':
+            return False
+
+        out = self.send_expect("cat %s/%s" % (self.base_dir, GOLDEN_STAMP_FILE),
+                               "# ", verify=True)
+        if type(out) is int and out != 0:
+            return False
+
+        if out.strip() != build_stamp(self.host_dut, target):
+            return False
+
+        self.logger.info("DPDK %s prebuilt in guest image" % target)
+        return True
+
     def set_target(self, target, bind_dev=True):
         """
         Set env variable, these have to be setup all the time. Some tests
@@ -133,7 +159,7 @@ class VirtDut(DPDKdut):
         # example apps by themselves and will fail otherwise.
         self.send_expect("export RTE_TARGET=" + target, "#")
         self.send_expect("export RTE_SDK=`pwd`", "#")
-        if not self.skip_setup:
+        if not self.skip_setup and not self.prebuilt(target):
             self.build_install_dpdk(target)
 
         self.setup_memory(hugepages=1024)
@@ -142,14 +168,14 @@ class VirtDut(DPDKdut):
         if bind_dev:
             self.bind_interfaces_linux('igb_uio')
 
-    def prerequisites(self, pkgName, patch):
+    def prerequisites(self, pkgName, patch, auto_portmap=True):
         """
         Prerequest function should be called before execute any test case.
         Will call function to scan all lcore's information which on DUT.
         Then call pci scan function to collect nic device information.
         At last setup DUT' environment for validation.
         """
-        if not self.skip_setup:
+        if not self.skip_setup and not self.prebuilt(self.host_dut.target):
             self.prepare_package()
 
         self.send_expect("cd %s" % self.base_dir, "# ")
@@ -180,14 +206,18 @@ class VirtDut(DPDKdut):
         # load port infor from config file
         self.load_portconf()
 
-        # enable tester port ipv6
-        self.host_dut.enable_tester_ipv6()
         self.mount_procfs()
 
-        self.create_portmap()
-
-        # disable tester port ipv6
-        self.host_dut.disable_tester_ipv6()
+        if auto_portmap and not self.ports_cfg:
+            # ping6 from tester can't be shared with other VMs
+            with self.host_dut.portmap_lock:
+                # enable tester port ipv6
+                self.host_dut.enable_tester_ipv6()
+                self.create_portmap()
+                # disable tester port ipv6
+                self.host_dut.disable_tester_ipv6()
+        else:
+            self.create_portmap(auto_portmap)
 
         # print latest ports_info
         for port_info in self.ports_info:
@@ -257,7 +287,7 @@ class VirtDut(DPDKdut):
                 port = GetNicObj(self, domain_id, bus_id, devfun_id)
                 itf = port.get_interface_name()
                 self.send_expect("ifconfig %s up" % itf, "# ")
-                time.sleep(30)
+                profiler.sleep(30)
                 print self.send_expect("ip link ls %s" % itf, "# ")
             else:
                 self.logger.info(
@@ -0,0 +1,200 @@
+# BSD LICENSE
+#
+# Copyright(c) 2010-2017 Intel Corporation. All rights reserved.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of Intel Corporation nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import copy
+import hashlib
+import threading
+
+from settings import VM_IMAGE_CACHE, VM_IMAGE_CACHE_SIZE
+from settings import DPDK_RXMODE_SETTING, HOST_DRIVER_SETTING
+from settings import load_global_setting
+
+"""
+Cache of golden guest images on host. DPDK package has been extracted and
+built in golden image, VMs are started from qcow2 overlays backed by it.
+"""
+
+GOLDEN_STAMP_FILE = '.dts_golden'
+
+# options not needed or not available when building golden image, options
+# named by VM will be set again for builder
+BUILDER_SKIP_OPTIONS = ['disk', 'device', 'migration', 'usercmd', 'name',
+                        'pid_file', 'monitor', 'qmp', 'qga']
+
+# golden image may be requested by VMs started concurrently
+_image_locks = {}
+_locks_lock = threading.Lock()
+
+
+def image_lock(key):
+    with _locks_lock:
+        if key not in _image_locks:
+            _image_locks[key] = threading.Lock()
+        return _image_locks[key]
+
+
+def build_stamp(dut, target):
+    """
+    Stamp of DPDK package, patches, build settings and target, saved in
+    DPDK folder of golden image.
+    """
+    md5 = hashlib.md5()
+    md5.update(dut.get_package_hash())
+    md5.update(load_global_setting(DPDK_RXMODE_SETTING))
+    md5.update(load_global_setting(HOST_DRIVER_SETTING))
+    md5.update(target)
+    return md5.hexdigest()
+
+
+class GoldenImage(object):
+
+    """
+    Golden image keyed by base image, DPDK package hash and target. Image
+    is built by booting a VM with same configuration as the requesting VM,
+    except pass-through devices, and setting up DPDK in it.
+    """
+
+    def __init__(self, vm, base_image, target):
+        self.vm = vm
+        self.host_dut = vm.host_dut
+        self.session = vm.host_session
+        self.logger = vm.host_logger
+        self.base_image = base_image
+        self.target = target
+        self.stamp = build_stamp(self.host_dut, target)
+
+    def image_key(self):
+        """
+        Base image is identified by path, size and modification time.
+        """
+        out = self.session.send_expect("stat -L -c '%%s %%Y' %s" %
+                                       self.base_image, "# ", verify=True)
+        if type(out) is int and out != 0:
+            return None
+        md5 = hashlib.md5()
+        md5.update("%s %s %s" % (self.base_image, out.strip(), self.stamp))
+        return md5.hexdigest()
+
+    def image_format(self, image):
+        out = self.session.send_expect("qemu-img info %s | "
+                                       "grep 'file format'" % image, "# ")
+        if ':' not in out:
+            return 'raw'
+        return out.split(':')[-1].strip()
+
+    def prepare(self):
+        """
+        Return path of golden image, build it when not found in cache.
+        Return None when golden image can't be prepared.
+        """
+        key = self.image_key()
+        if key is None:
+            self.logger.warning("Base image %s not found" % self.base_image)
+            return None
+
+        image = "%s/golden_%s.qcow2" % (VM_IMAGE_CACHE, key)
+        with image_lock(key):
+            out = self.session.send_expect("ls %s && touch %s" %
+                                           (image, image), "# ", verify=True)
+            if type(out) is not int or out == 0:
+                self.logger.info("Golden image %s found in cache" % image)
+                return image
+
+            if not self.build(image):
+                return None
+
+        self.prune()
+        return image
+
+    def create_overlay(self, backing, image):
+        """
+        Create qcow2 image backed by another image.
+        """
+        out = self.session.send_expect(
+            "rm -f %s && qemu-img create -f qcow2 -o "
+            "backing_file=%s,backing_fmt=%s %s" %
+            (image, backing, self.image_format(backing), image),
+            "# ", 60, verify=True)
+        return type(out) is not int or out == 0
+
+    def create_builder(self, image):
+        """
+        Create VM for building golden image, no device passed through.
+        """
+        builder = self.vm.__class__(self.host_dut, self.vm.vm_name,
+                                    self.vm.suite)
+        builder.host_session = self.vm.host_session
+        builder.host_logger = self.vm.host_logger
+        builder.vm_name = self.vm.vm_name + '_golden'
+        builder.golden_builder = True
+        builder.params = [copy.deepcopy(param) for param in self.vm.params
+                          if param.keys()[0] not in BUILDER_SKIP_OPTIONS]
+        builder.params.append({'disk': [{'file': image}]})
+        builder.set_vm_default()
+        return builder
+
+    def build(self, image):
+        self.logger.info("Build golden image %s of %s for %s" %
+                         (image, self.base_image, self.target))
+        tmp = image + '.tmp'
+        self.session.send_expect("mkdir -p %s" % VM_IMAGE_CACHE, "# ")
+        if not self.create_overlay(self.base_image, tmp):
+            self.logger.warning("Failed to create image %s" % tmp)
+            return False
+
+        builder = self.create_builder(tmp)
+        vm_dut = builder.start(load_config=False, set_target=True,
+                               auto_portmap=False)
+        if vm_dut is None:
+            self.logger.warning("Failed to set up DPDK in golden image")
+            self.session.send_expect("rm -f %s" % tmp, "# ")
+            return False
+
+        vm_dut.send_expect("echo %s > %s/%s && sync" %
+                           (self.stamp, vm_dut.base_dir, GOLDEN_STAMP_FILE),
+                           "# ", 60)
+        builder.stop()
+
+        # image can't be used as backing file before qemu exited
+        self.host_dut.wait_until(lambda: not builder.image_is_used(tmp), 60,
+                                 "golden image released")
+        out = self.session.send_expect("mv -f %s %s" % (tmp, image), "# ",
+                                       verify=True)
+        return type(out) is not int or out == 0
+
+    def prune(self):
+        """
+        Only keep latest used golden images.
+        """
+        self.session.send_expect("ls -t %s/golden_*.qcow2 | tail -n +%d | "
+                                 "xargs rm -f" %
+                                 (VM_IMAGE_CACHE, VM_IMAGE_CACHE_SIZE + 1),
+                                 "# ", 60)
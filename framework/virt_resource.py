@@ -29,13 +29,26 @@
 # THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import threading
+from functools import wraps
 from random import randint
 
-from utils import get_obj_funcs
+from utils import get_obj_funcs, parse_cpu_list
 
 INIT_FREE_PORT = 6060
 
 
+def synchronized(func):
+    """
+    Serialize resource operations, VMs may be started concurrently.
+    """
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
 class VirtResource(object):
 
     """
@@ -44,6 +57,7 @@ class VirtResource(object):
 
     def __init__(self, dut):
         self.dut = dut
+        self.lock = threading.RLock()
 
         self.cores = [int(core['thread']) for core in dut.cores]
         # initialized unused cores
@@ -67,6 +81,9 @@ class VirtResource(object):
         # save allocated cores and related vm
         self.allocated_info = {}
 
+        # kernel isolated cores, loaded when first used
+        self.isolated_cores = None
+
     def __port_used(self, pci):
         index = self.ports.index(pci)
         self.used_ports[index] = pci
@@ -132,6 +149,7 @@ class VirtResource(object):
         else:
             return False
 
+    @synchronized
     def reserve_cpu(self, coremask=''):
         """
         Reserve dpdk used cpus by mask
@@ -149,6 +167,7 @@ class VirtResource(object):
         for cpu in cpus:
             self.__core_used(cpu)
 
+    @synchronized
     def alloc_cpu(self, vm='', number=-1, socket=-1, corelist=None):
         """
         There're two options for request cpu resouce for vm.
@@ -207,12 +226,181 @@ class VirtResource(object):
             return False
         return True
 
+    @synchronized
     def free_cpu(self, vm):
         if self.__vm_has_resource(vm, 'cores'):
             for core in self.allocated_info[vm]['cores']:
                 self.__core_unused(core)
             self.allocated_info[vm].pop('cores')
+            self.allocated_info[vm].pop('placement', None)
+
+    def get_isolated_cores(self):
+        """
+        Return cores isolated from kernel scheduler by isolcpus.
+        """
+        if self.isolated_cores is None:
+            out = self.dut.send_expect(
+                "cat /sys/devices/system/cpu/isolated", "# ")
+            try:
+                self.isolated_cores = parse_cpu_list(out)
+            except ValueError:
+                self.isolated_cores = []
+        return self.isolated_cores
+
+    def __free_physical_cores(self, socket):
+        """
+        Return thread lists of physical cores on socket which have all
+        sibling threads unused, isolated cores are ahead.
+        """
+        siblings = {}
+        order = []
+        for dut_core in self.dut.cores:
+            if socket != -1 and int(dut_core['socket']) != socket:
+                continue
+            key = (int(dut_core['socket']), int(dut_core['core']))
+            if key not in siblings:
+                siblings[key] = []
+                order.append(key)
+            siblings[key].append(int(dut_core['thread']))
+
+        free_cores = [siblings[key] for key in order
+                      if not any(self.__core_isused(thread)
+                                 for thread in siblings[key])]
+
+        isolated = set(self.get_isolated_cores())
+        free_cores.sort(key=lambda threads: not set(threads) <= isolated)
+        return free_cores
+
+    def __place_cpu(self, number, socket, threads, emulator):
+        """
+        Choose vcpus and emulator threads on socket, return None when there's
+        not enough free physical cores.
+        """
+        free_cores = self.__free_physical_cores(socket)
+        required = (number + threads - 1) / threads
+        if len(free_cores) < required:
+            return None
+
+        vcpus = []
+        idle = []
+        for core_threads in free_cores[:required]:
+            vcpus += core_threads[:threads]
+            idle += core_threads[threads:]
+        idle += vcpus[number:]
+        vcpus = vcpus[:number]
+
+        # emulator threads prefer not isolated cores, otherwise share with
+        # idle sibling threads of vcpus
+        spare = []
+        for core_threads in reversed(free_cores[required:]):
+            spare += core_threads
+        spare += idle
+        if len(spare) < emulator:
+            return None
+        emulator_cpus = spare[:emulator]
+
+        # sibling threads of vcpus are reserved to keep them quiet
+        reserved = [cpu for cpu in idle if cpu not in emulator_cpus]
+        return vcpus, emulator_cpus, reserved
+
+    @synchronized
+    def alloc_numa_cpu(self, vm='', number=1, socket=-1, threads=1,
+                       emulator=1):
+        """
+        Allocate vcpus on free physical cores of socket, each physical core
+        serves threads vcpus and its other sibling threads are left idle.
+        Emulator threads are allocated separately on the same socket.
+        Cores on other sockets will be used when socket has not enough cores.
+        Return placement dictionary or None when failed.
+        """
+        if vm == '':
+            print "Alloc cpu request vitual machine name!!!"
+            return None
+
+        # if vm has been alloacted cores, just return them
+        if self.__vm_has_resource(vm, 'placement'):
+            return self.allocated_info[vm]['placement']
+
+        sockets = sorted(set(int(core['socket']) for core in self.dut.cores))
+        if socket in sockets:
+            sockets.remove(socket)
+            sockets.insert(0, socket)
+        # at last allow vcpus across sockets
+        sockets.append(-1)
+
+        for node in sockets:
+            cpus = self.__place_cpu(number, node, threads, emulator)
+            if cpus is not None:
+                break
+        else:
+            self.dut.logger.warning("Can't allocate %d vcpus for VM [%s]" %
+                                    (number, vm))
+            return None
+
+        if node != socket:
+            self.dut.logger.warning(
+                "Not enough cores on socket %d for VM [%s], "
+                "allocated on socket %d" % (socket, vm, node))
+
+        vcpus, emulator_cpus, reserved = cpus
+        cores = vcpus + emulator_cpus + reserved
+        for core in cores:
+            self.__core_used(core)
+
+        placement = {'numa': node,
+                     'vcpus': [str(core) for core in vcpus],
+                     'emulator': [str(core) for core in emulator_cpus],
+                     'reserved': [str(core) for core in reserved]}
+
+        if vm not in self.allocated_info:
+            self.allocated_info[vm] = {}
+
+        self.allocated_info[vm]['cores'] = [str(core) for core in cores]
+        self.allocated_info[vm]['placement'] = placement
+        return placement
+
+    def __pci_numa(self, pci):
+        for port in self.ports_info:
+            if port['pci'] == pci or port['pci'].endswith(':' + pci) or \
+                    pci.endswith(':' + port['pci']):
+                return port['numa']
+
+        for vf_info in self.vfs_info:
+            if vf_info['pci'] == pci:
+                return self.__pci_numa(vf_info['pf_pci'])
+
+        return -1
+
+    def get_pcis_numa(self, pcis=None):
+        """
+        Return numa node most of PF/VF devices located on, all ports will be
+        checked when no device specified. Return -1 when not known.
+        """
+        if not pcis:
+            pcis = self.ports
+
+        nodes = [int(self.__pci_numa(pci)) for pci in pcis]
+        nodes = [node for node in nodes if node != -1]
+        if not nodes:
+            return -1
 
+        return max(sorted(set(nodes)), key=nodes.count)
+
+    def get_free_hugepage_mem(self, numa):
+        """
+        Return free hugepage memory in MB on numa node.
+        """
+        page_size = self.dut.send_expect(
+            "awk '/Hugepagesize/ {print $2}' /proc/meminfo", "# ")
+        out = self.dut.send_expect(
+            "cat /sys/devices/system/node/node%d/hugepages/"
+            "hugepages-%skB/free_hugepages" % (numa, page_size), "# ")
+        try:
+            return int(out) * int(page_size) / 1024
+        except ValueError:
+            return 0
+
+    @synchronized
     def alloc_pf(self, vm='', number=-1, socket=-1, pflist=[]):
         """
         There're two options for request pf devices for vm.
@@ -246,12 +434,14 @@ class VirtResource(object):
         self.allocated_info[vm]['ports'] = ports
         return ports
 
+    @synchronized
     def free_pf(self, vm):
         if self.__vm_has_resource(vm, 'ports'):
             for pci in self.allocated_info[vm]['ports']:
                 self.__port_unused(pci)
             self.allocated_info[vm].pop('ports')
 
+    @synchronized
     def alloc_vf_from_pf(self, vm='', pf_pci='', number=-1, vflist=[]):
         """
         There're two options for request vf devices of pf device.
@@ -286,12 +476,14 @@ class VirtResource(object):
         self.allocated_info[vm]['vfs'] = vfs
         return vfs
 
+    @synchronized
     def free_vf(self, vm):
         if self.__vm_has_resource(vm, 'vfs'):
             for pci in self.allocated_info[vm]['vfs']:
                 self.__vf_unused(pci)
             self.allocated_info[vm].pop('vfs')
 
+    @synchronized
     def add_vf_on_pf(self, pf_pci='', vflist=[]):
         """
         Add vf devices generated by specified pf devices.
@@ -307,6 +499,7 @@ class VirtResource(object):
         self.used_vfs += used_vfs
         self.vfs += vfs
 
+    @synchronized
     def del_vf_on_pf(self, pf_pci='', vflist=[]):
         """
         Remove vf devices generated by specified pf devices.
@@ -327,6 +520,7 @@ class VirtResource(object):
             del self.used_vfs[index]
             del self.vfs[index]
 
+    @synchronized
     def alloc_port(self, vm=''):
         """
         Allocate unused host port for vm
@@ -339,8 +533,12 @@ class VirtResource(object):
         port_step = randint(1, 10)
         port = None
         count = 20
+        # port allocated to other vm may not be listened yet
+        allocated = [info['hostport'] for info in self.allocated_info.values()
+                     if 'hostport' in info]
         while True:
-            if self.dut.check_port_occupied(port_start) is False:
+            if port_start not in allocated and \
+                    self.dut.check_port_occupied(port_start) is False:
                 port = port_start
                 break
             count -= 1
@@ -355,10 +553,12 @@ class VirtResource(object):
         self.allocated_info[vm]['hostport'] = port
         return port
 
+    @synchronized
     def free_port(self, vm):
         if self.__vm_has_resource(vm, 'hostport'):
             self.allocated_info[vm].pop('hostport')
 
+    @synchronized
     def alloc_vnc_num(self, vm=''):
         """
         Allocate unused host VNC display number for VM.
@@ -368,6 +568,11 @@ class VirtResource(object):
             return None
 
         max_vnc_display_num = self.dut.get_maximal_vnc_num()
+        # display number allocated to other vm may not be used yet
+        for info in self.allocated_info.values():
+            if 'vnc_display_num' in info:
+                max_vnc_display_num = max(max_vnc_display_num,
+                                          info['vnc_display_num'])
         free_vnc_display_num = max_vnc_display_num + 1
 
         if vm not in self.allocated_info:
@@ -377,10 +582,12 @@ class VirtResource(object):
 
         return free_vnc_display_num
 
+    @synchronized
     def free_vnc_num(self, vm):
         if self.__vm_has_resource(vm, 'vnc_display_num'):
             self.allocated_info[vm].pop('vnc_display_num')
 
+    @synchronized
     def free_all_resource(self, vm):
         """
         Free all resource VM has been allocated.
@@ -402,6 +609,14 @@ class VirtResource(object):
             if "cores" in self.allocated_info[vm]:
                 return self.allocated_info[vm]['cores']
 
+    def get_placement_on_vm(self, vm=''):
+        """
+        Return numa placement of cpus on specifid VM.
+        """
+        if vm in self.allocated_info:
+            if 'placement' in self.allocated_info[vm]:
+                return self.allocated_info[vm]['placement']
+
     def get_vfs_on_vm(self, vm=''):
         """
         Return vf device list on specifid VM.
@@ -419,15 +634,29 @@ class VirtResource(object):
                 return self.allocated_info[vm]['ports']
 
 
+class simple_logger(object):
+
+    def warning(self, msg):
+        print msg
+
+    info = warning
+
+
 class simple_dut(object):
 
     def __init__(self):
         self.ports_info = []
         self.cores = []
+        self.logger = simple_logger()
 
     def check_port_occupied(self, port):
         return False
 
+    def send_expect(self, cmds, expected, *args, **kwargs):
+        if 'isolated' in cmds:
+            return '8-15'
+        return ''
+
 if __name__ == "__main__":
     dut = simple_dut()
     dut.cores = [{'thread': '1', 'socket': '0'}, {'thread': '2', 'socket': '0'},
@@ -492,3 +721,22 @@ if __name__ == "__main__":
     print virt_pool.get_pfs_on_vm("test1")
     print "Get vfs on VM-test2"
     print virt_pool.get_vfs_on_vm("test2")
+
+    # two sockets with four hyper-threading cores on each socket
+    dut = simple_dut()
+    dut.cores = [{'thread': str(thread), 'socket': str(thread / 4 % 2),
+                  'core': str(thread % 8)} for thread in range(16)]
+    dut.ports_info = [{'pci': '84:00.0', 'numa': 1}]
+    virt_pool = VirtResource(dut)
+    virt_pool.reserve_cpu('1')
+    numa = virt_pool.get_pcis_numa()
+    print "Alloc four vcpus on two physical cores of socket %d" % numa
+    print virt_pool.alloc_numa_cpu(vm="test4", number=4, socket=numa,
+                                   threads=2)
+    print "Alloc two vcpus on two physical cores of socket %d" % numa
+    print virt_pool.alloc_numa_cpu(vm="test5", number=2, socket=numa)
+    print "Alloc two vcpus when socket %d is full" % numa
+    print virt_pool.alloc_numa_cpu(vm="test6", number=2, socket=numa)
+    virt_pool.free_cpu("test5")
+    print "Unused cores after VM-test5 freed"
+    print virt_pool.unused_cores
@@ -30,6 +30,7 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import time
+import functools
 import utils
 
 from settings import CONFIG_ROOT_PATH, get_netdev
@@ -70,6 +71,8 @@ class VirtScene(object):
         self.vm_type = 'kvm'
         self.def_target = "x86_64-native-linuxapp-gcc"
         self.host_bound = False
+        # failure message of each VM which can't be started
+        self.vm_failures = {}
 
         # for vm dut init_log
         self.host_dut.test_classname = 'dts'
@@ -438,9 +441,27 @@ class VirtScene(object):
                 cpu_topo = param['cpu'][0]['cputopo']
                 return cpu_topo
 
+    def start_vm(self, vm, topo):
+        """
+        Boot one VM and set up DPDK environment in it.
+        """
+        vm.init_vm_host_session()
+        vm_dut = vm.start(load_config=False, set_target=False,
+                          auto_portmap=self.auto_portmap, cpu_topo=topo)
+        if vm_dut is None:
+            vm.close_vm_host_session()
+            raise Exception(vm.start_error or "Set up VM ENV failed!")
+        return vm_dut
+
     def start_vms(self):
+        """
+        Boot all VMs of the scene concurrently, VMs failed to start will be
+        saved in vm_failures.
+        """
         self.vms = []
+        self.vm_failures = {}
         if self.vm_type == 'kvm':
+            vms = []
             for vm_name in self.vm_confs.keys():
                 # tricky here, QEMUKvm based on suite and vm name
                 # suite is virt_global, vm_name just the type
@@ -455,20 +476,23 @@ class VirtScene(object):
                 self.merge_params(vm, scene_params)
                 # get cpu topo
                 topo = self.get_cputopo(scene_params)
-                try:
-                    vm_dut = vm.start(load_config=False, set_target=False,
-                                      auto_portmap=self.auto_portmap,
-                                      cpu_topo=topo)
-                    if vm_dut is None:
-                        raise Exception("Set up VM ENV failed!")
-
-                    vm_info = {}
-                    vm_info[vm_name] = vm
-                    vm_info[vm_name + '_session'] = vm_dut
-                    self.vms.append(vm_info)
-
-                except Exception as e:
-                    print utils.RED("Failure for %s" % str(e))
+                vms.append((vm, topo))
+
+            funcs = [functools.partial(self.start_vm, vm, topo)
+                     for vm, topo in vms]
+            results = utils.run_concurrently(funcs)
+
+            for (vm, _), (vm_dut, exc_info) in zip(vms, results):
+                if exc_info is not None:
+                    self.vm_failures[vm.vm_name] = str(exc_info[1])
+                    print utils.RED("Failure for %s: %s" %
+                                    (vm.vm_name, str(exc_info[1])))
+                    continue
+
+                vm_info = {}
+                vm_info[vm.vm_name] = vm
+                vm_info[vm.vm_name + '_session'] = vm_dut
+                self.vms.append(vm_info)
 
     def get_vm_duts(self):
         duts = []
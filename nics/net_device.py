@@ -86,6 +86,12 @@ class NetDevice(object):
         """
         return self.crb.send_expect(cmds, expected, timeout=timeout, alt_session=alt_session)
 
+    def __get_pci_detail(self):
+        """
+        Get bulk scanned information of this device from crb.
+        """
+        return self.crb.get_pci_dev_detail(self.pci)
+
     def __get_os_type(self):
         """
         Get OS type.
@@ -127,6 +133,10 @@ class NetDevice(object):
         return get_nic_socket(self.domain_id, self.bus_id, self.devfun_id)
 
     def get_nic_socket_linux(self, domain_id, bus_id, devfun_id):
+        detail = self.__get_pci_detail()
+        if detail is not None:
+            return detail['numa']
+
         command = ('cat /sys/bus/pci/devices/%s\:%s\:%s/numa_node' %
                    (domain_id, bus_id, devfun_id))
         try:
@@ -188,6 +198,10 @@ class NetDevice(object):
         """
         Get virtio device interface name by the default way on linux.
         """
+        detail = self.__get_pci_detail()
+        if detail is not None:
+            return '  '.join(detail['intfs']) or "No such file or directory"
+
         command = 'ls --color=never /sys/bus/pci/devices/%s\:%s\:%s/virtio*/net' % (
             domain_id, bus_id, devfun_id)
         return self.__send_expect(command, '# ')
@@ -196,6 +210,10 @@ class NetDevice(object):
         """
         Get the interface name by the default way on linux.
         """
+        detail = self.__get_pci_detail()
+        if detail is not None:
+            return '  '.join(detail['intfs']) or "No such file or directory"
+
         command = 'ls --color=never /sys/bus/pci/devices/%s\:%s\:%s/net' % (
             domain_id, bus_id, devfun_id)
         return self.__send_expect(command, '# ')
@@ -292,6 +310,10 @@ class NetDevice(object):
         """
         Get MAC by the default way on linux.
         """
+        detail = self.__get_pci_detail()
+        if detail is not None:
+            return detail['macs'].get(intf, "No such file or directory")
+
         command = ('cat /sys/bus/pci/devices/%s\:%s\:%s/net/%s/address' %
                    (domain_id, bus_id, devfun_id, intf))
         return self.__send_expect(command, '# ')
@@ -300,6 +322,10 @@ class NetDevice(object):
         """
         Get MAC by the default way on linux.
         """
+        detail = self.__get_pci_detail()
+        if detail is not None:
+            return detail['macs'].get(intf, "No such file or directory")
+
         virtio_cmd = ('ls /sys/bus/pci/devices/%s\:%s\:%s/ | grep --color=never virtio' %
                       (domain_id, bus_id, devfun_id))
         virtio = self.__send_expect(virtio_cmd, '# ')
@@ -577,6 +603,10 @@ class NetDevice(object):
         """
         Get all the VF PCIs of specified PF by the default way on linux.
         """
+        detail = self.__get_pci_detail()
+        if detail is not None:
+            return list(detail['vfs'])
+
         sriov_numvfs = self.__send_expect(
             "cat /sys/bus/pci/devices/%s\:%s\:%s/sriov_numvfs" %
             (domain_id, bus_id, devfun_id), "# ")
@@ -845,6 +875,10 @@ def get_pci_id(crb, domain_id, bus_id, devfun_id):
     """
     Return pci device type
     """
+    detail = crb.get_pci_dev_detail(':'.join((domain_id, bus_id, devfun_id)))
+    if detail is not None:
+        return detail['type']
+
     command = ('cat /sys/bus/pci/devices/%s\:%s\:%s/vendor' %
                (domain_id, bus_id, devfun_id))
     out = crb.send_expect(command, "# ")
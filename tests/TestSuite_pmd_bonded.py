@@ -79,6 +79,8 @@ LACP_MESSAGE_SIZE = 128
 
 class TestPmdBonded(TestCase):
 
+    required_ports = 4
+
     def get_stats(self, portid, rx_tx):
         """
         Get packets number from port statistic
@@ -491,7 +493,9 @@ UDP(sport=srcport, dport=destport)/Raw(load="\x50"*%s)], iface="%s", count=%d)'
         Start a port which the testpmd can see.
         """
         self.__send_expect("port start %s" % str(port), "testpmd> ")
-        time.sleep(3)
+        ports = self.dut_ports if port == "all" else [int(port)]
+        for port_id in ports:
+            self.pmdout.wait_link_status(port_id, "up", 3)
 
     def add_slave_to_bonding_device(self, bond_port, invert_verify=False, *slave_port):
         """
@@ -838,7 +842,7 @@ UDP(sport=srcport, dport=destport)/Raw(load="\x50"*%s)], iface="%s", count=%d)'
         self.set_mode_for_bonding_device(bond_port_0, mode_set)
 
         self.add_slave_to_bonding_device(bond_port_0, False, self.dut_ports[2])
-        time.sleep(5)
+        self.pmdout.wait_link_status(self.dut_ports[2], "up", 5)
         self.set_primary_for_bonding_device(bond_port_0, self.dut_ports[2])
 
         self.remove_slave_from_bonding_device(bond_port_0, False, self.dut_ports[2])
@@ -1053,7 +1057,10 @@ UDP(sport=srcport, dport=destport)/Raw(load="\x50"*%s)], iface="%s", count=%d)'
         else:
             eth = self.tester.get_interface(local_port)
             self.tester.admin_ports_linux(eth, status)
-        time.sleep(5)
+        # wait for the peer port on DUT detecting the link change
+        for dut_port in self.dut_ports:
+            if self.tester.get_local_port(dut_port) == local_port:
+                self.pmdout.wait_link_status(dut_port, status, 5)
 
     def verify_round_robin_rx(self, unbound_port, bond_port, **slaves):
         """
@@ -1174,12 +1181,17 @@ UDP(sport=srcport, dport=destport)/Raw(load="\x50"*%s)], iface="%s", count=%d)'
         else:
             bond_stat = 'rx'
 
-        pkt_now[unbound_port] = [int(_) for _ in self.get_stats(unbound_port, rx_tx)]
-        pkt_now[bond_port] = [int(_) for _ in self.get_stats(bond_port, bond_stat)]
+        # statistics of all ports by one command
+        all_stats = self.pmdout.get_all_pmd_stats()
+        stat_keys = {'rx': ['RX-packets', 'RX-missed', 'RX-bytes'],
+                     'tx': ['TX-packets', 'TX-errors', 'TX-bytes']}
+
+        pkt_now[unbound_port] = [all_stats[unbound_port][key] for key in stat_keys[rx_tx]]
+        pkt_now[bond_port] = [all_stats[bond_port][key] for key in stat_keys[bond_stat]]
         for slave in slaves['active']:
-            pkt_now[slave] = [int(_) for _ in self.get_stats(slave, bond_stat)]
+            pkt_now[slave] = [all_stats[slave][key] for key in stat_keys[bond_stat]]
         for slave in slaves['inactive']:
-            pkt_now[slave] = [int(_) for _ in self.get_stats(slave, bond_stat)]
+            pkt_now[slave] = [all_stats[slave][key] for key in stat_keys[bond_stat]]
 
         return pkt_now
 
@@ -1245,7 +1257,7 @@ UDP(sport=srcport, dport=destport)/Raw(load="\x50"*%s)], iface="%s", count=%d)'
         self.dut.send_expect("set portlist %d,%d" % (self.dut_ports[3], bond_port), "testpmd> ")
         self.start_all_ports()
         self.dut.send_expect("start", "testpmd> ")
-        time.sleep(5)
+        self.pmdout.wait_link_status(bond_port, "up", 5)
 
         slaves = {}
         slaves['active'] = [self.dut_ports[0], self.dut_ports[1], self.dut_ports[2]]
@@ -1264,7 +1276,7 @@ UDP(sport=srcport, dport=destport)/Raw(load="\x50"*%s)], iface="%s", count=%d)'
         self.start_all_ports()
         self.dut.send_expect("start", "testpmd> ")
         self.set_primary_for_bonding_device(bond_port, self.dut_ports[1])
-        time.sleep(5)
+        self.pmdout.wait_link_status(bond_port, "up", 5)
 
         slaves = {}
         slaves['active'] = [self.dut_ports[1], self.dut_ports[0], self.dut_ports[2]]
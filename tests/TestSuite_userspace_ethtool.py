@@ -43,7 +43,6 @@ from packet import Packet, sniff_packets, load_sniff_packets
 import random
 from etgen import IxiaPacketGenerator
 from settings import HEADER_SIZE
-from settings import SCAPY2IXIA
 from utils import RED
 
 
@@ -650,14 +649,7 @@ class TestUserspaceEthtool(TestCase, IxiaPacketGenerator):
         self.add_tcl_cmd("stream config -numFrames %d" % self.n_pkts)
         self.add_tcl_cmd("stream config -dma advance")
 
-        pat = re.compile(r"(\w+)\((.*)\)")
-        for header in flows[0].split('/'):
-            match = pat.match(header)
-            params = eval('dict(%s)' % match.group(2))
-            method_name = match.group(1)
-            if method_name in SCAPY2IXIA:
-                method = getattr(self, method_name.lower())
-                method(txport, **params)
+        self.config_flow(txport, flows[0])
 
         # stream id start from 1
         self.add_tcl_cmd("stream set %d %d %d %d" % (self.chasId, txport['card'], txport['port'], 1))
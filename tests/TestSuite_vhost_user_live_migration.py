@@ -1,11 +1,21 @@
 # <COPYRIGHT_TAG>
 
+import os
 import re
 import time
+import threading
 
 from qemu_kvm import QEMUKvm
 from test_case import TestCase
 from exception import VirtDutInitException
+from migration import MigrationController
+
+# packets sent to each tester port in one burst of switchover traffic
+SWITCHOVER_BURST = 200
+# interval between packets of switchover traffic in seconds
+SWITCHOVER_INTER = 0.005
+# migration parameters, empty means qemu default
+MIGRATION_PARAMS = {}
 
 
 class TestVhostUserLiveMigration(TestCase):
@@ -41,6 +51,10 @@ class TestVhostUserLiveMigration(TestCase):
         # flag for environment
         self.env_done = False
 
+        # migration metrics appended as json lines for trending
+        self.metrics_file = os.path.join(self.logger.log_path,
+                                         'vhost_user_live_migration.json')
+
     def set_up(self):
         self.setup_vm_env()
         pass
@@ -211,6 +225,90 @@ class TestVhostUserLiveMigration(TestCase):
         self.logger.info("Verified %s packets recevied" % num_received)
         self.verify(num_received >= num_pkts, "Not receive packets as expected!!!")
 
+    def start_switchover_traffic(self):
+        """
+        Send packets to virtIO from host and backup tester ports at the same
+        rate until stopped. VM only receives packets from the host it runs on,
+        so packets lost during switchover are those not received.
+        """
+        sendp_fmt = "sendp([Ether(dst='%s')/IP()/UDP()/Raw('x'*18)], " \
+                    "iface='%s', count=%d, inter=%s, verbose=False)"
+        host_cmd = sendp_fmt % (self.virio_mac, self.host_tintf,
+                                SWITCHOVER_BURST, SWITCHOVER_INTER)
+        backup_cmd = sendp_fmt % (self.virio_mac, self.backup_tintf,
+                                  SWITCHOVER_BURST, SWITCHOVER_INTER)
+        cmds = ["import threading",
+                "backup_send = threading.Thread(target=lambda: %s)" % backup_cmd,
+                "backup_send.start()",
+                host_cmd,
+                "backup_send.join()"]
+
+        self.traffic_sent = 0
+        self.traffic_stop = threading.Event()
+
+        def send_bursts():
+            while not self.traffic_stop.is_set():
+                self.tester.scapy_worker_execute(cmds)
+                self.traffic_sent += SWITCHOVER_BURST
+
+        self.traffic_thread = threading.Thread(target=send_bursts)
+        self.traffic_thread.start()
+
+    def stop_switchover_traffic(self):
+        """
+        Stop switchover traffic after current burst, return packets sent to
+        each tester port.
+        """
+        self.traffic_stop.set()
+        self.traffic_thread.join()
+        return self.traffic_sent
+
+    def start_migration(self):
+        """
+        Start live migration by controller when QMP available, otherwise by
+        monitor of host VM. Return controller or None.
+        """
+        if self.host_vm.qmp_client is None:
+            ret = self.host_vm.start_migration(self.backup_dutip,
+                                               self.backup_vm.migrate_port)
+            self.verify(ret, "Failed to migration, please check VM and qemu version")
+            return None
+
+        migration = MigrationController(self.host_vm, self.backup_vm)
+        migration.set_parameters(**MIGRATION_PARAMS)
+        migration.start(self.backup_dutip, self.backup_vm.migrate_port)
+        return migration
+
+    def wait_migration(self, migration):
+        """
+        Wait live migration done, return status of migration.
+        """
+        if migration is None:
+            # exception raised when not finished
+            self.host_vm.wait_migration_done()
+            return 'completed'
+
+        return migration.wait()['status']
+
+    def report_migration(self, migration):
+        """
+        Print migration metrics and save them for trending.
+        """
+        if migration is None:
+            self.logger.warning("QMP not available, migration metrics not measured")
+            return
+
+        result = migration.result
+        header = ['Status', 'Total(ms)', 'Downtime(ms)', 'Transferred(B)',
+                  'Dirty pages rate', 'Passes', 'Packets lost']
+        self.result_table_create(header)
+        self.result_table_add([result['status'], result['total_time'],
+                               result['downtime'], result['transferred'],
+                               result['dirty_pages_rate'], result['passes'],
+                               result['packets_lost']])
+        self.result_table_print()
+        migration.save(self.metrics_file)
+
     def verify_kernel(self, tester_port, vm_dut):
         """
         Function to verify packets received by virtIO
@@ -247,15 +345,16 @@ class TestVhostUserLiveMigration(TestCase):
 
         self.logger.info("Migrate host VM to backup host")
         # start live migration
-        ret = self.host_vm.start_migration(self.backup_dutip, self.backup_vm.migrate_port)
-        self.verify(ret, "Failed to migration, please check VM and qemu version")
+        migration = self.start_migration()
 
         # make sure still can receive packets in migration process
         self.verify_kernel(self.host_tport, self.vm_host)
 
         self.logger.info("Waiting migration process done")
         # wait live migration done
-        self.host_vm.wait_migration_done()
+        status = self.wait_migration(migration)
+        self.report_migration(migration)
+        self.verify(status == 'completed', "Migration %s" % status)
 
         # check vhost testpmd log after migration
         out = self.duts[0].get_session_output(timeout=1)
@@ -283,17 +382,20 @@ class TestVhostUserLiveMigration(TestCase):
         self.verify_dpdk(self.host_tport, self.host_serial)
 
         self.logger.info("Migrate host VM to backup host")
-        # start live migration
-        
-        ret = self.host_vm.start_migration(self.backup_dutip, self.backup_vm.migrate_port)
-        self.verify(ret, "Failed to migration, please check VM and qemu version")
-       
-        # make sure still can receive packets in migration process
-        self.verify_dpdk(self.host_tport, self.host_serial)
+        # count packets received during migration from now on
+        self.host_serial.send_expect("clear port stats all", "testpmd> ")
+        self.start_switchover_traffic()
 
-        self.logger.info("Waiting migration process done")
-        # wait live migration done
-        self.host_vm.wait_migration_done()
+        try:
+            # start live migration
+            migration = self.start_migration()
+
+            self.logger.info("Waiting migration process done")
+            # wait live migration done
+            status = self.wait_migration(migration)
+        finally:
+            sent = self.stop_switchover_traffic()
+        self.verify(status == 'completed', "Migration %s" % status)
 
         # check vhost testpmd log after migration
         out = self.duts[0].get_session_output(timeout=1)
@@ -309,6 +411,20 @@ class TestVhostUserLiveMigration(TestCase):
         if self.backup_serial is None:
             raise Exception("Connect backup host serial port failed!")
 
+        # statistics of testpmd migrated with VM
+        out = self.backup_serial.send_expect("show port stats 0", "testpmd> ")
+        m = re.search("RX-packets: (\d+)", out)
+        received = int(m.group(1)) if m else 0
+        if migration is not None:
+            migration.record_traffic(sent, received)
+        else:
+            self.logger.info("%d of %d packets lost during migration" %
+                             (max(sent - received, 0), sent))
+        self.report_migration(migration)
+
+        # make sure still can receive packets in migration process
+        self.verify(received > 0, "Not receive packets in migration process!!!")
+
         self.verify_dpdk(self.backup_tport, self.backup_serial)
 
         # quit testpmd